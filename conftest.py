@@ -19,6 +19,53 @@ from djtools.collection.rekordbox_collection import RekordboxCollection
 from djtools.collection.rekordbox_track import RekordboxTrack
 
 
+@pytest.fixture(autouse=True)
+def collection_cache_dir(tmp_path):
+    """Keeps the cache of downloaded collections in a temporary directory."""
+    with mock.patch(
+        "djtools.sync.collection_storage.COLLECTION_CACHE_DIR",
+        tmp_path / "collections",
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def config_snapshot_path(tmp_path):
+    """Keeps the config snapshot in a temporary directory."""
+    with mock.patch(
+        "djtools.configs.snapshot.CONFIG_SNAPSHOT_PATH",
+        tmp_path / "config_snapshot.json",
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def manifest_path(tmp_path):
+    """Keeps the Beatcloud manifest in a temporary directory."""
+    with mock.patch(
+        "djtools.sync.manifest.MANIFEST_PATH", tmp_path / "manifest.db"
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def match_cache_path(tmp_path):
+    """Keeps the match cache in a temporary directory."""
+    with mock.patch(
+        "djtools.utils.helpers.MATCH_CACHE_PATH", tmp_path / "match_cache.db"
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def scan_cache_path(tmp_path):
+    """Keeps the scan cache in a temporary directory."""
+    with mock.patch(
+        "djtools.sync.scan_cache.SCAN_CACHE_PATH", tmp_path / "scan_cache.db"
+    ):
+        yield
+
+
 @pytest.fixture
 def namespace():
     """Test Namespace object fixture."""
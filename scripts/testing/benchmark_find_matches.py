@@ -0,0 +1,81 @@
+"""Script for comparing the candidate index against scoring every pair of
+tracks when fuzzy matching tracks with the Beatcloud, and for measuring
+find_matches, which scores chunks of tracks in worker processes."""
+
+# pylint: disable=import-error
+import random
+import string
+import time
+
+from fuzzywuzzy import fuzz
+
+from djtools.utils.candidate_index import CandidateIndex
+from djtools.utils.config import UtilsConfig
+from djtools.utils.helpers import find_matches
+
+
+BEATCLOUD_TRACKS = 10000
+QUERIES = 200
+THRESHOLD = 80
+
+
+def make_name(rng: random.Random, words: list) -> str:
+    """Makes a random "TRACK TITLE - ARTIST NAME"."""
+    title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+    artist = " ".join(rng.choice(words) for _ in range(rng.randint(1, 2)))
+
+    return f"{title} - {artist}"
+
+
+if __name__ == "__main__":
+    RNG = random.Random(0)
+    WORDS = [
+        "".join(
+            RNG.choice(string.ascii_lowercase)
+            for _ in range(RNG.randint(3, 9))
+        )
+        for _ in range(5000)
+    ]
+    TRACKS = [make_name(RNG, WORDS) for _ in range(BEATCLOUD_TRACKS)]
+    QUERY_TRACKS = [RNG.choice(TRACKS) for _ in range(QUERIES // 2)] + [
+        make_name(RNG, WORDS) for _ in range(QUERIES - QUERIES // 2)
+    ]
+
+    start = time.perf_counter()
+    expected = {
+        (query, track)
+        for query in QUERY_TRACKS
+        for track in TRACKS
+        if fuzz.ratio(query, track) >= THRESHOLD
+    }
+    print(f"every pair: {time.perf_counter() - start:.2f} seconds")
+
+    start = time.perf_counter()
+    INDEX = CandidateIndex(TRACKS)
+    print(f"index build: {time.perf_counter() - start:.2f} seconds")
+    start = time.perf_counter()
+    CANDIDATES = 0
+    found = set()
+    for query in QUERY_TRACKS:
+        candidates = INDEX.get_candidates(query, THRESHOLD)
+        CANDIDATES += len(candidates)
+        found.update(
+            (query, track)
+            for track in candidates
+            if fuzz.ratio(query, track) >= THRESHOLD
+        )
+    print(
+        f"index: {time.perf_counter() - start:.2f} seconds, "
+        f"{CANDIDATES / QUERIES:.1f} candidates per query"
+    )
+    assert found == expected, "The index missed matches"
+
+    start = time.perf_counter()
+    matches = find_matches(
+        {"playlist": QUERY_TRACKS},
+        TRACKS,
+        UtilsConfig(CHECK_TRACKS_FUZZ_RATIO=THRESHOLD),
+    )
+    print(f"find_matches: {time.perf_counter() - start:.2f} seconds")
+    # Tracks matching a Beatcloud track exactly aren't scored against others.
+    assert {match[1:3] for match in matches} <= expected
@@ -0,0 +1,24 @@
+"""Script for measuring the time it takes to start djtools."""
+
+# pylint: disable=import-error
+import subprocess
+import sys
+import time
+
+
+RUNS = 10
+STATEMENTS = {
+    "import djtools": "import djtools",
+    "build_config": "from djtools.configs import build_config",
+    "sync operations": "import djtools.sync.sync_operations",
+}
+
+
+if __name__ == "__main__":
+    for name, statement in STATEMENTS.items():
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", statement], check=True)
+            timings.append(time.perf_counter() - start)
+        print(f"{name}: {min(timings) * 1000:.0f} ms")
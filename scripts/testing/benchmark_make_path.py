@@ -0,0 +1,36 @@
+"""Script for measuring the overhead of the make_path decorator."""
+
+# pylint: disable=import-error
+from pathlib import Path
+import timeit
+
+from djtools.utils.helpers import make_path
+
+
+CALLS = 100000
+
+
+def set_location(track: dict, path: Path):
+    """Undecorated stand-in for RekordboxTrack.set_location."""
+    track["Location"] = path
+
+
+decorated_set_location = make_path(set_location)
+
+
+if __name__ == "__main__":
+    TRACK = {}
+    PATH = Path("/Volumes/usb/DJ Music/track.mp3")
+    for name, function, location in [
+        ("undecorated", set_location, PATH),
+        ("decorated (Path)", decorated_set_location, PATH),
+        ("decorated (str)", decorated_set_location, PATH.as_posix()),
+    ]:
+        seconds = min(
+            timeit.repeat(
+                lambda: function(TRACK, location),  # pylint: disable=W0640
+                number=CALLS,
+                repeat=5,
+            )
+        )
+        print(f"{name}: {seconds / CALLS * 1e9:.0f} ns per call")
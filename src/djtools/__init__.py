@@ -3,49 +3,26 @@
 The logger is initialized from a configuration file. Then `config.yaml` is read
 (if it exists) and the individual packages' configuration objects are
 instantiated. The optional C extension to accelerate edit distance computation,
-Levenshtein, is imported. The loop iterates all the supported top-level
-operations of the library and calls the corresponding function with the
-appropriate configuration object. Finally, the log file generated from this run
-is uploaded to the Beatcloud.
+Levenshtein, is looked up. The configured top-level operations of the
+library are then run with the configuration object, concurrently where they
+don't use the same resources, sharing resources like the parsed collection and
+API clients between them. Finally, the log file generated from this run is
+uploaded to the Beatcloud.
 """
 
-from .configs import build_config
-from .collection import (
-    COLLECTION_OPERATIONS,
-    collection_playlists,
-    copy_playlists,
-    RekordboxCollection,
-    RekordboxPlaylist,
-    RekordboxTrack,
-    shuffle_playlists,
-)
-from .spotify import (
-    SPOTIFY_OPERATIONS,
-    spotify_playlist_from_upload,
-    spotify_playlists,
-)
-from .sync import (
-    SYNC_OPERATIONS,
-    download_collection,
-    download_music,
-    upload_collection,
-    upload_music,
-)
-from .sync.helpers import upload_log
-from .utils import (
-    UTILS_OPERATIONS,
-    compare_tracks,
-    normalize,
-    process,
-    url_download,
-)
-from .utils.helpers import initialize_logger
+from .collection import COLLECTION_OPERATIONS
+from .spotify import SPOTIFY_OPERATIONS
+from .sync import SYNC_OPERATIONS
+from .utils import UTILS_OPERATIONS
+from .utils.lazy import lazy_exports
 from .version import get_version
 
 
 __version__ = get_version()
 
 
+# The names in __all__ are imported on first access by __getattr__.
+# pylint: disable=undefined-all-variable
 __all__ = (
     "build_config",
     "collection_playlists",
@@ -66,33 +43,68 @@ __all__ = (
     "url_download",
 )
 
+__getattr__ = lazy_exports(
+    __name__,
+    {
+        "build_config": "djtools.configs",
+        "collection_playlists": "djtools.collection",
+        "compare_tracks": "djtools.utils",
+        "copy_playlists": "djtools.collection",
+        "download_collection": "djtools.sync",
+        "download_music": "djtools.sync",
+        "normalize": "djtools.utils",
+        "process": "djtools.utils",
+        "RekordboxCollection": "djtools.collection",
+        "RekordboxPlaylist": "djtools.collection",
+        "RekordboxTrack": "djtools.collection",
+        "shuffle_playlists": "djtools.collection",
+        "spotify_playlist_from_upload": "djtools.spotify",
+        "spotify_playlists": "djtools.spotify",
+        "upload_collection": "djtools.sync",
+        "upload_music": "djtools.sync",
+        "url_download": "djtools.utils",
+    },
+)
+
 
 def main():
     """This is the entry point for the DJ Tools library."""
+    from djtools.configs import build_config
+    from djtools.sync.helpers import upload_log
+    from djtools.utils.helpers import initialize_logger
+    from djtools.utils.run_context import run_context
+    from djtools.utils.scheduler import run_operations
 
     # Test ci
     logger, log_file = initialize_logger()
-    config = build_config()
-    logger.setLevel(config.LOG_LEVEL)
 
-    # Run "collection", "spotify", "sync", and "utils" package operations if
-    # any of the flags to do so are present in the config.
-    beatcloud_cache = []
-    for package in [
-        COLLECTION_OPERATIONS,
-        SPOTIFY_OPERATIONS,
-        UTILS_OPERATIONS,
-        SYNC_OPERATIONS,
-    ]:
-        for operation, func in package.items():
-            if not getattr(config, operation):
-                continue
-            logger.info(f"{operation}")
-            if operation in ["CHECK_TRACKS", "DOWNLOAD_MUSIC"]:
-                beatcloud_cache = func(  # pylint: disable=assignment-from-none,unexpected-keyword-arg
-                    config, beatcloud_tracks=beatcloud_cache
-                )
-            else:
-                func(config)
+    # Resources like the collection and API clients are shared by all the
+    # operations of this run.
+    with run_context() as context:
+        config = build_config(cli=True)
+        logger.setLevel(config.LOG_LEVEL)
+
+        # Run "collection", "spotify", "sync", and "utils" package operations
+        # if any of the flags to do so are present in the config.
+        run_operations(
+            {
+                operation: func
+                for package in [
+                    COLLECTION_OPERATIONS,
+                    SPOTIFY_OPERATIONS,
+                    UTILS_OPERATIONS,
+                    SYNC_OPERATIONS,
+                ]
+                for operation, func in package.items()
+                if getattr(config, operation)
+            },
+            config,
+        )
+
+        context.flush()
+        upload_log(config, log_file)
+
+        if config.WATCH:
+            from djtools.utils.watch import watch
 
-    upload_log(config, log_file)
+            watch(config)
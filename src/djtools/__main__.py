@@ -32,13 +32,14 @@ Sync operations:
     * UPLOAD_COLLECTION: Sync COLLECTION_PATH to USER's collection folder.
 """
 
+from importlib.util import find_spec
 import logging
 
 from djtools import main
 
-try:
-    import Levenshtein  # pylint: disable=unused-import
-except ImportError:
+# Levenshtein is only looked up, rather than imported, so that runs which don't
+# compute track similarity don't pay for importing it.
+if find_spec("Levenshtein") is None:
     logger = logging.getLogger(__name__)
     logger.warning(
         "NOTE: Track similarity can be made faster by running "
@@ -22,21 +22,46 @@
     * `tracks`: abstractions and implementations for tracks
 """
 
-from djtools.collection.copy_playlists import copy_playlists
-from djtools.collection.playlist_builder import collection_playlists
-from djtools.collection.rekordbox_collection import RekordboxCollection
-from djtools.collection.rekordbox_playlist import RekordboxPlaylist
-from djtools.collection.rekordbox_track import RekordboxTrack
-from djtools.collection.shuffle_playlists import shuffle_playlists
+from djtools.utils.lazy import lazy_exports, LazyOperation
 
 
 COLLECTION_OPERATIONS = {
-    "COLLECTION_PLAYLISTS": collection_playlists,
-    "COPY_PLAYLISTS": copy_playlists,
-    "SHUFFLE_PLAYLISTS": shuffle_playlists,
+    "COLLECTION_PLAYLISTS": LazyOperation(
+        "djtools.collection.playlist_builder",
+        "collection_playlists",
+        reads=("collection",),
+        writes=("collection",),
+    ),
+    "COPY_PLAYLISTS": LazyOperation(
+        "djtools.collection.copy_playlists",
+        "copy_playlists",
+        reads=("collection",),
+        # COPY_PLAYLISTS_DESTINATION is usually the USB drive.
+        writes=("local", "usb"),
+    ),
+    "SHUFFLE_PLAYLISTS": LazyOperation(
+        "djtools.collection.shuffle_playlists",
+        "shuffle_playlists",
+        reads=("collection",),
+        writes=("collection", "usb"),
+    ),
 }
 
+__getattr__ = lazy_exports(
+    __name__,
+    {
+        "collection_playlists": "djtools.collection.playlist_builder",
+        "copy_playlists": "djtools.collection.copy_playlists",
+        "RekordboxCollection": "djtools.collection.rekordbox_collection",
+        "RekordboxPlaylist": "djtools.collection.rekordbox_playlist",
+        "RekordboxTrack": "djtools.collection.rekordbox_track",
+        "shuffle_playlists": "djtools.collection.shuffle_playlists",
+    },
+)
+
 
+# The names in __all__ are imported on first access by __getattr__.
+# pylint: disable=undefined-all-variable
 __all__ = (
     "collection_playlists",
     "copy_playlists",
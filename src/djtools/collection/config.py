@@ -11,13 +11,20 @@ from typing import List, Optional, Union
 from typing_extensions import Literal
 
 import yaml
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, PositiveInt, ValidationError
 
 from djtools.configs.config import BaseConfig
 
 
 logger = logging.getLogger(__name__)
+PLAYLIST_CONFIG_PATH = (
+    Path(__file__).parent.parent / "configs" / "collection_playlists.yaml"
+)
+PLAYLIST_TEMPLATE_PATH = (
+    PLAYLIST_CONFIG_PATH.parent
+    / "playlist_templates"
+    / "collection_playlists.j2"
+)
 
 
 class CollectionConfig(BaseConfig):
@@ -36,8 +43,12 @@ class CollectionConfig(BaseConfig):
     COLLECTION_PLAYLISTS_REMAINDER: Literal["folder", "playlist"] = "folder"
     COPY_PLAYLISTS: List[str] = []
     COPY_PLAYLISTS_DESTINATION: Optional[Path] = None
+    COPY_PLAYLISTS_MIRROR: bool = False
+    COPY_PLAYLISTS_WORKERS_PER_DEVICE: PositiveInt = 2
     PLATFORM: Literal["rekordbox"] = "rekordbox"
     SHUFFLE_PLAYLISTS: List[str] = []
+    SHUFFLE_PLAYLISTS_IN_PLACE: bool = False
+    SHUFFLE_PLAYLISTS_WRITE_TAGS: bool = False
     playlist_config: Optional[PlaylistConfig] = None
 
     def __init__(self, *args, **kwargs):
@@ -50,6 +61,7 @@ class CollectionConfig(BaseConfig):
                 template.
             RuntimeError: COLLECTION_PATH must be a valid collection path.
             RuntimeError: collection_playlists.yaml must be a valid YAML file.
+            RuntimeError: SHUFFLE_PLAYLISTS_WRITE_TAGS requires mutagen.
         """
         super().__init__(*args, **kwargs)
 
@@ -65,14 +77,26 @@ class CollectionConfig(BaseConfig):
                 "COLLECTION_PATH to be a valid collection path"
             )
 
-        if self.COLLECTION_PLAYLISTS:
-            config_path = Path(__file__).parent.parent / "configs"
+        if self.SHUFFLE_PLAYLISTS_WRITE_TAGS:
+            try:
+                import mutagen  # pylint: disable=unused-import
+            except ImportError as exc:
+                raise RuntimeError(
+                    "Using the SHUFFLE_PLAYLISTS_WRITE_TAGS feature requires "
+                    'mutagen: `pip install "djtools[tags]"`'
+                ) from exc
+
+        # A playlist config loaded from the config snapshot was already
+        # rendered and parsed from the same templates.
+        if self.COLLECTION_PLAYLISTS and self.playlist_config is None:
+            from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
             env = Environment(
-                loader=FileSystemLoader(config_path / "playlist_templates")
+                loader=FileSystemLoader(PLAYLIST_TEMPLATE_PATH.parent)
             )
             playlist_template = None
-            playlist_template_name = "collection_playlists.j2"
-            playlist_config_path = config_path / "collection_playlists.yaml"
+            playlist_template_name = PLAYLIST_TEMPLATE_PATH.name
+            playlist_config_path = PLAYLIST_CONFIG_PATH
 
             try:
                 playlist_template = env.get_template(playlist_template_name)
@@ -6,22 +6,40 @@ The purpose of this utility is to:
 
 * backup subsets of your library
 * ensure you have easy access to a preparation independent of the setup
+
+When "COPY_PLAYLISTS_MIRROR" is set, the destination is kept as an exact mirror
+of the playlists. A manifest of the copied files is kept in
+"COPY_PLAYLISTS_DESTINATION" so that re-running only copies tracks that were
+added or changed and deletes tracks that are no longer in the playlists.
 """
 
 # pylint: disable=duplicate-code
 from collections import defaultdict
-from concurrent.futures import as_completed, ThreadPoolExecutor
-import os
+import logging
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 from tqdm import tqdm
 
-from djtools.collection.helpers import copy_file, PLATFORM_REGISTRY
+from djtools.collection.base_track import Track
+from djtools.collection.helpers import (
+    build_copy_plan,
+    copy_file,
+    load_collection,
+    load_copy_manifest,
+    mirror_file,
+    schedule_copies,
+    write_copy_manifest,
+)
 from djtools.configs.config import BaseConfig
 from djtools.utils.helpers import make_path
 
 
+logger = logging.getLogger(__name__)
+# Number of copies to complete between writes of the copy manifest.
+MANIFEST_FLUSH_INTERVAL = 100
+
+
 @make_path
 def copy_playlists(config: BaseConfig, path: Optional[Path] = None):
     """Copies tracks from provided playlists to a destination.
@@ -37,9 +55,7 @@ def copy_playlists(config: BaseConfig, path: Optional[Path] = None):
             "COLLECTION_PATH".
     """
     # Load collection.
-    collection = PLATFORM_REGISTRY[config.PLATFORM]["collection"](
-        path=config.COLLECTION_PATH
-    )
+    collection = load_collection(config, shared=False)
 
     # Create destination directory.
     config.COPY_PLAYLISTS_DESTINATION.mkdir(parents=True, exist_ok=True)
@@ -81,20 +97,26 @@ def copy_playlists(config: BaseConfig, path: Optional[Path] = None):
             parent.remove_playlist(child)
 
     # Copy tracks to the destination and update their location.
-    payload = zip(
-        playlist_tracks.values(),
-        [config.COPY_PLAYLISTS_DESTINATION] * len(playlist_tracks),
-    )
-
-    with ThreadPoolExecutor(
-        max_workers=os.cpu_count() * 4  # pylint: disable=no-member
-    ) as executor:
-        futures = [executor.submit(copy_file, *args) for args in payload]
-
-        with tqdm(total=len(futures), desc="Copying tracks") as pbar:
-            for future in as_completed(futures):
-                _ = future.result()
-                pbar.update(1)
+    if config.COPY_PLAYLISTS_MIRROR:
+        mirror_tracks(
+            playlist_tracks,
+            config.COPY_PLAYLISTS_DESTINATION,
+            config.COPY_PLAYLISTS_WORKERS_PER_DEVICE,
+        )
+    else:
+        copies = {}
+        for track in playlist_tracks.values():
+            source = track.get_location()
+            dest = config.COPY_PLAYLISTS_DESTINATION / source.name
+            track.set_location(dest)
+            if not dest.exists():
+                copies.setdefault(dest, source)
+        for _ in schedule_copies(
+            [(source, dest) for dest, source in copies.items()],
+            copy_file,
+            config.COPY_PLAYLISTS_WORKERS_PER_DEVICE,
+        ):
+            pass
 
     # Unless specified, write the output collection to the same directory that
     # the files are being copied to.
@@ -106,3 +128,66 @@ def copy_playlists(config: BaseConfig, path: Optional[Path] = None):
 
     # Serialize the new collection.
     _ = collection.serialize(path=path)
+
+
+@make_path
+def mirror_tracks(
+    tracks: Dict[str, Track], destination: Path, workers_per_device: int
+):
+    """Mirrors the audio files of tracks to a destination.
+
+    Only the tracks that are missing from, or have changed since they were
+    copied to, the destination are copied. Files that were previously copied
+    but are no longer associated with any of the tracks are deleted. The
+    manifest is written as copies complete so that an interrupted run can be
+    resumed.
+
+    Args:
+        tracks: Tracks to mirror.
+        destination: Directory to mirror tracks to.
+        workers_per_device: Maximum number of concurrent copies per device.
+    """
+    manifest = load_copy_manifest(destination)
+    copies, deletes, saved_bytes = build_copy_plan(
+        tracks, destination, manifest
+    )
+
+    # Remove the tracks that are no longer in the playlists.
+    for name in deletes:
+        (destination / name).unlink(missing_ok=True)
+        del manifest[name]
+    write_copy_manifest(destination, manifest)
+
+    copied_bytes = 0
+    try:
+        for index, (source, dest, digest) in enumerate(
+            schedule_copies(
+                [(source, dest) for source, dest, _ in copies],
+                mirror_file,
+                workers_per_device,
+                desc="Mirroring tracks",
+            ),
+            1,
+        ):
+            stat = source.stat()
+            manifest[dest.name] = {
+                "source": source.as_posix(),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "hash": digest,
+            }
+            copied_bytes += stat.st_size
+            if not index % MANIFEST_FLUSH_INTERVAL:
+                write_copy_manifest(destination, manifest)
+    finally:
+        write_copy_manifest(destination, manifest)
+
+    added = sum(1 for *_, action in copies if action == "add")
+    logger.info(
+        f"Mirrored {len(tracks)} tracks to {destination}: {added} added, "
+        f"{len(copies) - added} updated, {len(deletes)} deleted"
+    )
+    logger.info(
+        f"Copied {tqdm.format_sizeof(copied_bytes, 'B', 1024)}; saved "
+        f"{tqdm.format_sizeof(saved_bytes, 'B', 1024)} versus a full copy"
+    )
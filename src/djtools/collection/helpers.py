@@ -1,16 +1,37 @@
 """This module contains helpers for the collection package."""
 
+# pylint: disable=too-many-lines
+
 from __future__ import annotations
 from collections import defaultdict
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
+import hashlib
+import html
+import json
 import logging
 from operator import itemgetter
+import os
 from pathlib import Path
 import re
 import shutil
-from typing import Dict, List, Optional, Set, Tuple, Union
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from urllib.parse import unquote
 
 from dateutil.relativedelta import relativedelta
+from tqdm import tqdm
 
 from djtools.collection.base_collection import Collection
 from djtools.collection.base_playlist import Playlist
@@ -24,7 +45,9 @@ from djtools.collection.playlist_filters import PlaylistFilter
 from djtools.collection.rekordbox_collection import RekordboxCollection
 from djtools.collection.rekordbox_playlist import RekordboxPlaylist
 from djtools.collection.rekordbox_track import RekordboxTrack
+from djtools.configs.config import BaseConfig
 from djtools.utils.helpers import make_path
+from djtools.utils.run_context import get_run_context
 
 
 logger = logging.getLogger(__name__)
@@ -48,29 +71,308 @@ INEQUALITY_MAP = {
 
 # #############################################################################
 # This section includes helpers for the copy_playlists module.
-#   - copy_file: submitted to a ThreadPoolExecutor to copy files
+#   - copy_file: submitted to the I/O scheduler to copy files
+#   - COPY_MANIFEST_NAME: name of the manifest written to the destination when
+#       mirroring playlists
+#   - build_copy_plan: diffs the tracks to copy against the manifest to
+#       determine which files must be added, updated, or deleted
+#   - hash_file: computes the content hash recorded in the manifest
+#   - load_copy_manifest: reads the manifest from the destination
+#   - mirror_file: copies a file atomically while hashing its content
+#   - schedule_copies: runs copies with concurrency capped per device and
+#       reports their throughput
+#   - write_copy_manifest: atomically writes the manifest to the destination
 # #############################################################################
 
 
+COPY_MANIFEST_NAME = ".djtools_copy_manifest.json"
+
+
 @make_path
-def copy_file(track: Track, destination: Path):
-    """Copies a track to a destination and updates its location.
+def copy_file(source: Path, dest: Path):
+    """Copies a file to a destination unless it already exists there.
 
     Args:
-        track: Track object.
-        destination: Directory to copy tracks to.
+        source: File to copy.
+        dest: Path to copy the file to.
     """
-    loc = track.get_location()
-    dest = destination / loc.name
     if not dest.exists():
-        shutil.copyfile(loc.as_posix(), dest)
-    track.set_location(dest)
+        shutil.copyfile(source.as_posix(), dest)
+
+
+@make_path
+def build_copy_plan(
+    tracks: Dict[str, Track], destination: Path, manifest: Dict[str, Dict]
+) -> Tuple[List[Tuple[Path, Path, str]], List[str], int]:
+    """Computes the delta between the tracks to copy and a copy manifest.
+
+    Tracks whose source file is unchanged since it was last copied are
+    skipped. The size and modification time of the source are compared first
+    and the content hash is only computed when those disagree. Files which
+    exist at the destination but are missing from the manifest (e.g. because a
+    previous run was interrupted before the manifest was written) are adopted
+    if their content matches the source.
+
+    The location of every track is updated to point to the destination,
+    regardless of whether or not its file needs to be copied.
+
+    Args:
+        tracks: Tracks to be present at the destination.
+        destination: Directory to copy tracks to.
+        manifest: Copy manifest keyed by destination file name. This is
+            updated in-place for tracks that are skipped.
+
+    Returns:
+        Tuple of the (source, destination, action) copies to make, the
+            destination file names to delete, and the number of bytes that
+            don't need to be copied.
+    """
+    copies = []
+    planned = set()
+    saved_bytes = 0
+    for track in tracks.values():
+        source = track.get_location()
+        dest = destination / source.name
+        track.set_location(dest)
+
+        # Multiple tracks may have the same file name; the first one claims
+        # the destination.
+        if source.name in planned:
+            continue
+        planned.add(source.name)
+
+        stat = source.stat()
+        entry = manifest.get(source.name)
+        if entry and entry["source"] == source.as_posix() and dest.exists():
+            if (
+                entry["size"] == stat.st_size
+                and dest.stat().st_size == stat.st_size
+                and (
+                    entry["mtime"] == stat.st_mtime
+                    or entry["hash"] == hash_file(source)
+                )
+            ):
+                entry["mtime"] = stat.st_mtime
+                saved_bytes += stat.st_size
+                continue
+            copies.append((source, dest, "update"))
+            continue
+
+        # Adopt files copied by an interrupted or non-mirrored run.
+        if not entry and dest.exists() and dest.stat().st_size == stat.st_size:
+            digest = hash_file(dest)
+            if digest == hash_file(source):
+                manifest[source.name] = {
+                    "source": source.as_posix(),
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "hash": digest,
+                }
+                saved_bytes += stat.st_size
+                continue
+
+        copies.append((source, dest, "update" if entry else "add"))
+
+    deletes = sorted(set(manifest).difference(planned))
+
+    return copies, deletes, saved_bytes
+
+
+@make_path
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Computes a content hash of a file.
+
+    Args:
+        path: File to hash.
+        chunk_size: Number of bytes to read at once.
+
+    Returns:
+        Hex digest of the file's content.
+    """
+    digest = hashlib.blake2b()
+    with open(path, mode="rb") as _file:
+        for chunk in iter(lambda: _file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+@make_path
+def load_copy_manifest(destination: Path) -> Dict[str, Dict]:
+    """Reads the copy manifest from a destination.
+
+    Args:
+        destination: Directory tracks were copied to.
+
+    Returns:
+        Copy manifest keyed by destination file name.
+    """
+    manifest_path = destination / COPY_MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+
+    try:
+        with open(manifest_path, mode="r", encoding="utf-8") as _file:
+            return json.load(_file)
+    except json.JSONDecodeError:
+        logger.warning(
+            f"{manifest_path} is corrupt; the destination will be rebuilt "
+            "from the files that already exist there"
+        )
+        return {}
+
+
+@make_path
+def mirror_file(
+    source: Path, dest: Path, chunk_size: int = 1024 * 1024
+) -> str:
+    """Copies a file while hashing its content.
+
+    The file is first written to a temporary name and then renamed so that an
+    interrupted copy never leaves a partial file at the destination. The
+    temporary file is removed if the copy fails.
+
+    Args:
+        source: File to copy.
+        dest: Path to copy the file to.
+        chunk_size: Number of bytes to read at once.
+
+    Returns:
+        Hex digest of the file's content.
+    """
+    digest = hashlib.blake2b()
+    partial = dest.with_name(f"{dest.name}.part")
+    try:
+        with open(source, mode="rb") as src, open(partial, mode="wb") as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        shutil.copystat(source, partial)
+        os.replace(partial, dest)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    return digest.hexdigest()
+
+
+def schedule_copies(
+    copies: List[Tuple[Path, Path]],
+    func: Callable[[Path, Path], Any],
+    workers_per_device: int,
+    desc: str = "Copying tracks",
+) -> Iterator[Tuple[Path, Path, Any]]:
+    """Runs file copies with concurrency capped per storage device.
+
+    Copies are grouped by the devices their source and destination reside on
+    so that no device is ever serving more than "workers_per_device" copies at
+    once, regardless of how many CPUs are available. Copies are dispatched in
+    the order of their source device and inode to reduce seeking.
+
+    Throughput is reported in bytes per second as the copies complete.
+
+    Args:
+        copies: Pairs of source file and destination path.
+        func: Callable which copies a source file to a destination path.
+        workers_per_device: Maximum number of concurrent copies per device.
+        desc: Description for the progress bar.
+
+    Yields:
+        Tuple of the source, destination, and result of "func" for each copy
+            as it completes.
+    """
+    if not copies:
+        return
+
+    # Determine the devices that each copy reads from and writes to.
+    source_stats = {source: source.stat() for source, _ in copies}
+    dest_devices = {
+        dest.parent: dest.parent.stat().st_dev for _, dest in copies
+    }
+    copy_devices = {
+        (source, dest): sorted(
+            {source_stats[source].st_dev, dest_devices[dest.parent]}
+        )
+        for source, dest in copies
+    }
+    semaphores = {
+        device: threading.BoundedSemaphore(workers_per_device)
+        for devices in copy_devices.values()
+        for device in devices
+    }
+
+    def _copy(source: Path, dest: Path) -> Any:
+        # Semaphores are always acquired in the same order to avoid deadlock.
+        with ExitStack() as stack:
+            for device in copy_devices[(source, dest)]:
+                stack.enter_context(semaphores[device])
+            return func(source, dest)
+
+    ordered_copies = sorted(
+        copies,
+        key=lambda pair: (
+            source_stats[pair[0]].st_dev,
+            source_stats[pair[0]].st_ino,
+            pair[0].as_posix(),
+        ),
+    )
+    total_bytes = sum(stat.st_size for stat in source_stats.values())
+    with ThreadPoolExecutor(
+        max_workers=workers_per_device * len(semaphores)
+    ) as executor:
+        try:
+            futures = {
+                executor.submit(_copy, *pair): pair for pair in ordered_copies
+            }
+            with tqdm(
+                total=total_bytes,
+                desc=desc,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+            ) as pbar:
+                for future in as_completed(futures):
+                    source, dest = futures[future]
+                    result = future.result()
+                    pbar.update(source_stats[source].st_size)
+                    yield source, dest, result
+                elapsed = pbar.format_dict["elapsed"]
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    logger.info(
+        f"Copied {len(copies)} files "
+        f"({tqdm.format_sizeof(total_bytes, 'B', 1024)}) at "
+        f"{tqdm.format_sizeof(total_bytes / (elapsed or 1), 'B/s', 1024)}"
+    )
+
+
+@make_path
+def write_copy_manifest(destination: Path, manifest: Dict[str, Dict]):
+    """Atomically writes the copy manifest to a destination.
+
+    Args:
+        destination: Directory tracks were copied to.
+        manifest: Copy manifest keyed by destination file name.
+    """
+    manifest_path = destination / COPY_MANIFEST_NAME
+    partial = manifest_path.with_name(f"{manifest_path.name}.part")
+    with open(partial, mode="w", encoding="utf-8") as _file:
+        json.dump(manifest, _file, indent=2, sort_keys=True)
+    os.replace(partial, manifest_path)
 
 
 # #############################################################################
 # This section includes helpers for the playlist_builder module.
 #   - PLATFORM_REGISTRY: used to determine which abstraction implementations to
 #       use e.g. "rekordbox"
+#   - load_collection: loads the collection shared by the operations of a run
+#   - save_collection: serializes a collection, deferring the serialization of
+#       the shared collection to the end of the run
+#   - flush_collection: serializes the shared collection before
+#       "COLLECTION_PATH" is read directly
+#   - discard_collection: stops sharing a collection that's out of date
 #   - build_tag_playlists: builds collection playlists using "tags" component
 #       of the PlaylistConfig
 #   - filter_tag_playlists: applies PlaylistFilter implementations to built tag
@@ -105,6 +407,102 @@ PLATFORM_REGISTRY = {
 }
 
 
+def _get_collection_key(config: BaseConfig) -> Tuple[str, Path]:
+    """Gets the key of the shared collection in the run context.
+
+    Args:
+        config: Configuration object.
+
+    Returns:
+        Key of the collection at "COLLECTION_PATH".
+    """
+    return ("collection", config.COLLECTION_PATH)
+
+
+def discard_collection(config: BaseConfig):
+    """Stops sharing the collection, dropping any pending changes to it.
+
+    Args:
+        config: Configuration object.
+    """
+    context = get_run_context()
+    if context is not None:
+        context.discard(_get_collection_key(config))
+
+
+def flush_collection(config: BaseConfig, discard: bool = False):
+    """Serializes pending changes to the shared collection.
+
+    Args:
+        config: Configuration object.
+        discard: Whether to stop sharing the collection, e.g. because
+            "COLLECTION_PATH" is about to be modified directly.
+    """
+    context = get_run_context()
+    if context is None:
+        return
+    context.flush(_get_collection_key(config))
+    if discard:
+        context.discard(_get_collection_key(config))
+
+
+def load_collection(config: BaseConfig, shared: bool = True) -> Collection:
+    """Loads the collection at "COLLECTION_PATH".
+
+    During a run, the collection is only parsed once and then shared by every
+    operation that modifies it in place.
+
+    Args:
+        config: Configuration object.
+        shared: Whether to use the shared collection. Operations which modify
+            the collection to write it elsewhere, e.g. copying playlists,
+            must load a collection of their own.
+
+    Returns:
+        The collection.
+    """
+    collection_class = PLATFORM_REGISTRY[config.PLATFORM]["collection"]
+    context = get_run_context()
+    if context is None or not shared:
+        flush_collection(config)
+        return collection_class(path=config.COLLECTION_PATH)
+
+    return context.get(
+        _get_collection_key(config),
+        lambda: collection_class(path=config.COLLECTION_PATH),
+    )
+
+
+def save_collection(
+    config: BaseConfig, collection: Collection, path: Optional[Path] = None
+) -> Path:
+    """Serializes a collection.
+
+    During a run, writing the shared collection back to "COLLECTION_PATH" is
+    deferred so that it's serialized once, when the run ends, no matter how
+    many operations modify it.
+
+    Args:
+        config: Configuration object.
+        collection: Collection to serialize.
+        path: Path to write the collection to.
+
+    Returns:
+        Path to the serialized collection.
+    """
+    key = _get_collection_key(config)
+    context = get_run_context()
+    if (
+        context is not None
+        and path in (None, config.COLLECTION_PATH)
+        and context.lookup(key) is collection
+    ):
+        context.defer(key, collection.serialize)
+        return config.COLLECTION_PATH
+
+    return collection.serialize(path=path)
+
+
 def build_tag_playlists(
     content: Union[PlaylistConfigContent, PlaylistName, str],
     tags_tracks: Dict[str, Dict[str, Track]],
@@ -890,3 +1288,242 @@ def print_data(data: Dict[str, int]):
     for key in data:
         output += f"{' ' * width_pad}{key}{' ' * (width_pad + 1)}"
     print(output)
+
+
+# #############################################################################
+# This section includes helpers for the shuffle_playlists module.
+#   - find_playlist_track_keys: scans the PLAYLISTS section of a Rekordbox XML
+#       for the track keys of playlists
+#   - find_track_locations: scans the COLLECTION section of a Rekordbox XML for
+#       the audio file locations of tracks
+#   - insert_playlist_node: splices a new playlist into the ROOT folder of a
+#       Rekordbox XML
+#   - patch_track_numbers: rewrites the TrackNumber attribute of TRACK elements
+#       in the COLLECTION section of a Rekordbox XML
+#   - write_track_number_tag: writes a track number into an audio file's tags
+# #############################################################################
+
+
+PLAYLIST_ELEMENT_REGEX = re.compile(r"<(/?)(NODE|TRACK)\b([^>]*?)(/?)>")
+TRACK_ELEMENT_REGEX = re.compile(r"<TRACK\b[^>]*>")
+XML_ATTRIBUTE_REGEX = re.compile(r'(?<=\s)(\w+)="([^"]*)"')
+
+
+def find_playlist_track_keys(
+    xml: str, names: List[str]
+) -> Tuple[Dict[str, List[List[str]]], Optional[re.Match], Optional[re.Match]]:
+    """Scans the PLAYLISTS section of a Rekordbox XML for playlist track keys.
+
+    Args:
+        xml: Content of a Rekordbox XML.
+        names: Names of the playlists to find the track keys of.
+
+    Raises:
+        RuntimeError: The XML must have a PLAYLISTS section.
+        RuntimeError: The playlists being searched for must be keyed by
+            TrackID.
+
+    Returns:
+        Tuple of a dict mapping each found playlist name to the track keys of
+            each playlist with that name, the match for the ROOT NODE, and the
+            match for the closing tag of the ROOT NODE.
+    """
+    start = xml.find("<PLAYLISTS")
+    if start == -1:
+        raise RuntimeError("Collection has no PLAYLISTS section")
+    playlists = defaultdict(list)
+    root = root_close = None
+    # Each open NODE is represented by the list its TRACK keys are appended
+    # to, or None if it's not one of the playlists being searched for.
+    stack = []
+    for match in PLAYLIST_ELEMENT_REGEX.finditer(xml, start):
+        closing, element, attrs, self_closing = match.groups()
+        if element == "TRACK":
+            if stack and stack[-1] is not None:
+                stack[-1].append(
+                    dict(XML_ATTRIBUTE_REGEX.findall(attrs))["Key"]
+                )
+            continue
+        if closing:
+            stack.pop()
+            if not stack:
+                root_close = match
+                break
+            continue
+        if root is None:
+            root = match
+        keys = None
+        attributes = dict(XML_ATTRIBUTE_REGEX.findall(attrs))
+        name = html.unescape(attributes["Name"])
+        if name in names:
+            # TRACK keys are TrackIDs unless KeyType is "1", i.e. Location.
+            if attributes.get("KeyType", "0") != "0":
+                raise RuntimeError(
+                    f'Playlist "{name}" has KeyType "{attributes["KeyType"]}"; '
+                    'only playlists keyed by TrackID (KeyType "0") are '
+                    "supported"
+                )
+            keys = []
+            playlists[name].append(keys)
+        if not self_closing:
+            stack.append(keys)
+
+    return dict(playlists), root, root_close
+
+
+def find_track_locations(
+    xml: str, track_ids: Set[str], end: Optional[int] = None
+) -> Dict[str, Path]:
+    """Scans the COLLECTION section of a Rekordbox XML for track locations.
+
+    Args:
+        xml: Content of a Rekordbox XML.
+        track_ids: TrackIDs to find the locations of.
+        end: Offset at which to stop scanning for TRACK elements.
+
+    Returns:
+        Dict of TrackIDs to the location of their audio file.
+    """
+    location_prefix = (
+        "file://localhost" if os.name == "posix" else "file://localhost/"
+    )
+    locations = {}
+    for match in TRACK_ELEMENT_REGEX.finditer(
+        xml, 0, len(xml) if end is None else end
+    ):
+        if len(locations) == len(track_ids):
+            break
+        attrs = dict(XML_ATTRIBUTE_REGEX.findall(match.group()))
+        if attrs.get("TrackID") not in track_ids or "Location" not in attrs:
+            continue
+        location = unquote(html.unescape(attrs["Location"]))
+        locations[attrs["TrackID"]] = Path(location.split(location_prefix)[-1])
+
+    return locations
+
+
+def insert_playlist_node(
+    xml: str,
+    root: re.Match,
+    root_close: re.Match,
+    name: str,
+    keys: List[str],
+) -> str:
+    """Splices a new playlist as the last child of the ROOT NODE.
+
+    The indentation of the new playlist follows that of the existing children
+    of the ROOT NODE and the ROOT NODE's Count attribute is incremented.
+
+    Args:
+        xml: Content of a Rekordbox XML.
+        root: Match for the ROOT NODE.
+        root_close: Match for the closing tag of the ROOT NODE.
+        name: Name of the playlist to insert.
+        keys: Track keys of the playlist to insert.
+
+    Returns:
+        Content of the Rekordbox XML with the new playlist.
+    """
+    # Whitespace that precedes the first child of the ROOT NODE.
+    separator = xml[root.end() : xml.index("<", root.end())]
+    node = (
+        f'{separator}<NODE Name="{html.escape(name)}" Type="1" KeyType="0" '
+        f'Entries="{len(keys)}"'
+    )
+    if keys:
+        node += (
+            ">"
+            + "".join(f'{separator}  <TRACK Key="{key}"/>' for key in keys)
+            + f"{separator}</NODE>"
+        )
+    else:
+        node += "/>"
+    insert_at = len(xml[: root_close.start()].rstrip())
+    root_tag = re.sub(
+        r'(?<=\sCount=")(\d+)(?=")',
+        lambda count: str(int(count.group()) + 1),
+        root.group(),
+    )
+
+    return "".join(
+        [
+            xml[: root.start()],
+            root_tag,
+            xml[root.end() : insert_at],
+            node,
+            xml[insert_at:],
+        ]
+    )
+
+
+def patch_track_numbers(
+    xml: str, track_numbers: Dict[str, int], end: Optional[int] = None
+) -> str:
+    """Rewrites the TrackNumber attribute of TRACK elements.
+
+    Only the TrackNumber attribute values of the TRACK elements whose TrackID
+    is in track_numbers are rewritten; the rest of the XML is left untouched.
+
+    Args:
+        xml: Content of a Rekordbox XML.
+        track_numbers: TrackIDs to the TrackNumber to set for them.
+        end: Offset at which to stop scanning for TRACK elements.
+
+    Returns:
+        Content of the Rekordbox XML with the new track numbers.
+    """
+    chunks = []
+    last = 0
+    remaining = len(track_numbers)
+    for match in TRACK_ELEMENT_REGEX.finditer(
+        xml, 0, len(xml) if end is None else end
+    ):
+        if not remaining:
+            break
+        tag = match.group()
+        track_id = dict(XML_ATTRIBUTE_REGEX.findall(tag)).get("TrackID")
+        if track_id not in track_numbers:
+            continue
+        number = f'TrackNumber="{track_numbers[track_id]}"'
+        tag, count = re.subn(r'(?<=\s)TrackNumber="[^"]*"', number, tag)
+        if not count:
+            tag = re.sub(r"\s*(/?>)$", rf" {number}\1", tag)
+        chunks.extend([xml[last : match.start()], tag])
+        last = match.end()
+        remaining -= 1
+    chunks.append(xml[last:])
+
+    return "".join(chunks)
+
+
+def write_track_number_tag(path: Path, number: int) -> bool:
+    """Writes a track number into the tags of an audio file.
+
+    The tags are only saved if the track number differs from the one already
+    in the file. Saving rewrites just the tag in place when it has enough
+    padding to hold the new value.
+
+    Args:
+        path: Path to an audio file.
+        number: Track number to write.
+
+    Raises:
+        RuntimeError: The format of the audio file must be supported.
+
+    Returns:
+        Whether or not the tags of the audio file were written.
+    """
+    import mutagen
+
+    audio_file = mutagen.File(path, easy=True)
+    if audio_file is None:
+        raise RuntimeError(f"{path} is not a supported audio file")
+    if audio_file.tags is None:
+        audio_file.add_tags()
+    track_number = (audio_file.tags.get("tracknumber") or [""])[0]
+    if track_number.split("/")[0] == str(number):
+        return False
+    audio_file.tags["tracknumber"] = str(number)
+    audio_file.save()
+
+    return True
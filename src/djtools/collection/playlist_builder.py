@@ -11,8 +11,10 @@ from djtools.collection.helpers import (
     build_combiner_playlists,
     build_tag_playlists,
     filter_tag_playlists,
+    load_collection,
     PLATFORM_REGISTRY,
     print_playlists_tag_statistics,
+    save_collection,
 )
 from djtools.collection import playlist_filters
 from djtools.configs.config import BaseConfig
@@ -86,9 +88,7 @@ def collection_playlists(config: BaseConfig, path: Optional[Path] = None):
         return
 
     # Load the collection.
-    collection = PLATFORM_REGISTRY[config.PLATFORM]["collection"](
-        path=config.COLLECTION_PATH
-    )
+    collection = load_collection(config)
 
     # Get the Playlist implementation to use for this collection.
     playlist_class = PLATFORM_REGISTRY[config.PLATFORM]["playlist"]
@@ -211,4 +211,4 @@ def collection_playlists(config: BaseConfig, path: Optional[Path] = None):
     )
     auto_playlist.set_parent(collection.get_playlists())
     collection.add_playlist(auto_playlist)
-    collection.serialize(path=path)
+    save_collection(config, collection, path=path)
@@ -2,6 +2,15 @@
 playlists. This is done by setting the track number attribute of each track in
 sequential order after collecting the set of Tracks from the provided
 playlist(s).
+
+When "SHUFFLE_PLAYLISTS_IN_PLACE" is set, the collection isn't deserialized at
+all. Instead, the TrackNumber attributes of the shuffled tracks are patched
+directly in the XML and the SHUFFLE playlist is spliced into it so that the
+rest of the collection is written back untouched.
+
+When "SHUFFLE_PLAYLISTS_WRITE_TAGS" is set, the new track numbers are also
+written into the tags of the audio files so that the shuffle is visible to
+players reading the files without the collection.
 """
 
 from concurrent.futures import as_completed, ThreadPoolExecutor
@@ -9,12 +18,23 @@ import logging
 import os
 from pathlib import Path
 import random
-from typing import Optional
+import threading
+from typing import Dict, Optional
 
 from tqdm import tqdm
 
 from djtools.configs.config import BaseConfig
-from djtools.collection.helpers import PLATFORM_REGISTRY
+from djtools.collection.helpers import (
+    find_playlist_track_keys,
+    find_track_locations,
+    flush_collection,
+    insert_playlist_node,
+    load_collection,
+    patch_track_numbers,
+    PLATFORM_REGISTRY,
+    save_collection,
+    write_track_number_tag,
+)
 from djtools.utils.helpers import make_path
 
 
@@ -29,11 +49,17 @@ def shuffle_playlists(config: BaseConfig, path: Optional[Path] = None):
     Args:
         config: Configuration object.
         path: Path to write the new collection to.
+
+    Raises:
+        LookupError: Playlist names in SHUFFLE_PLAYLISTS must exist in
+            "COLLECTION_PATH".
     """
+    if config.SHUFFLE_PLAYLISTS_IN_PLACE:
+        shuffle_playlists_in_place(config, path=path)
+        return
+
     # Load collection.
-    collection = PLATFORM_REGISTRY[config.PLATFORM]["collection"](
-        path=config.COLLECTION_PATH
-    )
+    collection = load_collection(config)
 
     # Build a dict of tracks to shuffle from the provided list of playlists.
     shuffled_tracks = {}
@@ -64,6 +90,12 @@ def shuffle_playlists(config: BaseConfig, path: Optional[Path] = None):
         ):
             _ = future.result()
 
+    if config.SHUFFLE_PLAYLISTS_WRITE_TAGS:
+        write_track_number_tags(
+            {track.get_location(): number for track, number in zip(*payload)},
+            config.COPY_PLAYLISTS_WORKERS_PER_DEVICE,
+        )
+
     # Insert a new playlist containing just the shuffled tracks.
     collection.add_playlist(
         PLATFORM_REGISTRY[config.PLATFORM]["playlist"].new_playlist(
@@ -71,4 +103,138 @@ def shuffle_playlists(config: BaseConfig, path: Optional[Path] = None):
             tracks={track.get_id(): track for track in shuffled_tracks},
         )
     )
-    _ = collection.serialize(path=path)
+    _ = save_collection(config, collection, path=path)
+
+
+@make_path
+def shuffle_playlists_in_place(
+    config: BaseConfig, path: Optional[Path] = None
+):
+    """Shuffles playlists by patching the collection's XML directly.
+
+    Rather than building Track and Playlist objects and re-serializing the
+    entire collection, the PLAYLISTS section is scanned for the keys of the
+    tracks to shuffle, only the TrackNumber attribute values of those TRACK
+    elements are rewritten, and the SHUFFLE playlist is spliced into the ROOT
+    folder.
+
+    Args:
+        config: Configuration object.
+        path: Path to write the new collection to.
+
+    Raises:
+        LookupError: Playlist names in SHUFFLE_PLAYLISTS must exist in
+            "COLLECTION_PATH".
+        RuntimeError: Playlists in SHUFFLE_PLAYLISTS must be keyed by
+            TrackID.
+    """
+    # The collection is read and written directly, so any changes to the
+    # shared collection must be written first and it's out of date after.
+    flush_collection(config, discard=True)
+    # Newlines aren't translated so that the rest of the collection is left
+    # byte-for-byte intact.
+    with open(
+        config.COLLECTION_PATH, mode="r", encoding="utf-8", newline=""
+    ) as _file:
+        xml = _file.read()
+    playlists, root, root_close = find_playlist_track_keys(
+        xml, config.SHUFFLE_PLAYLISTS
+    )
+
+    # Build an ordered set of track keys to shuffle from the provided list of
+    # playlists.
+    shuffled_keys = {}
+    for playlist_name in config.SHUFFLE_PLAYLISTS:
+        if playlist_name not in playlists:
+            raise LookupError(f"{playlist_name} not found")
+        for track_keys in playlists[playlist_name]:
+            track_keys = list(dict.fromkeys(track_keys))
+            random.shuffle(track_keys)
+            shuffled_keys.update(dict.fromkeys(track_keys))
+
+    # Insert a new playlist containing just the shuffled tracks before
+    # patching the track numbers, since the PLAYLISTS section comes after the
+    # COLLECTION section.
+    xml = insert_playlist_node(
+        xml, root, root_close, "SHUFFLE", list(shuffled_keys)
+    )
+    track_numbers = {
+        key: number for number, key in enumerate(shuffled_keys, 1)
+    }
+    xml = patch_track_numbers(xml, track_numbers, xml.find("<PLAYLISTS"))
+    logger.info(f"Randomized {len(shuffled_keys)} tracks")
+
+    if config.SHUFFLE_PLAYLISTS_WRITE_TAGS:
+        locations = find_track_locations(
+            xml, set(track_numbers), xml.find("<PLAYLISTS")
+        )
+        write_track_number_tags(
+            {
+                location: track_numbers[track_id]
+                for track_id, location in locations.items()
+            },
+            config.COPY_PLAYLISTS_WORKERS_PER_DEVICE,
+        )
+
+    with open(
+        path or config.COLLECTION_PATH, mode="w", encoding="utf-8", newline=""
+    ) as _file:
+        _file.write(xml)
+
+
+def write_track_number_tags(
+    track_numbers: Dict[Path, int], workers_per_device: int
+):
+    """Writes track numbers into the tags of audio files.
+
+    Files whose tags already have the right track number are skipped. Failing
+    to write the tags of a file is logged rather than raised so that the rest
+    of the files are still written. As with copies, no storage device is ever
+    writing more than "workers_per_device" files at once.
+
+    Args:
+        track_numbers: Paths of audio files to the track number to write.
+        workers_per_device: Maximum number of concurrent writes per device.
+    """
+    devices = {}
+    for location in track_numbers:
+        try:
+            devices[location] = location.stat().st_dev
+        except OSError:
+            # The write fails and is logged below.
+            devices[location] = None
+    semaphores = {
+        device: threading.BoundedSemaphore(workers_per_device)
+        for device in devices.values()
+    }
+
+    def _write(location: Path, number: int) -> bool:
+        with semaphores[devices[location]]:
+            return write_track_number_tag(location, number)
+
+    written = failed = 0
+    with ThreadPoolExecutor(
+        max_workers=workers_per_device * max(len(semaphores), 1)
+    ) as executor:
+        futures = {
+            executor.submit(_write, location, number): location
+            for location, number in track_numbers.items()
+        }
+        for future in tqdm(
+            as_completed(futures),
+            total=len(futures),
+            desc=f"Writing track numbers to {len(futures)} files",
+        ):
+            try:
+                written += future.result()
+            except Exception as exc:
+                failed += 1
+                logger.error(
+                    f"Failed to write track number to {futures[future]}: {exc}"
+                )
+
+    logger.info(
+        f"Wrote track numbers to {written} files; "
+        f"{len(track_numbers) - written - failed} already matched and "
+        f"{failed} failed"
+    )
@@ -5,9 +5,16 @@
         multiple packages
     * `helpers`: contains functions for building configuration objects and
         parsing command-line arguments
+    * `snapshot`: a local cache of the validated configuration options
 """
 
-from djtools.configs.helpers import build_config
+from djtools.utils.lazy import lazy_exports
 
 
+__getattr__ = lazy_exports(
+    __name__, {"build_config": "djtools.configs.helpers"}
+)
+
+# The names in __all__ are imported on first access by __getattr__.
+# pylint: disable=undefined-all-variable
 __all__ = ("build_config",)
@@ -64,6 +64,15 @@ def get_arg_parser() -> ArgumentParser:
         action="store_true",
         help="Display the version number of the installed djtools.",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "After running, keep the collection in memory and re-run the "
+            "collection operations whenever the collection, config.yaml, or "
+            "collection_playlists.yaml changes...\nStop watching with Ctrl+C."
+        ),
+    )
     subparsers = parser.add_subparsers(title="sub-commands")
 
     ###########################################################################
@@ -127,6 +136,23 @@ def get_arg_parser() -> ArgumentParser:
         type=_convert_to_paths,
         help="Location to copy playlists' audio files to.",
     )
+    collection_parser.add_argument(
+        "--copy-playlists-mirror",
+        action="store_true",
+        help=(
+            'Keep "--copy-playlists-destination" as a mirror of the playlists;'
+            "\nonly tracks that were added or changed since the last run are "
+            "copied and tracks that are no longer in the playlists are deleted."
+        ),
+    )
+    collection_parser.add_argument(
+        "--copy-playlists-workers-per-device",
+        type=int,
+        help=(
+            "Maximum number of concurrent copies reading from or writing to "
+            "any one storage device while copying playlists."
+        ),
+    )
     collection_parser.add_argument(
         "--platform",
         type=str,
@@ -143,6 +169,22 @@ def get_arg_parser() -> ArgumentParser:
             "the track number attribute to emulate shuffling of the tracks."
         ),
     )
+    collection_parser.add_argument(
+        "--shuffle-playlists-in-place",
+        action="store_true",
+        help=(
+            "Shuffle playlists by patching track numbers directly in the "
+            "collection\nrather than deserializing and re-serializing it."
+        ),
+    )
+    collection_parser.add_argument(
+        "--shuffle-playlists-write-tags",
+        action="store_true",
+        help=(
+            "Also write the shuffled track numbers into the tags of the audio "
+            "files\nso that players reading the files directly see the shuffle."
+        ),
+    )
 
     ###########################################################################
     # Sub-command for the spotify package.
@@ -263,15 +305,26 @@ def get_arg_parser() -> ArgumentParser:
         "--aws-use-date-modified",
         action="store_true",
         help=(
-            'Drop the "--size-only" flag for "aws s3 sync" command; '
+            "Compare the date modified of files in addition to their size; "
             '"--aws-use-date-modified" will permit re-syncing files if the '
             "date modified field changes."
         ),
     )
+    sync_parser.add_argument(
+        "--beatcloud-manifest-ttl",
+        type=int,
+        help=(
+            "Number of seconds a cached listing of a user's Beatcloud tracks "
+            "is reused for."
+        ),
+    )
     sync_parser.add_argument(
         "--bucket-url",
         type=str,
-        help="URL for an AWS S3 API compliant bucket.",
+        help=(
+            'URL for an AWS S3 API compliant bucket ("s3://...") or a local '
+            'directory ("file://...").'
+        ),
     )
     sync_parser.add_argument(
         "--discord-url",
@@ -329,6 +382,11 @@ def get_arg_parser() -> ArgumentParser:
         type=str,
         help='"--user" whose "--collection-path" you\'re downloading.',
     )
+    sync_parser.add_argument(
+        "--sync-max-concurrency",
+        type=int,
+        help="Maximum number of concurrent transfers to and from the Beatcloud.",
+    )
     sync_parser.add_argument(
         "--upload-collection",
         action="store_true",
@@ -337,6 +395,16 @@ def get_arg_parser() -> ArgumentParser:
             "the Beatcloud."
         ),
     )
+    sync_parser.add_argument(
+        "--upload-collection-format",
+        type=str,
+        choices=["delta", "gzip", "plain"],
+        help=(
+            'Format to upload collection files in: "gzip" compresses them '
+            'and "delta" only uploads the (compressed) parts of them which '
+            "changed since the last upload."
+        ),
+    )
     sync_parser.add_argument(
         "--upload-exclude-dirs",
         type=_convert_to_paths,
@@ -3,7 +3,6 @@ this configuration object either don't apply to any particular package or they
 apply to multiple packages. The attributes of this configuration object
 correspond with the "configs" key of config.yaml."""
 
-import inspect
 import logging
 from typing_extensions import Literal
 
@@ -21,27 +20,30 @@ class BaseConfig(BaseModel, extra="allow"):
         "INFO"
     )
     VERBOSITY: NonNegativeInt = 0
+    WATCH: bool = False
 
     def __init__(self, *args, **kwargs):
         """Constructor."""
         super().__init__(*args, **kwargs)
-        logger.info(repr(self))
+        # The fields of the subclasses are logged when they're constructed so
+        # a BaseConfig, which joins them, only logs its own fields.
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(self._repr(show_full_config=False))
 
     def __repr__(self):
-        ret = f"{self.__class__.__name__}("
+        return self._repr()
+
+    def _repr(self, show_full_config: bool = True) -> str:
+        """Produces a string representation of this config.
 
-        # Inspect the stack to determine if the BaseConfig is being displayed
-        # as part of the CLI's execution or otherwise.
-        stack = inspect.stack()
-        entry_frame = stack[-1]
-        calling_frame = stack[2]
-        show_full_config = True
-        if (
-            entry_frame[1].endswith("bin/djtools")
-            and calling_frame[3] == "build_config"
-        ):
-            show_full_config = False
+        Args:
+            show_full_config: Whether a BaseConfig includes the fields of its
+                subclasses.
 
+        Returns:
+            Config as a string.
+        """
+        ret = f"{self.__class__.__name__}("
         for name, value in self.model_dump().items():
             if (
                 name in BaseConfig.model_fields
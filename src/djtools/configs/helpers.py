@@ -3,17 +3,25 @@ using config.yaml. If command-line arguments are provided, this module
 overrides the corresponding configuration options with these arguments.
 """
 
-import inspect
 import logging
 from pathlib import Path
 import sys
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 import yaml
 
-from djtools.collection.config import CollectionConfig
+from djtools.collection.config import (
+    CollectionConfig,
+    PLAYLIST_CONFIG_PATH,
+    PLAYLIST_TEMPLATE_PATH,
+)
 from djtools.configs.cli_args import get_arg_parser
 from djtools.configs.config import BaseConfig
+from djtools.configs.snapshot import (
+    get_snapshot_key,
+    load_snapshot,
+    save_snapshot,
+)
 from djtools.spotify.config import SpotifyConfig
 from djtools.sync.config import SyncConfig
 from djtools.utils.config import UtilsConfig
@@ -33,14 +41,20 @@ PKG_CFG = {
 
 
 @make_path
-def build_config(config_file: Optional[Path] = None) -> BaseConfig:
+def build_config(
+    config_file: Optional[Path] = None, cli: bool = False
+) -> BaseConfig:
     """This function loads configurations for the library.
 
-    Configurations are loaded from config.yaml. If command-line arguments are
-    provided, these override the configuration options set in config.yaml.
+    Configurations are loaded from config.yaml. If djtools is running as a CLI,
+    command-line arguments override the configuration options set in
+    config.yaml. If neither changed since the last build, the configuration
+    objects are constructed from the options stored in the config snapshot
+    rather than from config.yaml.
 
     Args:
         config_file: Optional path to a config.yaml.
+        cli: Whether to parse command-line arguments.
 
     Raises:
         RuntimeError: config.yaml must be a valid YAML.
@@ -48,19 +62,9 @@ def build_config(config_file: Optional[Path] = None) -> BaseConfig:
     Returns:
         Global configuration object.
     """
-    # Load "config.yaml".
     if not config_file:
         config_file = Path(__file__).parent / "config.yaml"
-    if config_file.exists():
-        try:
-            with open(config_file, mode="r", encoding="utf-8") as _file:
-                config = yaml.load(_file, Loader=yaml.FullLoader) or {}
-        except Exception as exc:
-            msg = f'Error reading "config.yaml": {exc}'
-            logger.critical(msg)
-            raise RuntimeError(msg) from Exception
-    else:
-        config = {}
+    if not config_file.exists():
         initial_config = {
             pkg: {
                 k: v.default
@@ -74,47 +78,28 @@ def build_config(config_file: Optional[Path] = None) -> BaseConfig:
 
     # Only get CLI arguments if calling djtools as a CLI.
     args = {}
-    stack = inspect.stack()
-    entry_frame = stack[-1]
-    cli_loc = str(Path("bin") / "djtools")  # Unix djtools.
-    test_loc = str(Path("bin") / "pytest")  # Unix pytest.
-    windows_loc = str(Path("lib") / "runpy.py")  # Windows Python<=3.10.
-    windows_frozen = "<frozen runpy>"  # Windows Python>=3.11.
-    if entry_frame[1].endswith(
-        (cli_loc, test_loc, windows_loc, windows_frozen)
-    ):
+    if cli:
         args = {
             k.upper(): v
             for k, v in _arg_parse().items()
             if v or isinstance(v, list)
         }
-
-    # Update config using command-line arguments.
     if args:
         logger.info(f"Args: {args}")
-        args_set = set(args)
-        for pkg, cfg_class in PKG_CFG.items():
-            args_intersection = set(cfg_class.model_fields).intersection(
-                args_set
-            )
-            if args_intersection:
-                args_subset = {
-                    k: v for k, v in args.items() if k in args_intersection
-                }
-                if pkg in config:
-                    config[pkg].update(args_subset)
-                else:
-                    config[pkg] = args_subset
 
-    # Instantiate Pydantic models.
-    base_cfg_options = config["configs"] if config else {}
-    configs = {
-        pkg: cfg(**{**base_cfg_options, **config.get(pkg, {})})
-        for pkg, cfg in PKG_CFG.items()
-        if pkg != "configs"
-    }
+    # Use the configuration objects built by the last run if they were built
+    # from the same sources.
+    snapshot_key = get_snapshot_key(get_config_sources(config_file), args)
+    configs = load_snapshot(snapshot_key, PKG_CFG)
+    if configs is None:
+        configs = _build_configs(config_file, args, snapshot_key)
+
     joined_config = BaseConfig(
-        **base_cfg_options,
+        **{
+            k: v
+            for k, v in next(iter(configs.values())).model_dump().items()
+            if k in BaseConfig.model_fields
+        },
         **{
             k: v
             for cfg in configs.values()
@@ -125,6 +110,32 @@ def build_config(config_file: Optional[Path] = None) -> BaseConfig:
     return joined_config
 
 
+def get_config_sources(config_file: Optional[Path] = None) -> List[Path]:
+    """Lists the files the configuration objects are built from.
+
+    If collection_playlists.j2 exists, collection_playlists.yaml is rendered
+    from it (and any templates it includes) rather than being a source itself.
+
+    Args:
+        config_file: Optional path to a config.yaml.
+
+    Returns:
+        Paths of config.yaml and the playlist config's sources.
+    """
+    if not config_file:
+        config_file = Path(__file__).parent / "config.yaml"
+    if PLAYLIST_TEMPLATE_PATH.exists():
+        sources = [
+            path
+            for path in sorted(PLAYLIST_TEMPLATE_PATH.parent.rglob("*"))
+            if path.is_file()
+        ]
+    else:
+        sources = [PLAYLIST_CONFIG_PATH]
+
+    return [config_file, *sources]
+
+
 def _arg_parse() -> Dict:
     """This function parses command-line arguments.
 
@@ -165,6 +176,60 @@ def _arg_parse() -> Dict:
     return vars(args)
 
 
+def _build_configs(
+    config_file: Path, args: Dict, snapshot_key: str
+) -> Dict[str, BaseConfig]:
+    """This function builds the configuration objects of each package.
+
+    The configuration objects are stored in the config snapshot.
+
+    Args:
+        config_file: Path to a config.yaml.
+        args: Command-line arguments overriding the options in config.yaml.
+        snapshot_key: Key of the sources of the configuration objects.
+
+    Raises:
+        RuntimeError: config.yaml must be a valid YAML.
+
+    Returns:
+        Configuration object of each package.
+    """
+    # Load "config.yaml".
+    config = {}
+    if config_file.exists():
+        try:
+            with open(config_file, mode="r", encoding="utf-8") as _file:
+                config = yaml.load(_file, Loader=yaml.FullLoader) or {}
+        except Exception as exc:
+            msg = f'Error reading "config.yaml": {exc}'
+            logger.critical(msg)
+            raise RuntimeError(msg) from Exception
+
+    # Update config using command-line arguments.
+    args_set = set(args)
+    for pkg, cfg_class in PKG_CFG.items():
+        args_intersection = set(cfg_class.model_fields).intersection(args_set)
+        if args_intersection:
+            args_subset = {
+                k: v for k, v in args.items() if k in args_intersection
+            }
+            if pkg in config:
+                config[pkg].update(args_subset)
+            else:
+                config[pkg] = args_subset
+
+    # Instantiate Pydantic models.
+    base_cfg_options = config.get("configs", {})
+    configs = {
+        pkg: cfg(**{**base_cfg_options, **config.get(pkg, {})})
+        for pkg, cfg in PKG_CFG.items()
+        if pkg != "configs"
+    }
+    save_snapshot(snapshot_key, configs)
+
+    return configs
+
+
 def _filter_dict(
     sub_config: Union[
         CollectionConfig, SpotifyConfig, SyncConfig, UtilsConfig
@@ -0,0 +1,130 @@
+"""This module contains the config snapshot: a local cache of the options
+`build_config` validated.
+
+Building the configuration objects reads `config.yaml`, merges the
+command-line arguments into the options of every package and, for
+`COLLECTION_PLAYLISTS`, renders `collection_playlists.j2` and parses
+`collection_playlists.yaml`. If neither those files, the command-line
+arguments, nor the version of `djtools` changed since the last build, the
+options it validated, including the parsed playlist config, are loaded from
+the snapshot instead.
+
+The configuration objects are still constructed from those options since
+their other checks, e.g. of Spotify credentials, "USB_PATH", or
+"AWS_PROFILE", depend on more than the sources of the snapshot.
+
+Files are compared by the hash of their content, rather than their modified
+times, since they're small and an edit made within the resolution of the file
+system's timestamps would otherwise go unnoticed.
+
+The options include credentials, so the snapshot is stored in the user's
+cache directory and is only readable by them.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Type
+
+from pydantic import ValidationError
+
+from djtools.configs.config import BaseConfig
+from djtools.version import get_version
+
+
+CONFIG_SNAPSHOT_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "djtools"
+    / "config_snapshot.json"
+)
+
+
+def get_snapshot_key(sources: Iterable[Path], args: Dict[str, Any]) -> str:
+    """Computes the key that a snapshot of the config built from some sources
+    is stored under.
+
+    Args:
+        sources: Paths of the files the config is built from.
+        args: Command-line arguments the config is built with.
+
+    Returns:
+        Hash of the sources, the arguments, and the version of djtools.
+    """
+    digests = {}
+    for path in sources:
+        try:
+            digests[str(path)] = hashlib.sha256(path.read_bytes()).hexdigest()
+        except FileNotFoundError:
+            digests[str(path)] = None
+
+    return hashlib.sha256(
+        json.dumps(
+            {"args": args, "sources": digests, "version": get_version()},
+            default=str,
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+
+def load_snapshot(
+    key: str, config_classes: Dict[str, Type[BaseConfig]]
+) -> Optional[Dict[str, BaseConfig]]:
+    """Constructs the configuration objects from the options stored in the
+        snapshot.
+
+    Args:
+        key: Key of the sources the configuration objects must be built from.
+        config_classes: Class of the configuration object of each package.
+
+    Raises:
+        RuntimeError: The configuration objects' checks may fail.
+        ValueError: The configuration objects' checks may fail.
+
+    Returns:
+        The configuration object of each package or None if the snapshot
+            wasn't taken of the same sources or is invalid.
+    """
+    try:
+        snapshot = json.loads(CONFIG_SNAPSHOT_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    if snapshot.get("key") != key:
+        return None
+    try:
+        return {
+            pkg: config_classes[pkg](**data)
+            for pkg, data in snapshot["configs"].items()
+        }
+    except (KeyError, ValidationError):
+        return None
+
+
+def save_snapshot(key: str, configs: Dict[str, BaseConfig]):
+    """Stores the options of configuration objects in the snapshot.
+
+    Args:
+        key: Key of the sources the configuration objects were built from.
+        configs: Configuration object of each package.
+    """
+    CONFIG_SNAPSHOT_PATH.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    part_path = CONFIG_SNAPSHOT_PATH.with_name(
+        f"{CONFIG_SNAPSHOT_PATH.name}.part"
+    )
+    part_path.unlink(missing_ok=True)
+    with os.fdopen(
+        os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600),
+        mode="w",
+        encoding="utf-8",
+    ) as _file:
+        json.dump(
+            {
+                "configs": {
+                    pkg: config.model_dump(mode="json")
+                    for pkg, config in configs.items()
+                },
+                "key": key,
+            },
+            _file,
+        )
+    os.replace(part_path, CONFIG_SNAPSHOT_PATH)
@@ -5,18 +5,35 @@
         Subreddit posts or the Discord webhook output from `UPLOAD_MUSIC`
 """
 
-from djtools.spotify.playlist_builder import (
-    spotify_playlist_from_upload,
-    spotify_playlists,
-)
+from djtools.utils.lazy import lazy_exports, LazyOperation
 
 
 SPOTIFY_OPERATIONS = {
-    "SPOTIFY_PLAYLIST_FROM_UPLOAD": spotify_playlist_from_upload,
-    "SPOTIFY_PLAYLISTS": spotify_playlists,
+    "SPOTIFY_PLAYLIST_FROM_UPLOAD": LazyOperation(
+        "djtools.spotify.playlist_builder",
+        "spotify_playlist_from_upload",
+        reads=("spotify",),
+        writes=("spotify",),
+    ),
+    "SPOTIFY_PLAYLISTS": LazyOperation(
+        "djtools.spotify.playlist_builder",
+        "spotify_playlists",
+        reads=("spotify",),
+        writes=("spotify",),
+    ),
 }
 
+__getattr__ = lazy_exports(
+    __name__,
+    {
+        "spotify_playlist_from_upload": "djtools.spotify.playlist_builder",
+        "spotify_playlists": "djtools.spotify.playlist_builder",
+    },
+)
+
 
+# The names in __all__ are imported on first access by __getattr__.
+# pylint: disable=undefined-all-variable
 __all__ = (
     "spotify_playlist_from_upload",
     "spotify_playlists",
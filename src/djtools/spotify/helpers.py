@@ -15,6 +15,7 @@ from tqdm import tqdm
 import yaml
 
 from djtools.configs.config import BaseConfig
+from djtools.utils.run_context import shared
 
 
 logger = logging.getLogger(__name__)
@@ -103,27 +104,35 @@ def get_reddit_client(config: BaseConfig) -> praw.Reddit:
 def get_spotify_client(config: BaseConfig) -> spotipy.Spotify:
     """Instantiate a Spotify API client.
 
+    During a run, the client is shared by every operation.
+
     Args:
         config: Configuration object.
 
     Returns:
         Spotify API client.
     """
-    spotify = spotipy.Spotify(
-        auth_manager=SpotifyOAuth(
-            client_id=config.SPOTIFY_CLIENT_ID,
-            client_secret=config.SPOTIFY_CLIENT_SECRET,
-            redirect_uri=config.SPOTIFY_REDIRECT_URI,
-            scope="playlist-modify-public",
-            requests_timeout=30,
-            cache_handler=spotipy.CacheFileHandler(
-                cache_path=Path(__file__).parent / ".spotify.cache"
-            ),
-        )
+    return shared(
+        (
+            "spotify",
+            config.SPOTIFY_CLIENT_ID,
+            config.SPOTIFY_CLIENT_SECRET,
+            config.SPOTIFY_REDIRECT_URI,
+        ),
+        lambda: spotipy.Spotify(
+            auth_manager=SpotifyOAuth(
+                client_id=config.SPOTIFY_CLIENT_ID,
+                client_secret=config.SPOTIFY_CLIENT_SECRET,
+                redirect_uri=config.SPOTIFY_REDIRECT_URI,
+                scope="playlist-modify-public",
+                requests_timeout=30,
+                cache_handler=spotipy.CacheFileHandler(
+                    cache_path=Path(__file__).parent / ".spotify.cache"
+                ),
+            )
+        ),
     )
 
-    return spotify
-
 
 async def get_subreddit_posts(
     spotify: spotipy.Spotify,
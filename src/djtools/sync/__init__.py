@@ -1,26 +1,65 @@
 """The `sync` package contains modules:
+    * `collection_storage`: compressed and delta-encoded storage of
+        collection files in the Beatcloud
     * `config`: the configuration object for the `sync` package
     * `helpers`: helper functions for the `sync_operations` module
+    * `manifest`: a local cache of the listing of the Beatcloud
+    * `scan_cache`: a local cache of the listing of "USB_PATH"
+    * `storage`: the storage backends (S3 or a local directory) that the
+        Beatcloud is accessed through
     * `sync_operations`: for syncing audio and collection files to the
         Beatcloud
+    * `transfer`: the transfer engine for syncing files with a storage backend
 """
 
-from djtools.sync.sync_operations import (
-    download_collection,
-    download_music,
-    upload_collection,
-    upload_music,
-)
+from djtools.utils.lazy import lazy_exports, LazyOperation
 
 
 SYNC_OPERATIONS = {
-    "DOWNLOAD_COLLECTION": download_collection,
-    "DOWNLOAD_MUSIC": download_music,
-    "DOWNLOAD_SPOTIFY_PLAYLIST": download_music,
-    "UPLOAD_COLLECTION": upload_collection,
-    "UPLOAD_MUSIC": upload_music,
+    "DOWNLOAD_COLLECTION": LazyOperation(
+        "djtools.sync.sync_operations",
+        "download_collection",
+        reads=("beatcloud",),
+        writes=("collection",),
+    ),
+    "DOWNLOAD_MUSIC": LazyOperation(
+        "djtools.sync.sync_operations",
+        "download_music",
+        reads=("beatcloud",),
+        writes=("usb",),
+    ),
+    "DOWNLOAD_SPOTIFY_PLAYLIST": LazyOperation(
+        "djtools.sync.sync_operations",
+        "download_music",
+        reads=("beatcloud", "spotify"),
+        writes=("usb",),
+    ),
+    "UPLOAD_COLLECTION": LazyOperation(
+        "djtools.sync.sync_operations",
+        "upload_collection",
+        reads=("collection",),
+        writes=("beatcloud",),
+    ),
+    "UPLOAD_MUSIC": LazyOperation(
+        "djtools.sync.sync_operations",
+        "upload_music",
+        reads=("usb",),
+        writes=("beatcloud",),
+    ),
 }
 
+__getattr__ = lazy_exports(
+    __name__,
+    {
+        "download_collection": "djtools.sync.sync_operations",
+        "download_music": "djtools.sync.sync_operations",
+        "upload_collection": "djtools.sync.sync_operations",
+        "upload_music": "djtools.sync.sync_operations",
+    },
+)
+
+# The names in __all__ are imported on first access by __getattr__.
+# pylint: disable=undefined-all-variable
 __all__ = (
     "download_collection",
     "download_music",
@@ -0,0 +1,366 @@
+"""This module contains the compressed and delta-encoded storage of
+collection files in a StorageBackend.
+
+A collection at key "K" is stored in one of three formats:
+    * "plain": the file itself at "K"
+    * "gzip": the gzipped file at "K.gz"
+    * "delta": the gzipped list of the digests of the file's chunks at
+        "K.index.gz" with each gzipped chunk at "K.chunks/{digest}.gz"
+
+Chunks end after any line whose CRC is divisible by "CHUNK_DIVISOR", so
+chunk boundaries depend on the content of the file rather than on offsets in
+it. An edit to a collection therefore only changes the chunks containing the
+edited lines and an upload only transfers the chunks that aren't already
+stored. Downloads likewise only transfer the chunks missing from the copy of
+the collection that was last downloaded, which is kept under
+"COLLECTION_CACHE_DIR" since downloaded collections are rewritten to point to
+the local "USB_PATH".
+
+Downloads read whichever format was uploaded last so they're transparent to
+the format used by the uploader. Versions of `djtools` which only read the
+"plain" format are still supported: collections uploaded in the other formats
+are also uploaded as-is, and downloads prefer the other formats to it.
+
+An upload deletes the objects of the collection in the other compressed
+format and the chunks which neither the new index nor the index it replaced
+refer to. The chunks of the replaced index are kept until the next upload so
+that a download which already read it can still complete.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from typing import Iterator, NamedTuple, Set
+import zlib
+
+from djtools.sync.storage import StorageBackend
+from djtools.sync.transfer import transfer_files
+
+
+logger = logging.getLogger(__name__)
+CHUNK_DIVISOR = 1024
+COLLECTION_CACHE_DIR = Path(__file__).parent / ".collections"
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+SUFFIXES = {"plain": "", "gzip": ".gz", "delta": ".index.gz"}
+
+
+class Chunk(NamedTuple):
+    """A content-defined chunk of a file."""
+
+    digest: str
+    offset: int
+    size: int
+
+
+def chunk_file(path: Path) -> Iterator[Chunk]:
+    """Splits a file into content-defined chunks.
+
+    Args:
+        path: Path of the file to split.
+
+    Returns:
+        Iterator of the chunks of the file in order.
+    """
+    with open(path, mode="rb") as _file:
+        offset, size = 0, 0
+        digest = hashlib.sha256()
+        for line in _file:
+            digest.update(line)
+            size += len(line)
+            if zlib.crc32(line) % CHUNK_DIVISOR == 0 or size >= MAX_CHUNK_SIZE:
+                yield Chunk(digest.hexdigest(), offset, size)
+                offset, size = offset + size, 0
+                digest = hashlib.sha256()
+        if size:
+            yield Chunk(digest.hexdigest(), offset, size)
+
+
+def download_collection_file(
+    backend: StorageBackend,
+    key: str,
+    path: Path,
+    max_concurrency: int = 10,
+):
+    """Downloads a collection file stored in any format.
+
+    Args:
+        backend: StorageBackend to download from.
+        key: Key of the collection.
+        path: Path to download the collection to.
+        max_concurrency: Maximum number of concurrent transfers.
+
+    Raises:
+        FileNotFoundError: The collection must exist.
+    """
+    objects = {
+        obj.key: obj for obj in backend.list_objects(key, recursive=False)
+    }
+    # The "plain" object is uploaded before the others so it's only read if
+    # it's the latest.
+    stored = [
+        (objects[key + suffix].last_modified, rank, fmt)
+        for rank, (fmt, suffix) in enumerate(SUFFIXES.items())
+        if key + suffix in objects
+    ]
+    if not stored:
+        raise FileNotFoundError(f"{backend.url(key)} does not exist")
+    fmt = max(stored)[2]
+    obj = objects[key + SUFFIXES[fmt]]
+    base = COLLECTION_CACHE_DIR / key.replace("/", "_")
+    base.parent.mkdir(parents=True, exist_ok=True)
+    part_path = base.with_name(f"{base.name}.part")
+    with TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        download = tmpdir / Path(obj.key).name
+        transfer_files(
+            backend, [(download, obj.key, obj.size, obj.last_modified)], False
+        )
+        if fmt == "plain":
+            shutil.move(download, part_path)
+        elif fmt == "gzip":
+            with gzip.open(download, mode="rb") as src:
+                with open(part_path, mode="wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        else:
+            _download_chunks(
+                backend, key, download, base, part_path, max_concurrency
+            )
+    os.replace(part_path, base)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(base, path)
+
+
+def upload_collection_file(
+    backend: StorageBackend,
+    path: Path,
+    key: str,
+    fmt: str,
+    max_concurrency: int = 10,
+):
+    """Uploads a collection file in a format.
+
+    Collections uploaded in a compressed format are also uploaded as-is for
+    versions of djtools which only read that. Afterwards, the objects the
+    collection no longer consists of are deleted so that uploads don't
+    accumulate objects.
+
+    Args:
+        backend: StorageBackend to upload to.
+        path: Path of the collection.
+        key: Key of the collection.
+        fmt: "plain", "gzip", or "delta".
+        max_concurrency: Maximum number of concurrent transfers.
+    """
+    digests = set()
+    with TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        previous_digests = _read_index(backend, key, tmpdir)
+        upload = tmpdir / Path(key + SUFFIXES[fmt]).name
+        if fmt == "gzip":
+            with open(path, mode="rb") as src:
+                with gzip.open(upload, mode="wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        elif fmt == "delta":
+            digests = _upload_chunks(
+                backend, path, key, upload, max_concurrency
+            )
+        # The collection is uploaded as-is first so that downloads read the
+        # compressed formats. For delta-encoded collections, the index is
+        # uploaded last so that it only ever refers to chunks which are
+        # stored.
+        uploads = [(path, key, path.stat().st_size, 0.0)]
+        if fmt != "plain":
+            uploads.append(
+                (upload, key + SUFFIXES[fmt], upload.stat().st_size, 0.0)
+            )
+        for upload in uploads:
+            transfer_files(backend, [upload], True)
+    _remove_stale_objects(backend, key, fmt, digests | previous_digests)
+
+
+def _read_index(backend: StorageBackend, key: str, tmpdir: Path) -> Set[str]:
+    """Reads the digests of the chunks the index of a collection refers to.
+
+    Args:
+        backend: StorageBackend the collection is stored in.
+        key: Key of the collection.
+        tmpdir: Directory to download the index to.
+
+    Returns:
+        Digests of the chunks or an empty set if there's no index.
+    """
+    index_key = key + SUFFIXES["delta"]
+    objects = [
+        obj
+        for obj in backend.list_objects(key, recursive=False)
+        if obj.key == index_key
+    ]
+    if not objects:
+        return set()
+    index = tmpdir / f"previous{SUFFIXES['delta']}"
+    transfer_files(
+        backend,
+        [(index, index_key, objects[0].size, objects[0].last_modified)],
+        False,
+    )
+
+    return set(gzip.decompress(index.read_bytes()).decode().split())
+
+
+def _remove_stale_objects(
+    backend: StorageBackend, key: str, fmt: str, digests: Set[str]
+):
+    """Deletes the objects of a collection which its last upload doesn't use.
+
+    These are the objects of the collection in the other compressed format
+    and the chunks which aren't referred to. The collection stored as-is is
+    never deleted. Failing to delete them is only logged since the collection
+    itself was uploaded.
+
+    Args:
+        backend: StorageBackend the collection is stored in.
+        key: Key of the collection.
+        fmt: Format the collection was last uploaded in.
+        digests: Digests of the chunks which are still referred to.
+    """
+    other_formats = {
+        key + suffix
+        for other, suffix in SUFFIXES.items()
+        if other not in (fmt, "plain")
+    }
+    try:
+        stale = [
+            obj.key
+            for obj in backend.list_objects(key, recursive=False)
+            if obj.key in other_formats
+        ] + [
+            obj.key
+            for obj in backend.list_objects(f"{key}.chunks/")
+            if obj.key[len(key) + len(".chunks/") : -len(".gz")] not in digests
+        ]
+        if stale:
+            logger.info(
+                f"Removing {len(stale)} stale objects of {backend.url(key)}"
+            )
+            backend.delete_objects(stale)
+    except Exception as exc:
+        logger.warning(
+            f"Failed to remove the stale objects of {backend.url(key)}: {exc}"
+        )
+
+
+def _download_chunks(
+    backend: StorageBackend,
+    key: str,
+    index: Path,
+    base: Path,
+    path: Path,
+    max_concurrency: int = 10,
+):
+    """Assembles a delta-encoded collection file from its chunks.
+
+    Chunks of the last downloaded copy of the collection are reused and only
+    the rest are downloaded.
+
+    Args:
+        backend: StorageBackend to download from.
+        key: Key of the collection.
+        index: Path of the downloaded index of the collection.
+        base: Path of the last downloaded copy of the collection.
+        path: Path to write the collection to.
+        max_concurrency: Maximum number of concurrent transfers.
+    """
+    digests = gzip.decompress(index.read_bytes()).decode().split()
+    base.touch(exist_ok=True)
+    cached = {chunk.digest: chunk for chunk in chunk_file(base)}
+    missing = set(digests) - cached.keys()
+    chunks = {
+        obj.key: obj
+        for obj in backend.list_objects(f"{key}.chunks/")
+        if obj.key[len(key) + len(".chunks/") : -len(".gz")] in missing
+    }
+    logger.info(
+        f"Downloading {len(missing)} of {len(set(digests))} chunks of "
+        f"{backend.url(key)}"
+    )
+    transfer_files(
+        backend,
+        [
+            (index.parent / Path(obj.key).name, obj.key, obj.size, 0.0)
+            for obj in chunks.values()
+        ],
+        False,
+        max_concurrency,
+    )
+    with open(base, mode="rb") as src, open(path, mode="wb") as dst:
+        for digest in digests:
+            if digest in cached:
+                src.seek(cached[digest].offset)
+                dst.write(src.read(cached[digest].size))
+            else:
+                dst.write(
+                    gzip.decompress(
+                        (index.parent / f"{digest}.gz").read_bytes()
+                    )
+                )
+
+
+def _upload_chunks(
+    backend: StorageBackend,
+    path: Path,
+    key: str,
+    index: Path,
+    max_concurrency: int = 10,
+) -> Set[str]:
+    """Uploads the chunks of a collection file which aren't already stored.
+
+    Args:
+        backend: StorageBackend to upload to.
+        path: Path of the collection.
+        key: Key of the collection.
+        index: Path to write the index of the collection to.
+        max_concurrency: Maximum number of concurrent transfers.
+
+    Returns:
+        Digests of the chunks of the collection.
+    """
+    chunks = list(chunk_file(path))
+    stored = {
+        obj.key[len(key) + len(".chunks/") : -len(".gz")]
+        for obj in backend.list_objects(f"{key}.chunks/")
+    }
+    missing = {
+        chunk.digest: chunk for chunk in chunks if chunk.digest not in stored
+    }
+    with open(path, mode="rb") as src:
+        for digest, chunk in missing.items():
+            src.seek(chunk.offset)
+            (index.parent / f"{digest}.gz").write_bytes(
+                gzip.compress(src.read(chunk.size))
+            )
+    logger.info(f"Uploading {len(missing)} of {len(chunks)} chunks of {path}")
+    transfer_files(
+        backend,
+        [
+            (
+                index.parent / f"{digest}.gz",
+                f"{key}.chunks/{digest}.gz",
+                (index.parent / f"{digest}.gz").stat().st_size,
+                0.0,
+            )
+            for digest in missing
+        ],
+        True,
+        max_concurrency,
+    )
+    index.write_bytes(
+        gzip.compress(
+            "".join(f"{chunk.digest}\n" for chunk in chunks).encode()
+        )
+    )
+
+    return {chunk.digest for chunk in chunks}
@@ -9,6 +9,9 @@ import os
 from pathlib import Path
 from typing import List, Optional
 
+from pydantic import NonNegativeInt, PositiveInt
+from typing_extensions import Literal
+
 from djtools.configs.config import BaseConfig
 
 
@@ -20,6 +23,7 @@ class SyncConfig(BaseConfig):
 
     AWS_PROFILE: str = "default"
     AWS_USE_DATE_MODIFIED: bool = False
+    BEATCLOUD_MANIFEST_TTL: NonNegativeInt = 3600
     BUCKET_URL: str = ""
     DISCORD_URL: str = ""
     DOWNLOAD_COLLECTION: bool = False
@@ -29,7 +33,9 @@ class SyncConfig(BaseConfig):
     DOWNLOAD_SPOTIFY_PLAYLIST: str = ""
     DRYRUN: bool = False
     IMPORT_USER: str = ""
+    SYNC_MAX_CONCURRENCY: PositiveInt = 10
     UPLOAD_COLLECTION: bool = False
+    UPLOAD_COLLECTION_FORMAT: Literal["delta", "gzip", "plain"] = "plain"
     UPLOAD_EXCLUDE_DIRS: List[Path] = []
     UPLOAD_INCLUDE_DIRS: List[Path] = []
     UPLOAD_MUSIC: bool = False
@@ -1,32 +1,88 @@
 """This module contains helper functions used by the "sync_operations" module.
-Helper functions include formatting "aws s3 sync" commands, formatting the
-output of "aws s3 sync" commands, posting uploaded tracks to Discord, and
-modifying IMPORT_USER's collection to point to tracks located at "USB_PATH".
+Helper functions include building sync commands, running sync commands and
+formatting their results, posting uploaded tracks to Discord, and modifying
+IMPORT_USER's collection to point to tracks located at "USB_PATH".
 """
 
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from itertools import groupby
 import logging
+import os
 from pathlib import Path
-from subprocess import Popen, PIPE, CalledProcessError
-from typing import Optional
+import re
+from typing import Iterator, List, Optional
+from urllib.parse import quote
 
 import requests
 
-from djtools.collection.helpers import PLATFORM_REGISTRY
 from djtools.configs.config import BaseConfig
+from djtools.sync.manifest import (
+    invalidate_cached_objects,
+    list_cached_objects,
+)
+from djtools.sync.storage import get_storage_backend, StorageBackend
+from djtools.sync.transfer import (
+    sync,
+    SyncCommand,
+    TransferStats,
+    upload_path,
+)
 from djtools.utils.helpers import make_path
+from djtools.utils.run_context import get_run_context
 
 
 logger = logging.getLogger(__name__)
+LOCATION_ATTRIBUTE_REGEX = re.compile(r'(?<=\sLocation=")[^"]*')
+
+
+@contextmanager
+def open_storage_backend(config: BaseConfig) -> Iterator[StorageBackend]:
+    """Opens the StorageBackend for "BUCKET_URL".
+
+    During a run, the backend is shared by every operation and closed when the
+    run ends.
+
+    Args:
+        config: Configuration object.
+
+    Yields:
+        StorageBackend for "BUCKET_URL".
+    """
+
+    def open_backend() -> StorageBackend:
+        return get_storage_backend(
+            config.BUCKET_URL,
+            profile=config.AWS_PROFILE,
+            max_concurrency=config.SYNC_MAX_CONCURRENCY,
+        )
+
+    context = get_run_context()
+    if context is not None:
+        yield context.get(
+            (
+                "storage_backend",
+                config.BUCKET_URL,
+                config.AWS_PROFILE,
+                config.SYNC_MAX_CONCURRENCY,
+            ),
+            open_backend,
+            close=lambda backend: backend.close(),
+        )
+        return
+
+    backend = open_backend()
+    try:
+        yield backend
+    finally:
+        backend.close()
 
 
 def parse_sync_command(
-    _cmd: str,
+    _cmd: SyncCommand,
     config: BaseConfig,
-    upload: Optional[bool] = False,
-) -> str:
-    """Appends flags to "aws s3 sync" command. If "*_INCLUDE_DIRS" is
+) -> SyncCommand:
+    """Adds filters and flags to a sync command. If "*_INCLUDE_DIRS" is
         specified, all directories are ignored except those specified. If
         "*_EXCLUDE_DIRS" is specified, all directories are included except
         those specified. Only one of these can be specified at once. If
@@ -35,17 +91,18 @@ def parse_sync_command(
         after that of the destination.
 
     Args:
-        _cmd: Partial "aws s3 sync" command.
+        _cmd: Partial sync command.
         config: Configuration object.
-        upload: Whether uploading or downloading.
 
     Returns:
-        Fully constructed "aws s3 sync" command.
+        Fully constructed sync command.
     """
+    upload = _cmd.upload
+    filters = []
     if (upload and config.UPLOAD_INCLUDE_DIRS) or (
         not upload and config.DOWNLOAD_INCLUDE_DIRS
     ):
-        _cmd.extend(["--exclude", "*"])
+        filters.append(("exclude", "*"))
         directories = map(
             Path,
             getattr(config, f'{"UP" if upload else "DOWN"}LOAD_INCLUDE_DIRS'),
@@ -57,11 +114,11 @@ def parse_sync_command(
                 path = _dir / "*"
             else:
                 path = _dir.parent / path.with_suffix(ext)
-            _cmd.extend(["--include", path.as_posix()])
+            filters.append(("include", path.as_posix()))
     if (upload and config.UPLOAD_EXCLUDE_DIRS) or (
         not upload and config.DOWNLOAD_EXCLUDE_DIRS
     ):
-        _cmd.extend(["--include", "*"])
+        filters.append(("include", "*"))
         directories = map(
             Path,
             getattr(config, f'{"UP" if upload else "DOWN"}LOAD_EXCLUDE_DIRS'),
@@ -73,12 +130,23 @@ def parse_sync_command(
                 path = _dir / "*"
             else:
                 path = _dir.parent / path.with_suffix(ext)
-            _cmd.extend(["--exclude", path.as_posix()])
-    if not config.AWS_USE_DATE_MODIFIED:
-        _cmd.append("--size-only")
-    if config.DRYRUN:
-        _cmd.append("--dryrun")
-    logger.info(" ".join(_cmd))
+            filters.append(("exclude", path.as_posix()))
+    _cmd = _cmd._replace(
+        filters=tuple(filters),
+        size_only=not config.AWS_USE_DATE_MODIFIED,
+        dryrun=config.DRYRUN,
+    )
+    local_dir = _cmd.local_dir.as_posix()
+    remote = f"{config.BUCKET_URL}/{_cmd.prefix}"
+    logger.info(
+        " ".join(
+            [
+                "sync",
+                *([local_dir, remote] if upload else [remote, local_dir]),
+                *_cmd.flags(),
+            ]
+        )
+    )
 
     return _cmd
 
@@ -90,67 +158,108 @@ def rewrite_track_paths(config: BaseConfig, other_user_collection: Path):
     This is done by replacing the "USB_PATH" written by "IMPORT_USER" with the
     "USB_PATH" in "config.yaml".
 
+    The collection is streamed line by line and only the part of each
+    "Location" attribute before "DJ Music" is replaced, so the collection is
+    neither deserialized nor re-serialized.
+
     Args:
         config: Configuration object.
         other_user_collection: Path to another user's collection.
     """
-    music_path = Path("DJ Music")
-    collection = PLATFORM_REGISTRY[config.PLATFORM]["collection"](
-        path=other_user_collection
+    music_dir = quote("DJ Music/")
+    # Quote the new prefix the same way RekordboxTrack.serialize does.
+    new_prefix = re.sub(
+        r"%[0-9A-Z]{2}",
+        lambda x: x.group(0).lower(),
+        ("file://localhost" if os.name == "posix" else "file://localhost/")
+        + quote(
+            f"{(config.USB_PATH / 'DJ Music').as_posix()}/",
+            safe="/,()!+=#;$:",
+        ),
     )
-    for track in collection.get_tracks().values():
-        loc = track.get_location().as_posix()
-        common_path = (
-            music_path / loc.split(str(music_path) + "/", maxsplit=-1)[-1]
-        )
-        track.set_location(config.USB_PATH / common_path)
-    collection.serialize(path=other_user_collection)
 
+    def _rewrite(match: re.Match) -> str:
+        location = match.group()
+        index = location.rfind(music_dir)
+        if index == -1:
+            return location
 
-def run_sync(_cmd: str, bucket_url: str) -> str:
-    """Runs subprocess for "aws s3 sync" command. Output is collected and
-        formatted such that uploaded tracks are grouped by their directories.
+        return new_prefix + location[index + len(music_dir) :]
+
+    part_path = other_user_collection.with_name(
+        f"{other_user_collection.name}.part"
+    )
+    with (
+        open(
+            other_user_collection, mode="r", encoding="utf-8", newline=""
+        ) as src,
+        open(part_path, mode="w", encoding="utf-8", newline="") as dst,
+    ):
+        for line in src:
+            dst.write(LOCATION_ATTRIBUTE_REGEX.sub(_rewrite, line))
+    os.replace(part_path, other_user_collection)
+
+
+def run_sync(
+    _cmd: SyncCommand, config: BaseConfig, keys: Optional[List[str]] = None
+) -> str:
+    """Runs a sync command. Uploaded tracks are formatted such that they're
+        grouped by their directories.
 
     Args:
-        _cmd: "aws s3 sync" command.
-        bucket_url: URL to an AWS S3 API compliant bucket.
+        _cmd: Sync command.
+        config: Configuration object.
+        keys: Keys, relative to the prefix, of the only tracks to sync.
 
     Raises:
-        CalledProcessError: raised if "aws s3 sync" command fails.
-        RuntimeError: raised if any other exception occurs while syncing.
+        RuntimeError: raised if any exception occurs while syncing.
 
     Returns:
         Formatted list of uploaded tracks; tracks are grouped by directory.
     """
-    line = ""
-    termination_chars = {"\n", "\r"}
-    tracks = []
+    stats = TransferStats()
     try:
-        with Popen(_cmd, stdout=PIPE) as proc:
-            while True:
-                try:
-                    char = proc.stdout.read(1).decode()
-                except UnicodeDecodeError:
-                    char = ""
-                if char == "" and proc.poll() is not None:
-                    break
-                if char not in termination_chars:
-                    line += char
-                    continue
-                print(line, end=char)
-                if char != "\r" and "upload: " in line:
-                    line = line.split(f"{bucket_url}/dj/music/")[-1]
-                    tracks.append(Path(line))
-                line = ""
-            proc.stdout.close()
-            return_code = proc.wait()
-        if return_code:
-            raise CalledProcessError(return_code, " ".join(_cmd))
+        with open_storage_backend(config) as backend:
+            remote_objects = None
+            if _cmd.dryrun or keys is not None:
+                # Plan dry runs, and syncs of specific tracks, against the
+                # manifest so that, within "BEATCLOUD_MANIFEST_TTL", they
+                # don't list the Beatcloud.
+                remote_objects = list_cached_objects(
+                    backend,
+                    _cmd.prefix,
+                    config.BEATCLOUD_MANIFEST_TTL,
+                    config.SYNC_MAX_CONCURRENCY,
+                )
+            synced = sync(
+                backend,
+                _cmd,
+                config.SYNC_MAX_CONCURRENCY,
+                remote_objects,
+                keys,
+                stats.add,
+            )
+            if _cmd.upload and synced and not _cmd.dryrun:
+                invalidate_cached_objects(
+                    backend,
+                    _cmd.prefix,
+                    [_cmd.prefix + key for key in synced],
+                )
     except Exception as exc:
+        if stats.failed:
+            logger.info(stats.summary())
         msg = f"Failure while syncing: {exc}"
         logger.critical(msg)
         raise RuntimeError(msg) from exc
 
+    if stats.files:
+        logger.info(stats.summary())
+
+    tracks = (
+        [Path(key) for key in synced]
+        if _cmd.upload and not _cmd.dryrun
+        else []
+    )
     new_music = ""
     for group_id, group in groupby(
         sorted(tracks, key=lambda x: x.parent.as_posix()),
@@ -177,18 +286,21 @@ def upload_log(config: BaseConfig, log_file: Path):
         config: Configuration object.
         log_file: Path to log file.
     """
-    if not config.AWS_PROFILE:
-        logger.warning(
-            "Logs cannot be backed up without specifying the config option "
-            "AWS_PROFILE"
-        )
-        return
+    for option in ["AWS_PROFILE", "BUCKET_URL"]:
+        if not getattr(config, option):
+            logger.warning(
+                "Logs cannot be backed up without specifying the config "
+                f"option {option}"
+            )
+            return
 
-    dst = f"{config.BUCKET_URL}/dj/logs/{config.USER}/{log_file.name}"
-    cmd = ["aws", "s3", "cp", log_file.as_posix(), dst]
-    logger.info(" ".join(cmd))
-    with Popen(cmd) as proc:
-        proc.wait()
+    try:
+        with open_storage_backend(config) as backend:
+            upload_path(
+                backend, log_file, f"dj/logs/{config.USER}/{log_file.name}"
+            )
+    except Exception as exc:
+        logger.error(f"Failed to back up {log_file}: {exc}")
 
     now = datetime.now()
     one_day = timedelta(days=1)
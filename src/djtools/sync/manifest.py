@@ -0,0 +1,273 @@
+"""This module contains the manifest: a local SQLite cache of the listing of a
+StorageBackend.
+
+Listing every object in the Beatcloud is slow, so the listing is cached per
+user prefix (e.g. "dj/music/aweeeezy/") along with the time it was listed.
+Refreshing the manifest only re-lists the prefixes whose listing is older than
+a TTL, and each listing is streamed into the cache rather than buffered.
+"""
+
+from contextlib import closing
+from itertools import groupby
+import logging
+from pathlib import Path
+import sqlite3
+import time
+from typing import Iterable, Iterator, List, Tuple
+
+from djtools.sync.storage import (
+    list_objects_concurrently,
+    ObjectInfo,
+    StorageBackend,
+)
+
+
+logger = logging.getLogger(__name__)
+MANIFEST_PATH = Path(__file__).parent / ".beatcloud_manifest.db"
+# Seconds to wait for another connection's transaction to finish.
+SQLITE_TIMEOUT = 30.0
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    url TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prefixes (
+    url TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS listings (
+    url TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL
+);
+"""
+
+
+class Manifest:
+    """SQLite cache of the objects in StorageBackends.
+
+    Objects and prefixes are stored by URL so that a single manifest can cache
+    the listings of multiple StorageBackends.
+    """
+
+    def __init__(self, path: Path):
+        """Constructor.
+
+        Args:
+            path: Path to the SQLite database.
+        """
+        self._connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+        # Operations which run concurrently may refresh the manifest at the
+        # same time, so readers mustn't block the writer.
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the connection to the SQLite database."""
+        self._connection.close()
+
+    def invalidate(
+        self, backend: StorageBackend, prefix: str, keys: Iterable[str]
+    ):
+        """Marks the prefixes under a prefix that contain any of the keys as
+            stale.
+
+        This is used after objects are uploaded so that the next refresh
+        re-lists the prefixes they were uploaded to.
+
+        Args:
+            backend: StorageBackend the objects are stored in.
+            prefix: Prefix, ending with "/", of the prefixes to invalidate.
+            keys: Keys of the objects which changed.
+        """
+        urls = {
+            backend.url(key[: key.index("/", len(prefix)) + 1])
+            for key in keys
+            if "/" in key[len(prefix) :]
+        }
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO prefixes VALUES (?, 0)",
+                ((url,) for url in urls),
+            )
+
+    def list_objects(
+        self, backend: StorageBackend, prefix: str
+    ) -> Iterator[ObjectInfo]:
+        """Lists the cached objects whose key starts with a prefix.
+
+        Args:
+            backend: StorageBackend the objects were listed from.
+            prefix: Prefix of the keys to list.
+
+        Returns:
+            Iterator of ObjectInfo sorted by key.
+        """
+        root_length = len(backend.url(""))
+        cursor = self._connection.execute(
+            "SELECT url, size, last_modified, etag FROM objects "
+            "WHERE url >= ? AND url < ? ORDER BY url",
+            _url_range(backend.url(prefix)),
+        )
+        for url, size, last_modified, etag in cursor:
+            yield ObjectInfo(url[root_length:], size, last_modified, etag)
+
+    def refresh(
+        self,
+        backend: StorageBackend,
+        prefix: str,
+        ttl: float,
+        max_concurrency: int = 10,
+    ) -> int:
+        """Re-lists the prefixes under a prefix that are older than the TTL.
+
+        The prefixes under the prefix are themselves only re-listed once the
+        TTL has passed, so a refresh within the TTL doesn't access the
+        backend. Prefixes which no longer exist are removed from the
+        manifest. Stale prefixes are listed concurrently and each is
+        refreshed in its own transaction, started once it's been listed, so
+        that an interrupted refresh keeps the prefixes that were already
+        refreshed and concurrent refreshes don't hold the database locked.
+
+        Args:
+            backend: StorageBackend to list objects from.
+            prefix: Prefix, ending with "/", of the prefixes to refresh.
+            ttl: Number of seconds a listing is reused for.
+            max_concurrency: Maximum number of concurrent listings.
+
+        Returns:
+            Number of prefixes that were re-listed.
+        """
+        now = time.time()
+        listing = self._connection.execute(
+            "SELECT refreshed_at FROM listings WHERE url = ?",
+            (backend.url(prefix),),
+        ).fetchone()
+        cached = dict(
+            self._connection.execute(
+                "SELECT url, refreshed_at FROM prefixes "
+                "WHERE url >= ? AND url < ?",
+                _url_range(backend.url(prefix)),
+            )
+        )
+        if listing is not None and now - listing[0] < ttl:
+            root_length = len(backend.url(""))
+            prefixes = {url: url[root_length:] for url in cached}
+        else:
+            prefixes = {
+                backend.url(key): key for key in backend.list_prefixes(prefix)
+            }
+            with self._connection:
+                for url in cached.keys() - prefixes.keys():
+                    self._forget(url)
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO listings VALUES (?, ?)",
+                    (backend.url(prefix), now),
+                )
+
+        stale = sorted(
+            (url, key)
+            for url, key in prefixes.items()
+            if url not in cached or now - cached[url] >= ttl
+        )
+        # The listing is sorted so the objects of each stale prefix are
+        # contiguous.
+        groups = groupby(
+            list_objects_concurrently(
+                backend, [key for _, key in stale], max_concurrency
+            ),
+            key=lambda obj: obj.key[: obj.key.index("/", len(prefix)) + 1],
+        )
+        group = next(groups, None)
+        for url, key in stale:
+            # The prefix is listed before its transaction is started so that
+            # the database isn't locked while waiting on the backend.
+            objects = []
+            if group is not None and group[0] == key:
+                objects = [
+                    (
+                        backend.url(obj.key),
+                        obj.size,
+                        obj.etag,
+                        obj.last_modified,
+                    )
+                    for obj in group[1]
+                ]
+                group = next(groups, None)
+            with self._connection:
+                self._forget(url)
+                self._connection.executemany(
+                    "INSERT INTO objects VALUES (?, ?, ?, ?)", objects
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO prefixes VALUES (?, ?)",
+                    (url, now),
+                )
+
+        return len(stale)
+
+    def _forget(self, url: str):
+        """Removes a prefix, and the objects under it, from the manifest.
+
+        Args:
+            url: URL of the prefix.
+        """
+        self._connection.execute(
+            "DELETE FROM objects WHERE url >= ? AND url < ?", _url_range(url)
+        )
+        self._connection.execute("DELETE FROM prefixes WHERE url = ?", (url,))
+
+
+def _url_range(url: str) -> Tuple[str, str]:
+    """Gets the bounds of the URLs which start with a URL.
+
+    Args:
+        url: URL to get the range of.
+
+    Returns:
+        Inclusive lower bound and exclusive upper bound.
+    """
+    return url, url[:-1] + chr(ord(url[-1]) + 1)
+
+
+def invalidate_cached_objects(
+    backend: StorageBackend, prefix: str, keys: Iterable[str]
+):
+    """Invalidates the prefixes in the manifest that contain any of the keys.
+
+    Args:
+        backend: StorageBackend the objects are stored in.
+        prefix: Prefix, ending with "/", of the prefixes to invalidate.
+        keys: Keys of the objects which changed.
+    """
+    with closing(Manifest(MANIFEST_PATH)) as manifest:
+        manifest.invalidate(backend, prefix, keys)
+
+
+def list_cached_objects(
+    backend: StorageBackend,
+    prefix: str,
+    ttl: float,
+    max_concurrency: int = 10,
+) -> List[ObjectInfo]:
+    """Lists the objects under a prefix from the manifest.
+
+    Prefixes whose listing is older than the TTL are refreshed first.
+
+    Args:
+        backend: StorageBackend to list objects from.
+        prefix: Prefix, ending with "/", of the keys to list.
+        ttl: Number of seconds a listing is reused for.
+        max_concurrency: Maximum number of concurrent listings.
+
+    Returns:
+        ObjectInfo sorted by key.
+    """
+    with closing(Manifest(MANIFEST_PATH)) as manifest:
+        refreshed = manifest.refresh(backend, prefix, ttl, max_concurrency)
+        if refreshed:
+            logger.info(f"Refreshed the listing of {refreshed} users")
+
+        return list(manifest.list_objects(backend, prefix))
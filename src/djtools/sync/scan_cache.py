@@ -0,0 +1,217 @@
+"""This module contains the scan cache: a local SQLite cache of the files in a
+library of tracks, such as the "DJ Music" folder on "USB_PATH".
+
+Adding, removing, or renaming an entry in a directory updates the
+directory's modified time, so a scan only re-lists the directories whose
+modified time changed since the last scan and reuses the cached files of the
+rest. Directories are scanned concurrently since most of the time is spent
+waiting on the file system.
+
+Modifying a file in place (e.g. editing its tags) doesn't update the
+modified time of its directory, so scans which need up-to-date file sizes and
+modified times, such as those planning uploads, should be forced.
+
+Like any cache keyed on modified times, entries added within the resolution of
+the file system's timestamps (two seconds on FAT) of a scan could go unnoticed,
+so directories modified that close to their last scan are always re-listed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import closing
+from fnmatch import fnmatch
+import os
+from pathlib import Path
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from djtools.sync.storage import ObjectInfo
+
+
+SCAN_CACHE_PATH = Path(__file__).parent / ".scan_cache.db"
+TIMESTAMP_RESOLUTION = 2.0
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+"""
+
+
+class ScanCache:
+    """SQLite cache of the files under directories."""
+
+    def __init__(self, path: Path):
+        """Constructor.
+
+        Args:
+            path: Path to the SQLite database.
+        """
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the connection to the SQLite database."""
+        self._connection.close()
+
+    def scan(
+        self,
+        root: Path,
+        force: bool = False,
+        max_workers: Optional[int] = None,
+    ) -> Dict[str, ObjectInfo]:
+        """Lists the files under a directory.
+
+        Args:
+            root: Directory to list.
+            force: Re-list every directory rather than only those whose
+                modified time changed.
+            max_workers: Maximum number of directories to list concurrently.
+
+        Returns:
+            ObjectInfo of each file keyed by its path relative to the root.
+        """
+        now = time.time()
+        root_key = Path(root).resolve().as_posix()
+        # Paths under the root sort between "{root}/" and "{root}0".
+        path_range = (f"{root_key}/", f"{root_key}0")
+        cached_mtimes = {
+            path: (mtime, scanned_at)
+            for path, mtime, scanned_at in self._connection.execute(
+                "SELECT path, mtime, scanned_at FROM directories "
+                "WHERE path = ? OR (path >= ? AND path < ?)",
+                (root_key, *path_range),
+            )
+        }
+        cached_files: Dict[str, List[Tuple[str, int, float]]] = {}
+        for path, directory, size, mtime in self._connection.execute(
+            "SELECT path, directory, size, mtime FROM files "
+            "WHERE path >= ? AND path < ?",
+            path_range,
+        ):
+            cached_files.setdefault(directory, []).append((path, size, mtime))
+        cached_children: Dict[str, List[str]] = {}
+        for directory in cached_mtimes:
+            if directory != root_key:
+                cached_children.setdefault(
+                    directory.rsplit("/", maxsplit=1)[0], []
+                ).append(directory)
+
+        def _scan(directory: str):
+            try:
+                mtime = os.stat(directory).st_mtime
+            except FileNotFoundError:
+                return directory, None, [], []
+            cached_mtime, scanned_at = cached_mtimes.get(directory, (None, 0))
+            if (
+                not force
+                and cached_mtime == mtime
+                and mtime < scanned_at - TIMESTAMP_RESOLUTION
+            ):
+                return directory, mtime, cached_children.get(directory), None
+            files, subdirectories = [], []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    path = f"{directory}/{entry.name}"
+                    # Symlinked directories aren't followed, as with rglob,
+                    # so that a symlink loop doesn't recurse forever.
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files.append((path, stat.st_size, stat.st_mtime))
+
+            return directory, mtime, subdirectories, files
+
+        mtimes, files, rescanned = {}, {}, []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(_scan, root_key)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory, mtime, subdirectories, dir_files = (
+                        future.result()
+                    )
+                    if mtime is None:
+                        continue
+                    mtimes[directory] = mtime
+                    if dir_files is None:
+                        dir_files = cached_files.get(directory, [])
+                    else:
+                        rescanned.append((directory, dir_files))
+                    files.update((path, info) for path, *info in dir_files)
+                    pending.update(
+                        executor.submit(_scan, subdirectory)
+                        for subdirectory in subdirectories or []
+                    )
+
+        with self._connection:
+            for directory in cached_mtimes.keys() - mtimes.keys():
+                self._forget(directory)
+            for directory, dir_files in rescanned:
+                self._forget(directory)
+                self._connection.executemany(
+                    "INSERT INTO files VALUES (?, ?, ?, ?)",
+                    (
+                        (path, directory, size, mtime)
+                        for path, size, mtime in dir_files
+                    ),
+                )
+                self._connection.execute(
+                    "INSERT INTO directories VALUES (?, ?, ?)",
+                    (directory, mtimes[directory], now),
+                )
+
+        return {
+            key: ObjectInfo(key, size, mtime)
+            for key, (size, mtime) in sorted(
+                (path[len(root_key) + 1 :], info)
+                for path, info in files.items()
+            )
+        }
+
+    def _forget(self, directory: str):
+        """Removes a directory, and the files in it, from the cache.
+
+        Args:
+            directory: Path of the directory.
+        """
+        self._connection.execute(
+            "DELETE FROM files WHERE directory = ?", (directory,)
+        )
+        self._connection.execute(
+            "DELETE FROM directories WHERE path = ?", (directory,)
+        )
+
+
+def scan_library(
+    path: Path, force: bool = False, pattern: str = "*"
+) -> Dict[str, ObjectInfo]:
+    """Lists the files under a directory using the scan cache.
+
+    Args:
+        path: Directory to list.
+        force: Re-list every directory rather than only those whose modified
+            time changed.
+        pattern: Glob pattern the names of the listed files must match.
+
+    Returns:
+        ObjectInfo of each file keyed by its path relative to the directory.
+    """
+    with closing(ScanCache(SCAN_CACHE_PATH)) as scan_cache:
+        files = scan_cache.scan(path, force=force)
+
+    return {
+        key: obj
+        for key, obj in files.items()
+        if fnmatch(key.rsplit("/", maxsplit=1)[-1], pattern)
+    }
@@ -0,0 +1,601 @@
+"""This module contains the storage backends that the Beatcloud is accessed
+through.
+
+StorageBackend is the interface the transfer engine uses to list, upload,
+download, and copy objects. S3Backend implements it for AWS S3 API compliant buckets
+(i.e. "s3://" URLs) while LocalBackend implements it for a local directory
+(i.e. "file://" URLs) which makes it possible to use and test syncing without
+network access.
+
+list_objects_concurrently lists large prefixes, like "dj/music/", by listing
+the "directories" under them concurrently.
+
+compute_etag computes the ETag S3 assigns to a file uploaded by S3Backend so
+that local files can be compared with objects without downloading them.
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import heapq
+from itertools import chain, islice
+import os
+from pathlib import Path
+from queue import Queue
+import shutil
+from threading import Lock
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import boto3
+from boto3.s3.transfer import create_transfer_manager, TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+
+# Maximum number of objects S3 deletes in a single request.
+DELETE_BATCH_SIZE = 1000
+# Objects are handed from the listing threads to the consumer in chunks to
+# limit synchronization overhead.
+LISTING_CHUNK_SIZE = 1000
+# Maximum number of chunks buffered per partition by list_objects_concurrently.
+LISTING_BUFFERED_CHUNKS = 2
+
+
+class ObjectInfo(NamedTuple):
+    """Metadata of an object in a storage backend or a local file."""
+
+    key: str
+    size: int
+    last_modified: float
+    etag: Optional[str] = None
+
+
+class StorageBackend(ABC):
+    """Interface for listing, uploading, and downloading objects."""
+
+    def __init__(self, url: str):
+        """Constructor.
+
+        Args:
+            url: URL of the storage location.
+        """
+        self._url = url.rstrip("/")
+
+    def close(self):
+        """Releases any resources held by this backend."""
+
+    @abstractmethod
+    def copy_object(self, src_key: str, dst_key: str):
+        """Copies an object without transferring it through this machine.
+
+        Args:
+            src_key: Key of the object to copy.
+            dst_key: Key of the object to copy to.
+        """
+
+    @abstractmethod
+    def delete_objects(self, keys: Iterable[str]):
+        """Deletes objects.
+
+        Keys which don't exist are ignored.
+
+        Args:
+            keys: Keys of the objects to delete.
+        """
+
+    @abstractmethod
+    def download_file(self, key: str, path: Path):
+        """Downloads an object to a file.
+
+        Args:
+            key: Key of the object to download.
+            path: Path to write the object to.
+        """
+
+    @abstractmethod
+    def get_etag(self, key: str) -> Optional[str]:
+        """Gets the ETag of an object.
+
+        Args:
+            key: Key of the object.
+
+        Returns:
+            ETag of the object, as computed by compute_etag, or None if the
+            object doesn't exist.
+        """
+
+    @abstractmethod
+    def list_objects(
+        self, prefix: str, recursive: bool = True
+    ) -> Iterator[ObjectInfo]:
+        """Lists the objects whose key starts with a prefix.
+
+        Args:
+            prefix: Prefix of the keys to list.
+            recursive: Whether to include the objects in the "directories"
+                under the prefix.
+
+        Returns:
+            Iterator of ObjectInfo sorted by key.
+        """
+
+    @abstractmethod
+    def list_prefixes(self, prefix: str) -> Iterator[str]:
+        """Lists the "directories" directly under a prefix.
+
+        Args:
+            prefix: Prefix, ending with "/", to list the sub-prefixes of.
+
+        Returns:
+            Iterator of sub-prefixes, each ending with "/", sorted by key.
+        """
+
+    @abstractmethod
+    def upload_file(self, path: Path, key: str):
+        """Uploads a file as an object.
+
+        Args:
+            path: Path of the file to upload.
+            key: Key of the object to upload to.
+        """
+
+    def url(self, key: str) -> str:
+        """Gets the URL of an object.
+
+        Args:
+            key: Key of the object.
+
+        Returns:
+            URL of the object.
+        """
+        return f"{self._url}/{key}"
+
+
+class LocalBackend(StorageBackend):
+    """StorageBackend implementation for a local directory."""
+
+    def __init__(self, url: str):
+        """Constructor.
+
+        Args:
+            url: "file://" URL of the directory to store objects in.
+        """
+        super().__init__(url)
+        self._root = Path(url2pathname(urlparse(url).path))
+
+    def copy_object(self, src_key: str, dst_key: str):
+        """Copies an object without transferring it through this machine.
+
+        Args:
+            src_key: Key of the object to copy.
+            dst_key: Key of the object to copy to.
+        """
+        dest = self._root / dst_key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self._root / src_key, dest)
+
+    def delete_objects(self, keys: Iterable[str]):
+        """Deletes objects.
+
+        Keys which don't exist are ignored.
+
+        Args:
+            keys: Keys of the objects to delete.
+        """
+        for key in keys:
+            (self._root / key).unlink(missing_ok=True)
+
+    def download_file(self, key: str, path: Path):
+        """Downloads an object to a file.
+
+        Args:
+            key: Key of the object to download.
+            path: Path to write the object to.
+        """
+        shutil.copyfile(self._root / key, path)
+
+    def get_etag(self, key: str) -> Optional[str]:
+        """Gets the ETag of an object.
+
+        Args:
+            key: Key of the object.
+
+        Returns:
+            ETag of the object, as computed by compute_etag, or None if the
+            object doesn't exist.
+        """
+        try:
+            return compute_etag(self._root / key)
+        except FileNotFoundError:
+            return None
+
+    def list_objects(
+        self, prefix: str, recursive: bool = True
+    ) -> Iterator[ObjectInfo]:
+        """Lists the objects whose key starts with a prefix.
+
+        Args:
+            prefix: Prefix of the keys to list.
+            recursive: Whether to include the objects in the "directories"
+                under the prefix.
+
+        Returns:
+            Iterator of ObjectInfo sorted by key.
+        """
+        # Only walk the deepest directory that contains every matching key.
+        directory = self._root / prefix.rsplit("/", maxsplit=1)[0]
+        objects = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                key = path.relative_to(self._root).as_posix()
+                if not key.startswith(prefix):
+                    continue
+                stat = path.stat()
+                objects.append(ObjectInfo(key, stat.st_size, stat.st_mtime))
+            if not recursive:
+                break
+
+        yield from sorted(objects)
+
+    def list_prefixes(self, prefix: str) -> Iterator[str]:
+        """Lists the "directories" directly under a prefix.
+
+        Args:
+            prefix: Prefix, ending with "/", to list the sub-prefixes of.
+
+        Returns:
+            Iterator of sub-prefixes, each ending with "/", sorted by key.
+        """
+        directory = self._root / prefix
+        if not directory.is_dir():
+            return
+        yield from sorted(
+            f"{prefix}{path.name}/"
+            for path in directory.iterdir()
+            if path.is_dir()
+        )
+
+    def upload_file(self, path: Path, key: str):
+        """Uploads a file as an object.
+
+        Args:
+            path: Path of the file to upload.
+            key: Key of the object to upload to.
+        """
+        dest = self._root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Like S3, the last modified time of the object is the time it was
+        # uploaded rather than that of the file.
+        shutil.copyfile(path, dest)
+
+
+class S3Backend(StorageBackend):
+    """StorageBackend implementation for AWS S3 API compliant buckets.
+
+    A single client, and therefore a single connection pool, is shared by all
+    the transfers. Transfers are run by a shared transfer manager which splits
+    large files into concurrent multipart transfers.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        profile: Optional[str] = None,
+        max_concurrency: int = 10,
+    ):
+        """Constructor.
+
+        Args:
+            url: "s3://" URL of the bucket and, optionally, a key prefix.
+            profile: Name of the AWS profile to use.
+            max_concurrency: Maximum number of concurrent requests.
+        """
+        super().__init__(url)
+        parsed_url = urlparse(url)
+        self._bucket = parsed_url.netloc
+        self._key_prefix = parsed_url.path.strip("/")
+        if self._key_prefix:
+            self._key_prefix += "/"
+        session = boto3.session.Session(profile_name=profile or None)
+        self._client = session.client(
+            "s3", config=Config(max_pool_connections=max_concurrency)
+        )
+        self._transfer_manager = create_transfer_manager(
+            self._client, TransferConfig(max_concurrency=max_concurrency)
+        )
+
+    def close(self):
+        """Waits for in-progress transfers and shuts down the manager."""
+        self._transfer_manager.shutdown()
+
+    def copy_object(self, src_key: str, dst_key: str):
+        """Copies an object without transferring it through this machine.
+
+        Args:
+            src_key: Key of the object to copy.
+            dst_key: Key of the object to copy to.
+        """
+        self._transfer_manager.copy(
+            {"Bucket": self._bucket, "Key": self._key_prefix + src_key},
+            self._bucket,
+            self._key_prefix + dst_key,
+        ).result()
+
+    def delete_objects(self, keys: Iterable[str]):
+        """Deletes objects.
+
+        Keys which don't exist are ignored.
+
+        Args:
+            keys: Keys of the objects to delete.
+
+        Raises:
+            OSError: Every object must be deleted.
+        """
+        keys = iter(keys)
+        while True:
+            batch = list(islice(keys, DELETE_BATCH_SIZE))
+            if not batch:
+                break
+            response = self._client.delete_objects(
+                Bucket=self._bucket,
+                Delete={
+                    "Objects": [
+                        {"Key": self._key_prefix + key} for key in batch
+                    ],
+                    "Quiet": True,
+                },
+            )
+            if response.get("Errors"):
+                error = response["Errors"][0]
+                raise OSError(
+                    f"Failed to delete {len(response['Errors'])} objects, "
+                    f"e.g. {error['Key']}: {error['Message']}"
+                )
+
+    def download_file(self, key: str, path: Path):
+        """Downloads an object to a file.
+
+        Args:
+            key: Key of the object to download.
+            path: Path to write the object to.
+        """
+        self._transfer_manager.download(
+            self._bucket, self._key_prefix + key, path.as_posix()
+        ).result()
+
+    def get_etag(self, key: str) -> Optional[str]:
+        """Gets the ETag of an object.
+
+        Args:
+            key: Key of the object.
+
+        Returns:
+            ETag of the object, as computed by compute_etag, or None if the
+            object doesn't exist.
+        """
+        try:
+            response = self._client.head_object(
+                Bucket=self._bucket, Key=self._key_prefix + key
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] == "404":
+                return None
+            raise
+
+        return response["ETag"].strip('"')
+
+    def list_objects(
+        self, prefix: str, recursive: bool = True
+    ) -> Iterator[ObjectInfo]:
+        """Lists the objects whose key starts with a prefix.
+
+        Args:
+            prefix: Prefix of the keys to list.
+            recursive: Whether to include the objects in the "directories"
+                under the prefix.
+
+        Returns:
+            Iterator of ObjectInfo sorted by key.
+        """
+        paginator = self._client.get_paginator("list_objects_v2")
+        kwargs = {} if recursive else {"Delimiter": "/"}
+        for page in paginator.paginate(
+            Bucket=self._bucket, Prefix=self._key_prefix + prefix, **kwargs
+        ):
+            for obj in page.get("Contents", []):
+                yield ObjectInfo(
+                    obj["Key"][len(self._key_prefix) :],
+                    obj["Size"],
+                    obj["LastModified"].timestamp(),
+                    obj["ETag"].strip('"'),
+                )
+
+    def list_prefixes(self, prefix: str) -> Iterator[str]:
+        """Lists the "directories" directly under a prefix.
+
+        Args:
+            prefix: Prefix, ending with "/", to list the sub-prefixes of.
+
+        Returns:
+            Iterator of sub-prefixes, each ending with "/", sorted by key.
+        """
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self._bucket,
+            Prefix=self._key_prefix + prefix,
+            Delimiter="/",
+        ):
+            for common_prefix in page.get("CommonPrefixes", []):
+                yield common_prefix["Prefix"][len(self._key_prefix) :]
+
+    def upload_file(self, path: Path, key: str):
+        """Uploads a file as an object.
+
+        Args:
+            path: Path of the file to upload.
+            key: Key of the object to upload to.
+        """
+        self._transfer_manager.upload(
+            path.as_posix(), self._bucket, self._key_prefix + key
+        ).result()
+
+
+def compute_etag(path: Path) -> str:
+    """Computes the ETag S3 assigns to a file uploaded by S3Backend.
+
+    Files smaller than the multipart threshold are uploaded in a single
+    part and their ETag is the MD5 of the file. Larger files are uploaded in
+    parts and their ETag is the MD5 of the concatenated MD5s of the parts
+    followed by the number of parts.
+
+    Args:
+        path: Path of the file.
+
+    Returns:
+        ETag of the file.
+    """
+    config = TransferConfig()
+    with open(path, mode="rb") as _file:
+        if path.stat().st_size < config.multipart_threshold:
+            return hashlib.md5(_file.read()).hexdigest()
+        digests = [
+            hashlib.md5(chunk).digest()
+            for chunk in iter(
+                lambda: _file.read(config.multipart_chunksize), b""
+            )
+        ]
+
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def get_storage_backend(
+    url: str, profile: Optional[str] = None, max_concurrency: int = 10
+) -> StorageBackend:
+    """Gets the storage backend for a URL.
+
+    Args:
+        url: URL of the storage location.
+        profile: Name of the AWS profile to use.
+        max_concurrency: Maximum number of concurrent requests.
+
+    Raises:
+        ValueError: The URL must be an "s3://" or "file://" URL.
+
+    Returns:
+        StorageBackend for the URL.
+    """
+    scheme = urlparse(url).scheme
+    if scheme == "s3":
+        return S3Backend(url, profile=profile, max_concurrency=max_concurrency)
+    if scheme == "file":
+        return LocalBackend(url)
+
+    raise ValueError(
+        f'Unsupported storage URL "{url}"; it must start with "s3://" or '
+        '"file://"'
+    )
+
+
+def list_objects_concurrently(
+    backend: StorageBackend,
+    prefixes: Iterable[str],
+    max_concurrency: int = 10,
+    depth: int = 1,
+) -> Iterator[ObjectInfo]:
+    """Lists the objects under prefixes by listing their partitions
+        concurrently.
+
+    Each prefix is partitioned into the "directories" "depth" levels beneath
+    it (e.g. the users and then genres under "dj/music/"), which are listed
+    recursively, and the levels above them, which are listed
+    non-recursively. The listing of each partition is streamed as it's paged
+    in, buffering at most LISTING_BUFFERED_CHUNKS chunks of
+    LISTING_CHUNK_SIZE objects per partition, and the partitions are merged
+    into a single stream sorted by key.
+
+    Args:
+        backend: StorageBackend to list objects from.
+        prefixes: Prefixes, ending with "/", of the keys to list.
+        max_concurrency: Maximum number of concurrent listings.
+        depth: Number of levels of "directories" to partition prefixes by.
+
+    Returns:
+        Iterator of ObjectInfo sorted by key.
+    """
+
+    def _stream(prefix: str, recursive: bool) -> Iterator[ObjectInfo]:
+        # Listing starts when the stream is created rather than when it's
+        # first read, so that the partitions are listed concurrently. Each
+        # task lists a single chunk and is only resubmitted while the
+        # partition's buffer has room; listing threads never block on a full
+        # buffer, which could deadlock the partitions that are waiting for a
+        # thread.
+        queue = Queue()
+        lock = Lock()
+        state = {"objects": None, "scheduled": True}
+
+        def _list():
+            try:
+                if state["objects"] is None:
+                    state["objects"] = backend.list_objects(
+                        prefix, recursive=recursive
+                    )
+                chunk = list(islice(state["objects"], LISTING_CHUNK_SIZE))
+            except Exception as exc:
+                queue.put(exc)
+                return
+            queue.put(chunk)
+            if not chunk:
+                return
+            with lock:
+                if queue.qsize() < LISTING_BUFFERED_CHUNKS:
+                    executor.submit(_list)
+                else:
+                    state["scheduled"] = False
+
+        def _read():
+            while True:
+                chunk = queue.get()
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if not chunk:
+                    return
+                with lock:
+                    if not state["scheduled"]:
+                        state["scheduled"] = True
+                        executor.submit(_list)
+                yield from chunk
+
+        executor.submit(_list)
+
+        return _read()
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+        shallow: List[str] = []
+        level = sorted(set(prefixes))
+        for _ in range(depth):
+            shallow.extend(level)
+            level = list(
+                chain.from_iterable(
+                    executor.map(
+                        lambda prefix: list(backend.list_prefixes(prefix)),
+                        level,
+                    )
+                )
+            )
+        streams = [
+            _stream(partition, recursive)
+            for partition, recursive in chain(
+                ((prefix, False) for prefix in shallow),
+                ((prefix, True) for prefix in level),
+            )
+        ]
+
+        yield from heapq.merge(*streams)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
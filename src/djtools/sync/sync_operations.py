@@ -6,19 +6,25 @@ Beatcloud by "IMPORT_USER" before modifying it to point to track locations at
 """
 
 import logging
-from os.path import getmtime
 from pathlib import Path
-from subprocess import Popen
 from typing import List, Optional
 
 from djtools.configs.config import BaseConfig
 from djtools.sync.helpers import (
+    open_storage_backend,
     parse_sync_command,
     rewrite_track_paths,
     run_sync,
     webhook,
 )
+from djtools.sync.collection_storage import (
+    download_collection_file,
+    upload_collection_file,
+)
+from djtools.sync.scan_cache import scan_library
+from djtools.sync.transfer import download_path, SyncCommand, upload_path
 from djtools.utils.check_tracks import compare_tracks
+from djtools.utils.run_context import flush_run_context
 
 
 logger = logging.getLogger(__name__)
@@ -30,15 +36,17 @@ def download_music(
     """This function syncs tracks from the Beatcloud to "USB_PATH".
 
     If "DOWNLOAD_SPOTIFY_PLAYLIST" is set to a playlist name that exists in
-    "spotify_playlists.yaml", then "DOWNLOAD_INCLUDE_DIRS" will be populated
-    with tracks in that playlist that match Beatcloud tracks.
+    "spotify_playlists.yaml", then only the Beatcloud tracks matching tracks in
+    that playlist are downloaded. These are downloaded by key, using the
+    Beatcloud manifest, rather than by listing and filtering the Beatcloud.
 
     Args:
         config: Configuration object.
         beatcloud_tracks: List of track artist - titles from S3.
     """
+    keys = None
+    sync_config = config
     if config.DOWNLOAD_SPOTIFY_PLAYLIST:
-        user = config.DOWNLOAD_SPOTIFY_PLAYLIST.split("Uploads")[0].strip()
         beatcloud_tracks, beatcloud_matches = compare_tracks(
             config,
             beatcloud_tracks=beatcloud_tracks,
@@ -49,34 +57,34 @@ def download_music(
                 "the correct playlist name."
             )
             return beatcloud_tracks
-        config.DOWNLOAD_INCLUDE_DIRS = [
-            (Path(user) / path.as_posix().split(f"{Path(user)}/")[-1])
-            for path in beatcloud_matches
-        ]
-        config.DOWNLOAD_EXCLUDE_DIRS = []
+        keys = sorted({path.as_posix() for path in beatcloud_matches})
+        # The config is shared with concurrent operations, so the directory
+        # filters, which don't apply to downloads by key, are only cleared
+        # on a copy of it.
+        sync_config = config.model_copy(
+            update={"DOWNLOAD_EXCLUDE_DIRS": [], "DOWNLOAD_INCLUDE_DIRS": []}
+        )
 
     logger.info("Downloading track collection...")
     dest = Path(config.USB_PATH) / "DJ Music"
-    glob_path = (Path("**") / "*.*").as_posix()
-    old = {str(p) for p in dest.rglob(glob_path)}
+    old = scan_library(dest, pattern="*.*")
     logger.info(f"Found {len(old)} files at {config.USB_PATH}")
 
     dest.mkdir(parents=True, exist_ok=True)
-    cmd = [
-        "aws",
-        "s3",
-        "sync",
-        f"{config.BUCKET_URL}/dj/music/",
-        dest.as_posix(),
-    ]
-    run_sync(parse_sync_command(cmd, config), config.BUCKET_URL)
-
-    new = {str(p) for p in dest.rglob(glob_path)}
-    difference = sorted(list(new.difference(old)), key=getmtime)
+    cmd = parse_sync_command(SyncCommand(dest, "dj/music/"), sync_config)
+    if keys is not None:
+        logger.info(f"Downloading {len(keys)} tracks matching the playlist")
+    run_sync(cmd, sync_config, keys)
+
+    new = scan_library(dest, pattern="*.*")
+    difference = sorted(
+        (obj for key, obj in new.items() if key not in old),
+        key=lambda obj: obj.last_modified,
+    )
     if difference:
         logger.info(f"Found {len(difference)} new files")
         for diff in difference:
-            logger.info(f"\t{diff}")
+            logger.info(f"\t{dest / diff.key}")
 
     return beatcloud_tracks
 
@@ -85,7 +93,8 @@ def download_collection(config: BaseConfig):
     """This function downloads the collection of "IMPORT_USER".
 
     After downloading "IMPORT_USER"'s collection, the location of all the
-    tracks are modified so that they point to USER's "USB_PATH".
+    tracks are modified so that they point to USER's "USB_PATH". Collection
+    files are downloaded in whichever format "IMPORT_USER" uploaded them.
 
     Args:
         config: Configuration object.
@@ -94,20 +103,24 @@ def download_collection(config: BaseConfig):
         f"Downloading {config.IMPORT_USER}'s {config.PLATFORM} collection..."
     )
     collection_dir = config.COLLECTION_PATH.parent
-    src = (
-        f"{config.BUCKET_URL}/dj/collections/{config.IMPORT_USER}/"
-        f"{config.PLATFORM}_collection"
-    )
+    src = f"dj/collections/{config.IMPORT_USER}/{config.PLATFORM}_collection"
     dst = (
         Path(collection_dir)
         / f"{config.IMPORT_USER}_{config.COLLECTION_PATH.name}"
     )
-    cmd = ["aws", "s3", "cp", src, dst.as_posix()]
-    if config.COLLECTION_PATH.is_dir():
-        cmd.append("--recursive")
-    logger.info(" ".join(cmd))
-    with Popen(cmd) as proc:
-        proc.wait()
+    with open_storage_backend(config) as backend:
+        if config.COLLECTION_PATH.is_dir():
+            download_path(
+                backend,
+                src,
+                dst,
+                recursive=True,
+                max_concurrency=config.SYNC_MAX_CONCURRENCY,
+            )
+        else:
+            download_collection_file(
+                backend, src, dst, config.SYNC_MAX_CONCURRENCY
+            )
     if config.USER != config.IMPORT_USER:
         rewrite_track_paths(config, dst)
 
@@ -122,48 +135,52 @@ def upload_music(config: BaseConfig):
     Args:
         config: Configuration object.
     """
-    hidden_files = set(
-        (Path(config.USB_PATH) / "DJ Music").rglob(
-            (Path("**") / ".*.*").as_posix()
-        )
-    )
+    src = Path(config.USB_PATH) / "DJ Music"
+    hidden_files = scan_library(src, pattern=".*.*")
     if hidden_files:
         logger.info(f"Removed {len(hidden_files)} files...")
-        for _file in hidden_files:
-            logger.info(f"\t{_file}")
-            _file.unlink()
+        for key in hidden_files:
+            logger.info(f"\t{src / key}")
+            (src / key).unlink()
 
     logger.info("Uploading track collection...")
-    src = (Path(config.USB_PATH) / "DJ Music").as_posix()
-    cmd = ["aws", "s3", "sync", src, f"{config.BUCKET_URL}/dj/music/"]
+    cmd = SyncCommand(src, "dj/music/", upload=True)
 
     if config.DISCORD_URL and not config.DRYRUN:
         webhook(
             config.DISCORD_URL,
-            content=run_sync(
-                parse_sync_command(cmd, config, upload=True), config.BUCKET_URL
-            ),
+            content=run_sync(parse_sync_command(cmd, config), config),
         )
     else:
-        run_sync(
-            parse_sync_command(cmd, config, upload=True), config.BUCKET_URL
-        )
+        run_sync(parse_sync_command(cmd, config), config)
 
 
 def upload_collection(config: BaseConfig):
     """This function uploads "COLLECTION_PATH" to the cloud.
 
+    Collection files are uploaded in the "UPLOAD_COLLECTION_FORMAT" format
+    while collection directories are always uploaded as-is.
+
     Args:
         config: Configuration object.
     """
+    # Changes made to the collection during this run must be written first.
+    flush_run_context()
     logger.info(f"Uploading {config.USER}'s {config.PLATFORM} collection...")
-    dst = (
-        f"{config.BUCKET_URL}/dj/collections/{config.USER}/"
-        f"{config.PLATFORM}_collection"
-    )
-    cmd = ["aws", "s3", "cp", config.COLLECTION_PATH.as_posix(), dst]
-    if config.COLLECTION_PATH.is_dir():
-        cmd.append("--recursive")
-    logger.info(" ".join(cmd))
-    with Popen(cmd) as proc:
-        proc.wait()
+    dst = f"dj/collections/{config.USER}/{config.PLATFORM}_collection"
+    with open_storage_backend(config) as backend:
+        if config.COLLECTION_PATH.is_dir():
+            upload_path(
+                backend,
+                config.COLLECTION_PATH,
+                dst,
+                max_concurrency=config.SYNC_MAX_CONCURRENCY,
+            )
+        else:
+            upload_collection_file(
+                backend,
+                config.COLLECTION_PATH,
+                dst,
+                config.UPLOAD_COLLECTION_FORMAT,
+                config.SYNC_MAX_CONCURRENCY,
+            )
@@ -0,0 +1,630 @@
+"""This module contains the transfer engine used to sync files between a local
+directory and a StorageBackend.
+
+Syncing follows the semantics of "aws s3 sync": include and exclude filters
+are evaluated in order with later filters taking precedence, files are
+transferred if they're missing from the destination or differ in size, and,
+unless "size_only" is set, if the local file was modified more recently than
+the remote object.
+
+Uploads of files whose content already exists in the StorageBackend under
+another key, such as renamed or moved tracks, are run as copies of the
+existing objects rather than uploads.
+"""
+
+from collections import defaultdict
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from fnmatch import fnmatch
+import logging
+import os
+from pathlib import Path
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from tqdm import tqdm
+
+from djtools.sync.scan_cache import scan_library
+from djtools.sync.storage import (
+    compute_etag,
+    list_objects_concurrently,
+    ObjectInfo,
+    StorageBackend,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class TransferEvent(NamedTuple):
+    """The outcome of uploading, downloading, or copying a file."""
+
+    operation: str
+    src: str
+    dst: str
+    size: int
+    seconds: float = 0.0
+    dryrun: bool = False
+    error: Optional[str] = None
+
+    def __str__(self) -> str:
+        """Formats the event like the output of "aws s3 sync".
+
+        Returns:
+            Log line for the event.
+        """
+        if self.error is not None:
+            return (
+                f"{self.operation} failed: {self.src} to {self.dst} "
+                f"{self.error}"
+            )
+        dryrun = "(dryrun) " if self.dryrun else ""
+
+        return f"{dryrun}{self.operation}: {self.src} to {self.dst}"
+
+
+class TransferStats:
+    """Aggregates TransferEvents into file counts and throughput."""
+
+    def __init__(self):
+        """Constructor."""
+        self.bytes = 0
+        self.copied = 0
+        self.failed = 0
+        self.files = 0
+        self.operation = "transfer"
+        self._started = time.perf_counter()
+
+    def add(self, event: TransferEvent):
+        """Adds an event to the totals.
+
+        Args:
+            event: Event to add.
+        """
+        if event.dryrun:
+            return
+        # Copies don't transfer any bytes through this machine so they're
+        # counted separately from the throughput.
+        if event.operation != "copy":
+            self.operation = event.operation
+        if event.error is not None:
+            self.failed += 1
+        elif event.operation == "copy":
+            self.copied += 1
+        else:
+            self.files += 1
+            self.bytes += event.size
+
+    def summary(self) -> str:
+        """Summarizes the transfers.
+
+        Returns:
+            Number of files and bytes transferred and the throughput.
+        """
+        seconds = time.perf_counter() - self._started
+        size = tqdm.format_sizeof(self.bytes, "B", 1024)
+        rate = tqdm.format_sizeof(self.bytes / max(seconds, 1e-6), "B/s", 1024)
+        summary = (
+            f"{self.operation.title()}ed {self.files} files ({size}) in "
+            f"{seconds:.1f}s at {rate}"
+        )
+        if self.copied:
+            summary += f"; copied {self.copied} files"
+        if self.failed:
+            summary += f"; {self.failed} failed"
+
+        return summary
+
+
+class SyncCommand(NamedTuple):
+    """A sync between a local directory and a prefix of a StorageBackend."""
+
+    local_dir: Path
+    prefix: str
+    upload: bool = False
+    filters: Tuple[Tuple[str, str], ...] = ()
+    size_only: bool = False
+    dryrun: bool = False
+
+    def flags(self) -> List[str]:
+        """Gets the flags of the equivalent "aws s3 sync" command.
+
+        Returns:
+            Flags of the equivalent "aws s3 sync" command.
+        """
+        flags = []
+        for filter_type, pattern in self.filters:
+            flags.extend([f"--{filter_type}", pattern])
+        if self.size_only:
+            flags.append("--size-only")
+        if self.dryrun:
+            flags.append("--dryrun")
+
+        return flags
+
+
+def copy_objects(
+    backend: StorageBackend,
+    copies: List[Tuple[str, str, int]],
+    max_concurrency: int = 10,
+    dryrun: bool = False,
+    on_event: Optional[Callable[[TransferEvent], None]] = None,
+):
+    """Concurrently copies objects within a StorageBackend.
+
+    A TransferEvent is logged, and passed to "on_event", as each copy
+    completes or fails. The first failure cancels the pending copies.
+
+    Args:
+        backend: StorageBackend to copy objects in.
+        copies: Tuples of the key to copy, the key to copy to, and the size.
+        max_concurrency: Maximum number of concurrent copies.
+        dryrun: Log the copies without running them.
+        on_event: Callback for each TransferEvent.
+    """
+
+    if dryrun:
+        for src_key, dst_key, size in copies:
+            _emit(
+                TransferEvent(
+                    "copy",
+                    backend.url(src_key),
+                    backend.url(dst_key),
+                    size,
+                    dryrun=True,
+                ),
+                on_event,
+            )
+        return
+
+    def _copy(src_key: str, dst_key: str) -> float:
+        start = time.perf_counter()
+        backend.copy_object(src_key, dst_key)
+
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {
+            executor.submit(_copy, src_key, dst_key): (src_key, dst_key, size)
+            for src_key, dst_key, size in copies
+        }
+        try:
+            for future in as_completed(futures):
+                src_key, dst_key, size = futures[future]
+                event = TransferEvent(
+                    "copy", backend.url(src_key), backend.url(dst_key), size
+                )
+                try:
+                    seconds = future.result()
+                except Exception as exc:
+                    _emit(event._replace(error=str(exc)), on_event)
+                    raise
+                _emit(event._replace(seconds=seconds), on_event)
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def download_path(
+    backend: StorageBackend,
+    key: str,
+    path: Path,
+    recursive: bool = False,
+    max_concurrency: int = 10,
+):
+    """Downloads an object, or every object under a key, like "aws s3 cp".
+
+    Args:
+        backend: StorageBackend to download from.
+        key: Key of the object or, if recursive, the objects to download.
+        path: Path to download the object or objects to.
+        recursive: Download every object under the key to a directory.
+        max_concurrency: Maximum number of concurrent transfers.
+
+    Raises:
+        FileNotFoundError: The object must exist.
+    """
+    prefix = f"{key}/" if recursive else key
+    transfers = [
+        (
+            path / obj.key[len(prefix) :] if recursive else path,
+            obj.key,
+            obj.size,
+            obj.last_modified,
+        )
+        for obj in backend.list_objects(prefix)
+        if recursive or obj.key == key
+    ]
+    if not transfers:
+        raise FileNotFoundError(f"{backend.url(key)} does not exist")
+    transfer_files(backend, transfers, False, max_concurrency)
+
+
+def find_duplicates(
+    backend: StorageBackend,
+    command: SyncCommand,
+    uploads: List[ObjectInfo],
+    remote_objects: Dict[str, ObjectInfo],
+    max_concurrency: int = 10,
+) -> Dict[str, ObjectInfo]:
+    """Finds the files to upload whose content already exists under another
+        key.
+
+    Files are matched to objects by size and confirmed by comparing ETags, so
+    only the files which are the same size as an object are hashed.
+
+    Args:
+        backend: StorageBackend the objects are stored in.
+        command: Upload being planned.
+        uploads: Files to upload.
+        remote_objects: Objects under the prefix keyed by relative key.
+        max_concurrency: Maximum number of files or objects to hash
+            concurrently.
+
+    Returns:
+        Object with the same content as each duplicate file, keyed by the
+        relative path of the file.
+    """
+    objects_by_size = defaultdict(list)
+    for obj in remote_objects.values():
+        objects_by_size[obj.size].append(obj)
+    candidates = [
+        obj
+        for obj in uploads
+        if obj.key not in remote_objects and obj.size in objects_by_size
+    ]
+    if not candidates:
+        return {}
+
+    unhashed = {
+        obj.key
+        for candidate in candidates
+        for obj in objects_by_size[candidate.size]
+        if obj.etag is None
+    }
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        file_etags = executor.map(
+            lambda obj: compute_etag(command.local_dir / obj.key), candidates
+        )
+        object_etags = dict(
+            zip(
+                unhashed,
+                executor.map(
+                    lambda key: backend.get_etag(command.prefix + key),
+                    unhashed,
+                ),
+            )
+        )
+    duplicates = {}
+    for candidate, etag in zip(candidates, file_etags):
+        for obj in objects_by_size[candidate.size]:
+            if etag in (obj.etag, object_etags.get(obj.key)):
+                duplicates[candidate.key] = obj
+                break
+
+    return duplicates
+
+
+def is_included(key: str, filters: Tuple[Tuple[str, str], ...]) -> bool:
+    """Evaluates include and exclude filters against a key.
+
+    Every key is included unless excluded by a filter. Filters are evaluated
+    in order so that later filters take precedence over earlier ones.
+
+    Args:
+        key: Key relative to the directory or prefix being synced.
+        filters: Tuples of "include" or "exclude" and a glob pattern.
+
+    Returns:
+        Whether or not the key is included.
+    """
+    included = True
+    for filter_type, pattern in filters:
+        if fnmatch(key, pattern):
+            included = filter_type == "include"
+
+    return included
+
+
+def plan_sync(
+    command: SyncCommand,
+    local_files: Dict[str, ObjectInfo],
+    remote_objects: Dict[str, ObjectInfo],
+) -> List[ObjectInfo]:
+    """Determines which files need to be transferred by a sync.
+
+    Args:
+        command: Sync to plan.
+        local_files: Files in the local directory keyed by relative path.
+        remote_objects: Objects under the prefix keyed by relative key.
+
+    Returns:
+        Source ObjectInfo of the files to transfer, sorted by key.
+    """
+    source, dest = (
+        (local_files, remote_objects)
+        if command.upload
+        else (remote_objects, local_files)
+    )
+    transfers = []
+    for key, obj in sorted(source.items()):
+        if not is_included(key, command.filters):
+            continue
+        existing = dest.get(key)
+        if existing is None or existing.size != obj.size:
+            transfers.append(obj)
+            continue
+        if command.size_only:
+            continue
+        # Like "aws s3 sync", both directions re-sync a file when the local
+        # copy was modified after the remote object.
+        local, remote = (obj, existing) if command.upload else (existing, obj)
+        if local.last_modified > remote.last_modified:
+            transfers.append(obj)
+
+    return transfers
+
+
+def scan_local_files(
+    path: Path, keys: Optional[Iterable[str]] = None
+) -> Dict[str, ObjectInfo]:
+    """Lists the files under a directory.
+
+    Args:
+        path: Directory to list.
+        keys: Paths, relative to the directory, of the only files to list;
+            the directory isn't walked if these are provided.
+
+    Returns:
+        ObjectInfo of each file keyed by its path relative to the directory.
+    """
+    files = {}
+    if keys is not None:
+        for key in keys:
+            try:
+                stat = (path / key).stat()
+            except FileNotFoundError:
+                continue
+            files[key] = ObjectInfo(key, stat.st_size, stat.st_mtime)
+
+        return files
+
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            file_path = Path(dirpath) / filename
+            key = file_path.relative_to(path).as_posix()
+            stat = file_path.stat()
+            files[key] = ObjectInfo(key, stat.st_size, stat.st_mtime)
+
+    return files
+
+
+def sync(
+    backend: StorageBackend,
+    command: SyncCommand,
+    max_concurrency: int = 10,
+    remote_objects: Optional[Iterable[ObjectInfo]] = None,
+    keys: Optional[Iterable[str]] = None,
+    on_event: Optional[Callable[[TransferEvent], None]] = None,
+) -> List[str]:
+    """Syncs a local directory with a prefix of a StorageBackend.
+
+    Args:
+        backend: StorageBackend to sync with.
+        command: Sync to run.
+        max_concurrency: Maximum number of concurrent transfers.
+        remote_objects: Objects under the prefix, such as those cached in the
+            manifest, to plan the sync with instead of listing the prefix.
+        keys: Keys, relative to the prefix, of the only files to sync; only
+            these local files are scanned. Otherwise, the local directory is
+            listed using the scan cache, which is refreshed in full for
+            uploads so that files modified in place are re-uploaded.
+        on_event: Callback for the TransferEvent of each file.
+
+    Returns:
+        Keys, relative to the prefix, of the transferred or copied files.
+    """
+    if keys is not None:
+        keys = set(keys)
+        local_files = scan_local_files(command.local_dir, keys)
+    else:
+        local_files = scan_library(command.local_dir, force=command.upload)
+    if remote_objects is None:
+        # Partition the listing by user and genre to list it concurrently.
+        remote_objects = list_objects_concurrently(
+            backend, [command.prefix], max_concurrency, depth=2
+        )
+    remote_objects = {
+        obj.key[len(command.prefix) :]: obj._replace(
+            key=obj.key[len(command.prefix) :]
+        )
+        for obj in remote_objects
+        if keys is None or obj.key[len(command.prefix) :] in keys
+    }
+    planned = plan_sync(command, local_files, remote_objects)
+    duplicates = (
+        find_duplicates(
+            backend, command, planned, remote_objects, max_concurrency
+        )
+        if command.upload
+        else {}
+    )
+    if duplicates:
+        logger.warning(
+            f"{len(duplicates)} files already exist under other keys; copying "
+            "the existing objects instead of uploading them"
+        )
+        copy_objects(
+            backend,
+            [
+                (
+                    command.prefix + obj.key,
+                    command.prefix + key,
+                    obj.size,
+                )
+                for key, obj in duplicates.items()
+            ],
+            max_concurrency,
+            dryrun=command.dryrun,
+            on_event=on_event,
+        )
+    transfers = [
+        (
+            command.local_dir / obj.key,
+            command.prefix + obj.key,
+            obj.size,
+            obj.last_modified,
+        )
+        for obj in planned
+        if obj.key not in duplicates
+    ]
+    transfer_files(
+        backend,
+        transfers,
+        command.upload,
+        max_concurrency,
+        dryrun=command.dryrun,
+        on_event=on_event,
+    )
+
+    return sorted(
+        [
+            *duplicates,
+            *(key[len(command.prefix) :] for _, key, *_ in transfers),
+        ]
+    )
+
+
+def upload_path(
+    backend: StorageBackend, path: Path, key: str, max_concurrency: int = 10
+):
+    """Uploads a file, or every file in a directory, like "aws s3 cp".
+
+    Args:
+        backend: StorageBackend to upload to.
+        path: File or directory to upload.
+        key: Key of the object or, if path is a directory, of the prefix to
+            upload the files to.
+        max_concurrency: Maximum number of concurrent transfers.
+    """
+    if path.is_dir():
+        transfers = [
+            (path / obj.key, f"{key}/{obj.key}", obj.size, obj.last_modified)
+            for obj in scan_local_files(path).values()
+        ]
+    else:
+        stat = path.stat()
+        transfers = [(path, key, stat.st_size, stat.st_mtime)]
+    transfer_files(backend, transfers, True, max_concurrency)
+
+
+def transfer_files(
+    backend: StorageBackend,
+    transfers: List[Tuple[Path, str, int, float]],
+    upload: bool,
+    max_concurrency: int = 10,
+    dryrun: bool = False,
+    on_event: Optional[Callable[[TransferEvent], None]] = None,
+):
+    """Concurrently uploads or downloads files.
+
+    Downloads are written to a temporary file which replaces the destination
+    once complete. The modified time of downloaded files is set to the last
+    modified time of the object so that later syncs can compare them.
+
+    A TransferEvent is logged, and passed to "on_event", as each transfer
+    completes or fails. The first failure cancels the pending transfers.
+
+    Args:
+        backend: StorageBackend to transfer files with.
+        transfers: Tuples of local path, key, size, and the last modified time
+            of the source.
+        upload: Whether uploading or downloading.
+        max_concurrency: Maximum number of concurrent transfers.
+        dryrun: Log the transfers without running them.
+        on_event: Callback for each TransferEvent.
+    """
+    operation = "upload" if upload else "download"
+
+    def _event(path: Path, key: str, size: int, **kwargs):
+        src, dst = str(path), backend.url(key)
+        if not upload:
+            src, dst = dst, src
+        _emit(TransferEvent(operation, src, dst, size, **kwargs), on_event)
+
+    if dryrun:
+        for path, key, size, _ in transfers:
+            _event(path, key, size, dryrun=True)
+        return
+
+    def _transfer(path: Path, key: str, last_modified: float) -> float:
+        start = time.perf_counter()
+        if upload:
+            backend.upload_file(path, key)
+            return time.perf_counter() - start
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = path.with_name(f"{path.name}.part")
+        try:
+            backend.download_file(key, part_path)
+            os.utime(part_path, (last_modified, last_modified))
+            os.replace(part_path, path)
+        finally:
+            part_path.unlink(missing_ok=True)
+
+        return time.perf_counter() - start
+
+    progress_bar = tqdm(
+        total=sum(size for _, _, size, _ in transfers),
+        desc=f"{operation.title()}ing {len(transfers)} files",
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+    )
+    with progress_bar as pbar:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = {
+                executor.submit(_transfer, path, key, last_modified): (
+                    path,
+                    key,
+                    size,
+                )
+                for path, key, size, last_modified in transfers
+            }
+            try:
+                for future in as_completed(futures):
+                    path, key, size = futures[future]
+                    try:
+                        seconds = future.result()
+                    except Exception as exc:
+                        _event(path, key, size, error=str(exc))
+                        raise
+                    _event(path, key, size, seconds=seconds)
+                    pbar.update(size)
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+
+
+def _emit(
+    event: TransferEvent,
+    on_event: Optional[Callable[[TransferEvent], None]] = None,
+):
+    """Logs a TransferEvent and passes it to a callback.
+
+    Args:
+        event: Event to emit.
+        on_event: Callback for the event.
+    """
+    if event.error is not None:
+        logger.error(str(event))
+    else:
+        logger.info(str(event))
+    if on_event is not None:
+        on_event(event)
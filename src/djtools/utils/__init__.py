@@ -1,31 +1,65 @@
 """The `utils` package contains modules:
+    * `candidate_index`: an index of track names proposing the candidates
+        for fuzzy matching.
     * `check_tracks`: Compares Spotify and / or local files with the Beatcloud
         to identify overlap.
     * `config`: the configuration object for the `utils` package
     * `helpers`: helper functions for the `utils` package and the `djtools`
         library in general
+    * `lazy`: lazy references to the operations and public names of the
+        `djtools` packages
+    * `match_cache`: a local SQLite cache of the matches between tracks and
+        the Beatcloud.
     * `normalize_audio`: sets the peak amplitude of tracks go a configured
         headroom and exports them with a configured bit rate and file format.
     * `process_recording`: given a Spotify playlist and a recording file, chunk
         the recording into individual tracks, normalize their peak amplitude
         with the configured headroom, and export them with the configured
         bit rate and file format.
+    * `track_names`: parses and normalizes "TRACK TITLE - ARTIST NAME".
     * `url_download`: download tracks from a URL (e.g. Soundcloud playlist).
 """
 
-from djtools.utils.check_tracks import compare_tracks
-from djtools.utils.normalize_audio import normalize
-from djtools.utils.process_recording import process
-from djtools.utils.url_download import url_download
+from djtools.utils.lazy import lazy_exports, LazyOperation
 
 
 UTILS_OPERATIONS = {
-    "CHECK_TRACKS": compare_tracks,
-    "NORMALIZE_AUDIO": normalize,
-    "PROCESS_RECORDING": process,
-    "URL_DOWNLOAD": url_download,
+    "CHECK_TRACKS": LazyOperation(
+        "djtools.utils.check_tracks",
+        "compare_tracks",
+        reads=("beatcloud", "local", "spotify"),
+    ),
+    "NORMALIZE_AUDIO": LazyOperation(
+        "djtools.utils.normalize_audio",
+        "normalize",
+        reads=("local",),
+        writes=("local",),
+    ),
+    "PROCESS_RECORDING": LazyOperation(
+        "djtools.utils.process_recording",
+        "process",
+        reads=("local", "spotify"),
+        writes=("local",),
+    ),
+    "URL_DOWNLOAD": LazyOperation(
+        "djtools.utils.url_download",
+        "url_download",
+        writes=("local",),
+    ),
 }
 
+__getattr__ = lazy_exports(
+    __name__,
+    {
+        "compare_tracks": "djtools.utils.check_tracks",
+        "normalize": "djtools.utils.normalize_audio",
+        "process": "djtools.utils.process_recording",
+        "url_download": "djtools.utils.url_download",
+    },
+)
+
+# The names in __all__ are imported on first access by __getattr__.
+# pylint: disable=undefined-all-variable
 __all__ = (
     "compare_tracks",
     "normalize",
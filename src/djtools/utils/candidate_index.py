@@ -0,0 +1,142 @@
+"""This module contains an index of track names which proposes the candidates
+that a query may match with a given fuzz ratio.
+
+`fuzz.ratio` scores two strings, of lengths `la` and `lb`, as
+`100 * 2 * M / (la + lb)` (rounded) where `M` is at most the length of their
+longest common subsequence (LCS). A score of at least a threshold therefore
+requires `M`, and so the LCS, to be at least some `M_min`, which bounds:
+
+    * the length of a match: `M <= min(la, lb)`
+    * the number of bigrams a match shares with the query: every bigram of the
+        LCS is a bigram of both strings unless characters outside of the LCS
+        split it, which can happen at most `(la - M) + (lb - M)` times, so the
+        strings share at least `3 * M_min - 1 - la - lb` bigrams
+
+The index holds the bigrams of every track, numbered by occurrence so that
+repeated bigrams are counted, in an inverted index. A track sharing at least
+`S` of the query's `n` bigrams must share one of any `n - S + 1` of them, so
+only the tracks containing one of the query's rarest `n - S + 1` bigrams, with
+`S` the lowest bound over the feasible lengths, are probed. The bigrams each
+probed track shares with the query are then counted and compared against the
+bound for its own length, which is far cheaper than scoring it. Where the bound
+is too loose, e.g. for short queries or low thresholds, every track of a
+feasible length is a candidate.
+
+No track that could score at least the threshold is left out, so scoring only
+the candidates finds the same matches as scoring every pair.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import math
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Tuple
+
+
+Token = Tuple[str, int]
+# Tolerance of the floating point bounds; erring on the side of more
+# candidates.
+EPSILON = 1e-9
+
+
+def get_tokens(name: str) -> Iterator[Token]:
+    """Splits a name into bigrams numbered by their occurrence.
+
+    Args:
+        name: Track name.
+
+    Yields:
+        Bigram and the number of times it occurred before.
+    """
+    counts = defaultdict(int)
+    for i in range(len(name) - 1):
+        bigram = name[i : i + 2]
+        yield bigram, counts[bigram]
+        counts[bigram] += 1
+
+
+class CandidateIndex:
+    """Index of track names proposing the candidates for fuzzy matching."""
+
+    def __init__(self, tracks: Iterable[str]):
+        """Constructor.
+
+        Args:
+            tracks: Track names to index.
+        """
+        self.tracks = list(tracks)
+        self._postings: Dict[Token, List[int]] = defaultdict(list)
+        self._tokens: List[FrozenSet[Token]] = []
+        for track_id, track in enumerate(self.tracks):
+            tokens = frozenset(get_tokens(track))
+            self._tokens.append(tokens)
+            for token in tokens:
+                self._postings[token].append(track_id)
+        self._ids_by_length = sorted(
+            range(len(self.tracks)), key=lambda x: len(self.tracks[x])
+        )
+        self._lengths = [len(self.tracks[x]) for x in self._ids_by_length]
+
+    def get_candidates(self, query: str, threshold: float) -> List[str]:
+        """Gets the tracks which may match a query.
+
+        Args:
+            query: Track name to match.
+            threshold: Minimum fuzz ratio of a match.
+
+        Returns:
+            Tracks which may have a fuzz ratio of at least the threshold with
+                the query.
+        """
+        # The fuzz ratio is rounded to an integer.
+        ratio = (threshold - 0.5) / 100
+        if ratio <= 0:
+            return list(self.tracks)
+
+        # Bound the length of the candidates.
+        length = len(query)
+        min_length = math.ceil(length * ratio / (2 - ratio) - EPSILON)
+        max_length = math.floor(length * (2 - ratio) / ratio + EPSILON)
+
+        # Bound the number of bigrams the candidates share with the query.
+        # The bound is linear in the length of the candidate, so it's lowest
+        # at one of the ends of the range.
+        min_shared = math.ceil(
+            min(
+                (1.5 * ratio - 1) * (length + candidate_length) - 1
+                for candidate_length in (min_length, max_length)
+            )
+            - EPSILON
+        )
+        if min_shared <= 0:
+            return [
+                self.tracks[track_id]
+                for track_id in sorted(
+                    self._ids_by_length[
+                        bisect_left(self._lengths, min_length) : bisect_right(
+                            self._lengths, max_length
+                        )
+                    ]
+                )
+            ]
+
+        tokens = sorted(
+            get_tokens(query), key=lambda x: len(self._postings.get(x, ()))
+        )
+        track_ids = {
+            track_id
+            for token in tokens[: max(len(tokens) - min_shared + 1, 0)]
+            for track_id in self._postings.get(token, ())
+        }
+
+        # Count the bigrams each probed track shares with the query.
+        query_tokens = frozenset(tokens)
+        candidates = []
+        for track_id in sorted(track_ids):
+            track = self.tracks[track_id]
+            if not min_length <= len(track) <= max_length:
+                continue
+            bound = (1.5 * ratio - 1) * (length + len(track)) - 1 - EPSILON
+            if len(query_tokens & self._tokens[track_id]) >= bound:
+                candidates.append(track)
+
+        return candidates
@@ -14,8 +14,8 @@ from djtools.utils.helpers import (
     get_spotify_tracks,
     get_beatcloud_tracks,
     get_local_tracks,
-    reverse_title_and_artist,
 )
+from djtools.utils.track_names import normalize_track_name
 
 
 logger = logging.getLogger(__name__)
@@ -40,9 +40,10 @@ def compare_tracks(
         Tuple with a list of all Beatcloud tracks and list of full paths to
             matching Beatcloud tracks.
     """
+    # Local directories are only checked when not downloading a playlist.
+    # The config isn't modified to skip them since other operations may be
+    # using it concurrently.
     if config.DOWNLOAD_SPOTIFY_PLAYLIST:
-        cached_local_dirs = config.LOCAL_DIRS
-        config.LOCAL_DIRS = []
         spotify_playlists = [config.DOWNLOAD_SPOTIFY_PLAYLIST]
     else:
         spotify_playlists = config.CHECK_TRACKS_SPOTIFY_PLAYLISTS
@@ -76,7 +77,7 @@ def compare_tracks(
                         else f"{title} - {artists}"
                     )
             track_sets.append((track_results, "Spotify Playlist Tracks"))
-    if config.LOCAL_DIRS:
+    if config.LOCAL_DIRS and not config.DOWNLOAD_SPOTIFY_PLAYLIST:
         local_tracks = get_local_tracks(config)
         if not local_tracks:
             logger.warning(
@@ -90,24 +91,41 @@ def compare_tracks(
             }
             track_sets.append((track_results, "Local Directory Tracks"))
 
-    if config.DOWNLOAD_SPOTIFY_PLAYLIST:
-        config.LOCAL_DIRS = cached_local_dirs
-
     if not track_sets:
         return beatcloud_tracks, beatcloud_matches
 
     if not beatcloud_tracks:
-        beatcloud_tracks = get_beatcloud_tracks(config.BUCKET_URL)
+        beatcloud_tracks = get_beatcloud_tracks(config)
 
     path_lookup = {x.stem: x for x in beatcloud_tracks}
 
     for tracks, track_type in track_sets:
+        lookup = path_lookup
+        match_config = config
+        names = {}
         if config.ARTIST_FIRST and track_type == "Local Directory Tracks":
-            path_lookup = reverse_title_and_artist(path_lookup)
+            # Local files are named "TITLE - ARTIST NAME" unlike the
+            # Beatcloud tracks, so both are compared by their normalized
+            # names, which don't depend on the order of the title and artists.
+            lookup = {
+                normalize_track_name(name, artist_first=True): path
+                for name, path in path_lookup.items()
+            }
+            names = {
+                normalize_track_name(name): name
+                for value in tracks.values()
+                for name in value
+            }
+            tracks = {
+                key: [normalize_track_name(name) for name in value]
+                for key, value in tracks.items()
+            }
+            match_config = config.model_copy(update={"ARTIST_FIRST": False})
         matches = find_matches(
             tracks,
-            path_lookup.keys(),
-            config,
+            lookup.keys(),
+            match_config,
+            cache_key=track_type,
         )
         logger.info(f"\n{track_type} / Beatcloud Matches: {len(matches)}")
         for loc, matches in groupby(
@@ -115,7 +133,10 @@ def compare_tracks(
         ):
             logger.info(f"{loc}:")
             for _, track, beatcloud_track, fuzz_ratio in matches:
-                beatcloud_matches.append(path_lookup[beatcloud_track])
-                logger.info(f"\t{fuzz_ratio}: {track} | {beatcloud_track}")
+                path = lookup[beatcloud_track]
+                beatcloud_matches.append(path)
+                logger.info(
+                    f"\t{fuzz_ratio}: {names.get(track, track)} | {path.stem}"
+                )
 
     return beatcloud_tracks, beatcloud_matches
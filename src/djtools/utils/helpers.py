@@ -1,32 +1,57 @@
 """This module contains helper functions that are not specific to any
 particular sub-package of this library.
+
+Since this module is imported by every run of `djtools` (e.g. for
+`make_path`), the third-party libraries used by only some of its functions,
+such as `pydub` and `fuzzywuzzy`, are imported by those functions.
 """
 
-from concurrent.futures import as_completed, ThreadPoolExecutor
+from __future__ import annotations
+from collections import defaultdict
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from contextlib import closing
 from datetime import datetime
 from functools import wraps
 import inspect
-from itertools import product
 import logging
 import logging.config
+import multiprocessing
 from operator import itemgetter
 import os
 import pathlib
 from pathlib import Path
-from subprocess import check_output
+import time
 import typing
-from typing import Callable, Dict, List, Literal, Optional, Set, Tuple, Union
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+    Union,
+)
 
-from fuzzywuzzy import fuzz
-from pydub import AudioSegment, effects, silence
-import spotipy
 from tqdm import tqdm
 
 from djtools.configs.config import BaseConfig
-from djtools.spotify.helpers import get_playlist_ids, get_spotify_client
+from djtools.utils.candidate_index import CandidateIndex
+from djtools.utils.match_cache import MATCH_CACHE_PATH, MatchCache, QUERY_TTL
+from djtools.utils.run_context import shared
+from djtools.utils.track_names import normalize_track_name
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+    import spotipy
 
 
 logger = logging.getLogger(__name__)
+# Number of tracks find_matches sends to a worker process at a time.
+MATCH_CHUNK_SIZE = 64
+# Index of the Beatcloud tracks in a find_matches worker process.
+_MATCH_INDEX: Optional[CandidateIndex] = None
 
 
 def compute_distance(
@@ -48,6 +73,8 @@ def compute_distance(
         Tuple of Spotify playlist, Spotify "TRACK TITLE - ARTIST NAME",
             beatcloud "TRACK TITLE - ARTIST NAME", Levenshtein similarity.
     """
+    from fuzzywuzzy import fuzz
+
     ret = ()
     fuzz_ratio = fuzz.ratio(spotify_track, beatcloud_track)
     if fuzz_ratio >= threshold:
@@ -59,15 +86,23 @@ def find_matches(
     compare_tracks: Dict[str, Set[str]],
     beatcloud_tracks: List[str],
     config: BaseConfig,
+    cache_key: Optional[str] = None,
 ) -> List[Tuple[str, float]]:
     """Computes the Levenshtein similarity between beatcloud tracks the given
         tracks to compare with and returns those that match above a threshold.
 
+    With a cache key, the matches are cached in the match cache so that only
+    the tracks which weren't checked before, and the Beatcloud tracks which
+    were added since, are scored. Tracks are cached by their normalized names,
+    so variants of a name share the matches of the first variant scored.
+
     Args:
         compare_tracks: Dictionary with either local directory or Spotify
             playlist keys and filenames or title and artists values.
         beatcloud_tracks: Beatcloud track titles and artist names.
         config: Configuration object.
+        cache_key: Key of the matches in the match cache, e.g. the kind of
+            tracks compared.
 
     Returns:
         List of tuples of track location (directory or playlist), track name,
@@ -78,49 +113,255 @@ def find_matches(
         for playlist, tracks in compare_tracks.items()
         for track in tracks
     ]
-    _product = list(product(playlist_tracks, beatcloud_tracks))
-    _temp, beatcloud_tracks = zip(*_product)
-    locations, tracks = zip(*_temp)
-    payload = zip(
-        locations,
-        tracks,
-        beatcloud_tracks,
-        [config.CHECK_TRACKS_FUZZ_RATIO] * len(_product),
+    if cache_key is None:
+        return _match_tracks(playlist_tracks, beatcloud_tracks, config)
+
+    context = (
+        f"{cache_key}:{config.BUCKET_URL}:{config.CHECK_TRACKS_FUZZ_RATIO}:"
+        f"{config.ARTIST_FIRST}"
     )
+    keys = {
+        track: normalize_track_name(track, config.ARTIST_FIRST)
+        for _, track in playlist_tracks
+    }
+    queries = {}
+    for track in sorted(keys):
+        queries.setdefault(keys[track], track)
+    beatcloud_tracks = set(beatcloud_tracks)
+    now = time.time()
+    with closing(MatchCache(MATCH_CACHE_PATH)) as cache:
+        cache.remove_queries(context, now - QUERY_TTL)
+        cached_tracks = cache.get_tracks(context)
+        cache.remove_tracks(context, cached_tracks - beatcloud_tracks)
+        added_tracks = beatcloud_tracks - cached_tracks
+        cached_queries = cache.get_queries(context)
+        new_queries = {
+            query: name
+            for query, name in queries.items()
+            if query not in cached_queries
+        }
+        logger.info(
+            f"Matching {len(new_queries)} new tracks with the Beatcloud and "
+            f"{len(added_tracks)} new Beatcloud tracks with "
+            f"{len(cached_queries)} checked tracks"
+        )
+        # Tracks are scored under their normalized names.
+        matches = []
+        if added_tracks and cached_queries:
+            matches.extend(
+                _match_tracks(
+                    sorted(cached_queries.items()),
+                    sorted(added_tracks),
+                    config,
+                )
+            )
+        if new_queries:
+            matches.extend(
+                _match_tracks(
+                    sorted(new_queries.items()),
+                    sorted(beatcloud_tracks),
+                    config,
+                )
+            )
+        cache.add(
+            context,
+            added_tracks,
+            queries,
+            (
+                (
+                    query,
+                    beatcloud_track,
+                    fuzz_ratio,
+                    query
+                    == normalize_track_name(
+                        beatcloud_track, config.ARTIST_FIRST
+                    ),
+                )
+                for query, _, beatcloud_track, fuzz_ratio in matches
+            ),
+            now,
+        )
+        cached_matches = cache.get_matches(context, queries)
+
+    return [
+        (playlist, track, beatcloud_track, fuzz_ratio)
+        for playlist, track in playlist_tracks
+        for beatcloud_track, fuzz_ratio in cached_matches[keys[track]]
+    ]
+
+
+def _match_tracks(
+    playlist_tracks: List[Tuple[str, str]],
+    beatcloud_tracks: List[str],
+    config: BaseConfig,
+) -> List[Tuple[str, str, str, float]]:
+    """Finds the Beatcloud tracks that tracks match.
+
+    Tracks whose normalized names are the same as a Beatcloud track's are
+    matched, with a similarity of 100, without being scored. Rather than
+    scoring every pair of the remaining tracks, each is only scored against
+    the Beatcloud tracks which a CandidateIndex proposes could match it.
+    Scoring is CPU bound, so chunks of tracks are scored in worker
+    processes rather than threads; a single chunk is scored in this process
+    since starting workers would take longer than scoring it.
 
-    with ThreadPoolExecutor(
-        max_workers=os.cpu_count() * 4  # pylint: disable=no-member
+    Args:
+        playlist_tracks: Playlist or directory and track title and artist
+            name of each track.
+        beatcloud_tracks: Beatcloud track titles and artist names.
+        config: Configuration object.
+
+    Returns:
+        Tuples of playlist, track, matching Beatcloud track, and Levenshtein
+            similarity.
+    """
+    beatcloud_keys = defaultdict(list)
+    for beatcloud_track in beatcloud_tracks:
+        beatcloud_keys[
+            normalize_track_name(beatcloud_track, config.ARTIST_FIRST)
+        ].append(beatcloud_track)
+    matches = []
+    unmatched = []
+    for playlist, track in playlist_tracks:
+        exact_matches = beatcloud_keys.get(
+            normalize_track_name(track, config.ARTIST_FIRST)
+        )
+        if exact_matches:
+            matches.extend(
+                (playlist, track, beatcloud_track, 100)
+                for beatcloud_track in exact_matches
+            )
+        else:
+            unmatched.append((playlist, track))
+    if not unmatched:
+        return matches
+
+    index = CandidateIndex(beatcloud_tracks)
+    chunks = [
+        unmatched[i : i + MATCH_CHUNK_SIZE]
+        for i in range(0, len(unmatched), MATCH_CHUNK_SIZE)
+    ]
+    if len(chunks) <= 1:
+        return matches + _score_chunk(
+            unmatched, config.CHECK_TRACKS_FUZZ_RATIO, index=index
+        )
+
+    # Workers are spawned rather than forked since operations run in threads
+    # and forking a process with threads may deadlock the child.
+    with ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_match_worker,
+        initargs=(index,),
     ) as executor:
-        futures = [
-            executor.submit(compute_distance, *args) for args in payload
-        ]
+        futures = {
+            executor.submit(
+                _score_chunk, chunk, config.CHECK_TRACKS_FUZZ_RATIO
+            ): len(chunk)
+            for chunk in chunks
+        }
 
         with tqdm(
-            total=len(futures), desc="Matching new tracks and Beatcloud tracks"
+            total=len(unmatched),
+            desc="Matching new tracks and Beatcloud tracks",
         ) as pbar:
-            matches = []
             for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    matches.append(result)
-                pbar.update(1)
+                matches.extend(future.result())
+                pbar.update(futures[future])
 
     return matches
 
 
-def get_beatcloud_tracks(bucket_url) -> List[str]:
-    """Lists all the music files in S3 and parses out the track titles and
-        artist names.
+def _init_match_worker(index: CandidateIndex):
+    """Sets the index of the Beatcloud tracks that chunks are scored against.
 
     Args:
-        bucket_url: URL to an AWS S3 API compliant bucket.
+        index: Index of the Beatcloud tracks.
+    """
+    global _MATCH_INDEX  # pylint: disable=global-statement
+    _MATCH_INDEX = index
+
+
+def _score_chunk(
+    playlist_tracks: List[Tuple[str, str]],
+    threshold: float,
+    index: Optional[CandidateIndex] = None,
+) -> List[Tuple[str, str, str, float]]:
+    """Scores a chunk of tracks against their candidate Beatcloud tracks.
+
+    Only the matches are returned so that little is sent back from the worker
+    processes. `fuzzywuzzy` uses the `Levenshtein` C extension when it's
+    installed.
+
+    Args:
+        playlist_tracks: Playlist or directory and track title and artist
+            name of each track.
+        threshold: Levenshtein similarity threshold for acceptance.
+        index: Index of the Beatcloud tracks; defaults to the worker's.
 
     Returns:
-        Beatcloud track titles and artist names.
+        Tuples of playlist, track, matching Beatcloud track, and Levenshtein
+            similarity.
     """
-    cmd = ["aws", "s3", "ls", "--recursive", f"{bucket_url}/dj/music/"]
-    output = check_output(cmd).decode("utf-8").split("\n")
-    tracks = [Path(track) for track in output if track]
+    from fuzzywuzzy import fuzz
+
+    index = index or _MATCH_INDEX
+    ratio = fuzz.ratio
+    matches = []
+    for playlist, track in playlist_tracks:
+        for beatcloud_track in index.get_candidates(track, threshold):
+            fuzz_ratio = ratio(track, beatcloud_track)
+            if fuzz_ratio >= threshold:
+                matches.append((playlist, track, beatcloud_track, fuzz_ratio))
+
+    return matches
+
+
+def get_beatcloud_tracks(config: BaseConfig) -> List[Path]:
+    """Lists all the music files in the Beatcloud.
+
+    The listing is read from a local manifest which is refreshed for any user
+    whose listing is older than "BEATCLOUD_MANIFEST_TTL". During a run, it's
+    only read once.
+
+    Args:
+        config: Configuration object.
+
+    Returns:
+        Beatcloud tracks relative to "dj/music/".
+    """
+    return shared(
+        ("beatcloud_tracks", config.BUCKET_URL),
+        lambda: _list_beatcloud_tracks(config),
+    )
+
+
+def _list_beatcloud_tracks(config: BaseConfig) -> List[Path]:
+    """Lists all the music files in the Beatcloud.
+
+    Args:
+        config: Configuration object.
+
+    Returns:
+        Beatcloud tracks relative to "dj/music/".
+    """
+    from djtools.sync.manifest import list_cached_objects
+    from djtools.sync.storage import get_storage_backend
+
+    prefix = "dj/music/"
+    backend = get_storage_backend(
+        config.BUCKET_URL,
+        profile=config.AWS_PROFILE,
+        max_concurrency=config.SYNC_MAX_CONCURRENCY,
+    )
+    with closing(backend):
+        objects = list_cached_objects(
+            backend,
+            prefix,
+            config.BEATCLOUD_MANIFEST_TTL,
+            config.SYNC_MAX_CONCURRENCY,
+        )
+    tracks = [Path(obj.key[len(prefix) :]) for obj in objects]
     logger.info(f"Got {len(tracks)} tracks from the beatcloud")
 
     return tracks
@@ -197,6 +438,8 @@ def get_spotify_tracks(
     Returns:
         Spotify tracks keyed by playlist name.
     """
+    from djtools.spotify.helpers import get_playlist_ids, get_spotify_client
+
     spotify = get_spotify_client(config)
     playlist_ids = get_playlist_ids()
 
@@ -275,6 +518,14 @@ def initialize_logger() -> Tuple[logging.Logger, str]:
 def make_path(func: Callable) -> Callable:
     """Decorator for converting Path-typed args to Paths.
 
+    The parameters annotated as Paths are resolved once, on the first call,
+    rather than on every call; they can't be resolved when decorating since
+    annotations may refer to names defined after the function.
+
+    None is passed through unchanged for parameters annotated as
+    Optional[Path]; for those annotated as Path it raises, like any other
+    value a Path can't be created from.
+
     Args:
         func: Callable being decorated with this function.
 
@@ -287,8 +538,9 @@ def make_path(func: Callable) -> Callable:
     Returns:
         The Callable being wrapped by this decorator.
     """
+    path_parameters = None
 
-    @wraps(make_path)
+    @wraps(func)
     def str_to_path(*args, **kwargs):
         """Converts non-Path type args into Paths if annotated as Paths.
 
@@ -298,52 +550,39 @@ def make_path(func: Callable) -> Callable:
             RuntimeError: kwargs annotated with a pathlib.Path need to be able
                 to have Paths created from them.
         """
-        # Get the function's type annotations and partition them by args and
-        # kwargs.
-        path_types = (pathlib.Path, typing.Union[pathlib.Path, None])
-        num_args = 0
-        num_kwargs = 0
-        type_hints = list(typing.get_type_hints(func).values())
-        sig = inspect.signature(func)
-        for parameter in sig.parameters.values():
-            if parameter.name == "self":
-                type_hints.insert(0, "self")
-            if parameter.name in kwargs:
-                num_kwargs += 1
-            else:
-                num_args += 1
-        arg_type_hints = type_hints[:num_args]
-        kwarg_type_hints = type_hints[:num_kwargs]
+        nonlocal path_parameters
+        if path_parameters is None:
+            path_parameters = _get_path_parameters(func)
+        positions, names = path_parameters
 
         # Convert each arg to a Path if the annotation type is pathlib.Path.
-        args = list(args)
-        for index, (arg, arg_type) in enumerate(zip(args, arg_type_hints)):
-            # Skip if the arg shouldn't be a path or it should be a Path but
-            # already is.
-            if arg_type not in path_types or (
-                arg_type in path_types and isinstance(arg, Path)
+        for index, arg_type in positions:
+            if index >= len(args):
+                break
+            arg = args[index]
+            if isinstance(arg, Path) or (
+                arg is None and arg_type is not pathlib.Path
             ):
                 continue
-
             try:
-                args[index] = Path(arg)
+                arg = Path(arg)
             except Exception as exc:
                 raise RuntimeError(
                     "Error creating Path in function "
                     f'"{func.__name__}" from positional arg "{arg}" annotated '
                     f'with type "{arg_type}": {exc}'
                 ) from Exception
-        args = tuple(args)
+            args = (*args[:index], arg, *args[index + 1 :])
 
         # Convert each kwarg to a Path if the annotation type is pathlib.Path.
-        for (key, value), arg_type in zip(kwargs.items(), kwarg_type_hints):
-            # Skip if the arg value shouldn't be a path or it should be a Path
-            # but already is.
-            if arg_type not in path_types or (
-                arg_type in path_types and isinstance(value, Path)
+        for key, arg_type in names:
+            if key not in kwargs:
+                continue
+            value = kwargs[key]
+            if isinstance(value, Path) or (
+                value is None and arg_type is not pathlib.Path
             ):
                 continue
-
             try:
                 kwargs[key] = Path(value)
             except Exception as exc:
@@ -358,6 +597,42 @@ def make_path(func: Callable) -> Callable:
     return str_to_path
 
 
+def _get_path_parameters(
+    func: Callable,
+) -> Tuple[List[Tuple[int, typing.Any]], List[Tuple[str, typing.Any]]]:
+    """Finds the parameters of a function which are annotated as Paths.
+
+    Args:
+        func: Callable to find the Path parameters of.
+
+    Returns:
+        The positions, and the names, of the parameters that can be passed
+            positionally, and by keyword, respectively, along with their
+            annotations.
+    """
+    path_types = (pathlib.Path, typing.Union[pathlib.Path, None])
+    type_hints = typing.get_type_hints(func)
+    positions, names = [], []
+    for index, parameter in enumerate(
+        inspect.signature(func).parameters.values()
+    ):
+        arg_type = type_hints.get(parameter.name)
+        if arg_type not in path_types:
+            continue
+        if parameter.kind in (
+            inspect.Parameter.POSITIONAL_ONLY,
+            inspect.Parameter.POSITIONAL_OR_KEYWORD,
+        ):
+            positions.append((index, arg_type))
+        if parameter.kind in (
+            inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            inspect.Parameter.KEYWORD_ONLY,
+        ):
+            names.append((parameter.name, arg_type))
+
+    return positions, names
+
+
 def process_parallel(
     config: BaseConfig, audio: AudioSegment, track: Dict, write_path: Path
 ) -> Path:
@@ -372,6 +647,8 @@ def process_parallel(
     Returns:
         Path that the file was written to.
     """
+    from pydub import effects
+
     # Normalize the audio such that the headroom is
     # AUDIO_HEADROOM dB.
     if abs(audio.max_dBFS + config.AUDIO_HEADROOM) > 0.001:
@@ -448,6 +725,8 @@ def trim_initial_silence(
     Returns:
         AudioSegment: Audio with the beginning silence trimmed off.
     """
+    from pydub import AudioSegment, silence
+
     # If trim_amount is an integer, then it's the number of milliseconds to
     # trim off the beginning of the recording. If a negative integer is
     # provided, then insert that many milliseconds of silence at the beginning
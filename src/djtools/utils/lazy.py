@@ -0,0 +1,107 @@
+"""This module contains lazy references to the operations and public names of
+the `djtools` packages.
+
+Importing a package shouldn't import the third-party libraries its operations
+depend on (e.g. `youtube_dl`, `asyncpraw`, `pydub`) since a run of `djtools`
+only uses the few operations it's configured to. The operation maps of the
+packages therefore hold `LazyOperation`s which import their module when they're
+first called, and the names the packages export are imported when they're
+first accessed.
+
+A `LazyOperation` also declares the resources its operation reads and writes
+so that `main` can run operations which don't conflict concurrently.
+"""
+
+import importlib
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class LazyOperation:
+    """Reference to a function which is imported when it's first called."""
+
+    def __init__(
+        self,
+        module: str,
+        name: str,
+        reads: Iterable[str] = (),
+        writes: Iterable[str] = (),
+    ):
+        """Constructor.
+
+        Args:
+            module: Name of the module containing the function.
+            name: Name of the function.
+            reads: Resources the function reads, e.g. "collection".
+            writes: Resources the function writes.
+        """
+        self.module = module
+        self.name = name
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self._func: Optional[Callable] = None
+
+    def __call__(self, *args, **kwargs) -> Any:
+        """Imports the function, if needed, and calls it.
+
+        Returns:
+            The return value of the function.
+        """
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        """Produces a string representation of this LazyOperation.
+
+        Returns:
+            LazyOperation as a string.
+        """
+        return f"{self.__class__.__name__}({self.module}.{self.name})"
+
+    def resolve(self) -> Callable:
+        """Imports the function.
+
+        Returns:
+            The function.
+        """
+        if self._func is None:
+            self._func = getattr(
+                importlib.import_module(self.module), self.name
+            )
+
+        return self._func
+
+
+def lazy_exports(
+    package: str, exports: Dict[str, str]
+) -> Callable[[str], Any]:
+    """Builds a module-level `__getattr__` which imports names on first access.
+
+    Args:
+        package: Name of the package exporting the names.
+        exports: Name of the module containing each exported name.
+
+    Returns:
+        The package's `__getattr__`.
+    """
+
+    def __getattr__(name: str) -> Any:
+        """Imports an exported name and caches it on the package.
+
+        Args:
+            name: Name to import.
+
+        Raises:
+            AttributeError: The name must be exported by the package.
+
+        Returns:
+            The imported object.
+        """
+        if name not in exports:
+            raise AttributeError(
+                f"module '{package}' has no attribute '{name}'"
+            )
+        value = getattr(importlib.import_module(exports[name]), name)
+        setattr(importlib.import_module(package), name, value)
+
+        return value
+
+    return __getattr__
@@ -0,0 +1,252 @@
+"""This module contains the match cache: a local SQLite cache of the matches
+`find_matches` found between tracks and the Beatcloud.
+
+The same Spotify playlists and local directories are usually checked against
+a mostly unchanged Beatcloud, so the matches of every track that was checked
+are cached along with the Beatcloud tracks it was checked against. A later
+check then only scores the tracks which weren't checked before against the
+whole Beatcloud, and the Beatcloud tracks which were added since against the
+tracks which were. The matches of Beatcloud tracks which were removed are
+forgotten.
+
+Tracks are cached by their normalized names so that variants of the same name,
+e.g. differing in case or punctuation, share their matches. The matches of a
+normalized name are those of the first variant of it that was scored.
+Tracks which haven't been checked for "QUERY_TTL" seconds are forgotten so
+that Beatcloud tracks added later aren't scored against them.
+
+Matches are cached per context, e.g. the kind of tracks checked, the bucket,
+and the threshold, since the Beatcloud track names and the matches depend on
+them. A track with an exact match, i.e. with the same normalized name as a
+Beatcloud track, isn't scored against the other Beatcloud tracks, so it's
+checked again if the Beatcloud tracks it exactly matched are removed.
+"""
+
+from pathlib import Path
+import sqlite3
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+MATCH_CACHE_PATH = Path(__file__).parent / ".match_cache.db"
+# Seconds after which a track which wasn't checked again is forgotten.
+QUERY_TTL = 30 * 24 * 60 * 60
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    context TEXT NOT NULL,
+    track TEXT NOT NULL,
+    PRIMARY KEY (context, track)
+);
+CREATE TABLE IF NOT EXISTS queries (
+    context TEXT NOT NULL,
+    query TEXT NOT NULL,
+    name TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (context, query)
+);
+CREATE TABLE IF NOT EXISTS matches (
+    context TEXT NOT NULL,
+    query TEXT NOT NULL,
+    track TEXT NOT NULL,
+    ratio INTEGER NOT NULL,
+    exact INTEGER NOT NULL,
+    PRIMARY KEY (context, query, track)
+);
+CREATE INDEX IF NOT EXISTS matches_by_track ON matches (context, track);
+"""
+# Caches with another version of the schema are rebuilt.
+SCHEMA_VERSION = 2
+
+Match = Tuple[str, str, int, bool]
+
+
+class MatchCache:
+    """SQLite cache of the matches between tracks and Beatcloud tracks."""
+
+    def __init__(self, path: Path):
+        """Constructor.
+
+        Args:
+            path: Path to the SQLite database.
+        """
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            (version,) = self._connection.execute(
+                "PRAGMA user_version"
+            ).fetchone()
+            if version != SCHEMA_VERSION:
+                self._connection.executescript(
+                    "DROP TABLE IF EXISTS tracks;"
+                    "DROP TABLE IF EXISTS queries;"
+                    "DROP TABLE IF EXISTS matches;"
+                    f"PRAGMA user_version = {SCHEMA_VERSION};"
+                )
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the connection to the SQLite database."""
+        self._connection.close()
+
+    def add(
+        self,
+        context: str,
+        tracks: Iterable[str],
+        queries: Dict[str, str],
+        matches: Iterable[Match],
+        seen: float,
+    ):
+        """Adds Beatcloud tracks, the tracks checked against them, and their
+            matches.
+
+        Args:
+            context: Context of the matches.
+            tracks: Beatcloud tracks which were added.
+            queries: Normalized names of the tracks which were checked
+                against every Beatcloud track, and the variant of each which
+                was scored. Tracks which were already cached are only marked
+                as seen.
+            matches: Normalized name of a track, Beatcloud track, Levenshtein
+                similarity, and whether the match is exact.
+            seen: Time the tracks were checked.
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO tracks VALUES (?, ?)",
+                ((context, track) for track in tracks),
+            )
+            self._connection.executemany(
+                "INSERT INTO queries VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (context, query) "
+                "DO UPDATE SET last_seen = excluded.last_seen",
+                (
+                    (context, query, name, seen)
+                    for query, name in queries.items()
+                ),
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?)",
+                ((context, *match) for match in matches),
+            )
+
+    def get_matches(
+        self, context: str, queries: Iterable[str]
+    ) -> Dict[str, List[Tuple[str, int]]]:
+        """Gets the matches of tracks.
+
+        A track with exact matches only matches those, as when its matches are
+        found rather than cached.
+
+        Args:
+            context: Context of the matches.
+            queries: Normalized names of the tracks to get the matches of.
+
+        Returns:
+            Mapping of normalized names to their Beatcloud tracks and
+                Levenshtein similarities.
+        """
+        matches = {}
+        for query in queries:
+            rows = self._connection.execute(
+                "SELECT track, ratio, exact FROM matches "
+                "WHERE context = ? AND query = ? ORDER BY track",
+                (context, query),
+            ).fetchall()
+            exact = any(row[2] for row in rows)
+            matches[query] = [
+                (track, ratio)
+                for track, ratio, is_exact in rows
+                if is_exact or not exact
+            ]
+
+        return matches
+
+    def get_queries(self, context: str) -> Dict[str, str]:
+        """Gets the tracks which were checked against every Beatcloud track.
+
+        Args:
+            context: Context of the matches.
+
+        Returns:
+            Normalized names of the tracks which were checked and the variant
+                of each which was scored.
+        """
+        return dict(
+            self._connection.execute(
+                "SELECT query, name FROM queries WHERE context = ?", (context,)
+            )
+        )
+
+    def get_tracks(self, context: str) -> Set[str]:
+        """Gets the Beatcloud tracks the cached tracks were checked against.
+
+        Args:
+            context: Context of the matches.
+
+        Returns:
+            Beatcloud tracks.
+        """
+        return {
+            track
+            for (track,) in self._connection.execute(
+                "SELECT track FROM tracks WHERE context = ?", (context,)
+            )
+        }
+
+    def remove_queries(self, context: str, seen_before: float):
+        """Removes the tracks which weren't checked recently and their
+            matches.
+
+        Args:
+            context: Context of the matches.
+            seen_before: Time before which the tracks were last checked.
+        """
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM matches WHERE context = ? AND query IN ("
+                "SELECT query FROM queries "
+                "WHERE context = ? AND last_seen < ?)",
+                (context, context, seen_before),
+            )
+            self._connection.execute(
+                "DELETE FROM queries WHERE context = ? AND last_seen < ?",
+                (context, seen_before),
+            )
+
+    def remove_tracks(self, context: str, tracks: Iterable[str]):
+        """Removes Beatcloud tracks and their matches.
+
+        The tracks which exactly matched any of them weren't scored against
+        the other Beatcloud tracks, so they're forgotten to be checked again.
+
+        Args:
+            context: Context of the matches.
+            tracks: Beatcloud tracks which were removed.
+        """
+        tracks = list(tracks)
+        with self._connection:
+            queries = {
+                query
+                for track in tracks
+                for (query,) in self._connection.execute(
+                    "SELECT query FROM matches "
+                    "WHERE context = ? AND track = ? AND exact",
+                    (context, track),
+                )
+            }
+            for query in queries:
+                self._connection.execute(
+                    "DELETE FROM queries WHERE context = ? AND query = ?",
+                    (context, query),
+                )
+                self._connection.execute(
+                    "DELETE FROM matches WHERE context = ? AND query = ?",
+                    (context, query),
+                )
+            for track in tracks:
+                self._connection.execute(
+                    "DELETE FROM tracks WHERE context = ? AND track = ?",
+                    (context, track),
+                )
+                self._connection.execute(
+                    "DELETE FROM matches WHERE context = ? AND track = ?",
+                    (context, track),
+                )
@@ -0,0 +1,211 @@
+"""This module contains the run context: the resources shared by the
+operations of a run of `djtools`.
+
+`main` runs every configured operation in turn and many of them use the same
+resources, e.g. the parsed collection, the Spotify API client, the storage
+backend of the Beatcloud, or the listing of the Beatcloud. While a RunContext
+is active, the functions providing these resources create each of them once,
+when it's first used, and share it with the rest of the run. Work that should
+only happen once per run, like serializing the shared collection, is deferred
+until the context is flushed or closed. If the run fails, the deferred work is
+dropped.
+
+Outside a run context, e.g. in scripts or when calling an operation directly,
+every call creates a new resource.
+
+Operations may run concurrently, so a RunContext is safe to use from multiple
+threads; a resource requested by several threads at once is only created once.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+
+T = TypeVar("T")
+_RUN_CONTEXT: ContextVar[Optional["RunContext"]] = ContextVar(
+    "run_context", default=None
+)
+
+
+class RunContext:
+    """Resources shared by the operations of a run."""
+
+    def __init__(self):
+        """Constructor."""
+        self._closers: List[Callable[[], Any]] = []
+        self._deferred: Dict[Hashable, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._resources: Dict[Hashable, Any] = {}
+
+    def close(self, flush: bool = True):
+        """Runs the deferred work and then closes the resources.
+
+        Args:
+            flush: Whether to run the deferred work or drop it, e.g. because
+                the run failed and the resources may be half-modified.
+        """
+        try:
+            if flush:
+                self.flush()
+        finally:
+            with self._lock:
+                self._deferred.clear()
+            while self._closers:
+                self._closers.pop()()
+            with self._lock:
+                self._resources.clear()
+
+    def defer(self, key: Hashable, func: Callable[[], Any]):
+        """Defers work until the context is flushed.
+
+        Args:
+            key: Key of the resource the work is for. Deferring work for a key
+                replaces any work already deferred for it.
+            func: Work to do.
+        """
+        with self._lock:
+            self._deferred[key] = func
+
+    def discard(self, key: Hashable):
+        """Stops sharing a resource, e.g. because it's out of date.
+
+        Any work deferred for it is dropped.
+
+        Args:
+            key: Key of the resource.
+        """
+        with self._lock:
+            self._resources.pop(key, None)
+            self._deferred.pop(key, None)
+
+    def flush(self, key: Optional[Hashable] = None):
+        """Does the work deferred for a resource, or for every resource.
+
+        Args:
+            key: Key of the resource, or None for every resource.
+        """
+        with self._lock:
+            if key is None:
+                funcs = list(self._deferred.values())
+                self._deferred.clear()
+            else:
+                funcs = [self._deferred.pop(key, None)]
+        for func in funcs:
+            if func:
+                func()
+
+    def get(
+        self,
+        key: Hashable,
+        factory: Callable[[], T],
+        close: Optional[Callable[[T], Any]] = None,
+    ) -> T:
+        """Gets a shared resource, creating it if needed.
+
+        Args:
+            key: Key of the resource.
+            factory: Creates the resource.
+            close: Closes the resource when the context is closed.
+
+        Returns:
+            The resource.
+        """
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                if key in self._resources:
+                    return self._resources[key]
+            resource = factory()
+            with self._lock:
+                self._resources[key] = resource
+                if close:
+                    self._closers.append(lambda: close(resource))
+
+        return resource
+
+    def lookup(self, key: Hashable) -> Optional[Any]:
+        """Gets a shared resource if it exists.
+
+        Args:
+            key: Key of the resource.
+
+        Returns:
+            The resource or None if it hasn't been created.
+        """
+        with self._lock:
+            return self._resources.get(key)
+
+
+def flush_run_context():
+    """Does all the work deferred by the active run context, if any."""
+    context = get_run_context()
+    if context is not None:
+        context.flush()
+
+
+def get_run_context() -> Optional[RunContext]:
+    """Gets the active run context.
+
+    Returns:
+        The active RunContext or None if there isn't one.
+    """
+    return _RUN_CONTEXT.get()
+
+
+@contextmanager
+def run_context() -> Iterator[RunContext]:
+    """Activates a new run context, closing it on exit.
+
+    If the run fails, the deferred work is dropped rather than done, so that,
+    e.g., a collection an operation failed to finish modifying isn't
+    serialized.
+
+    Yields:
+        The RunContext.
+    """
+    context = RunContext()
+    token = _RUN_CONTEXT.set(context)
+    try:
+        yield context
+    except BaseException:
+        _RUN_CONTEXT.reset(token)
+        context.close(flush=False)
+        raise
+    _RUN_CONTEXT.reset(token)
+    context.close()
+
+
+def shared(
+    key: Hashable,
+    factory: Callable[[], T],
+    close: Optional[Callable[[T], Any]] = None,
+) -> T:
+    """Gets a resource shared by the active run context.
+
+    Args:
+        key: Key of the resource.
+        factory: Creates the resource.
+        close: Closes the resource when the run context is closed.
+
+    Returns:
+        The shared resource or, if there isn't an active run context, a new
+            one.
+    """
+    context = get_run_context()
+    if context is None:
+        return factory()
+
+    return context.get(key, factory, close)
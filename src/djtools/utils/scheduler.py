@@ -0,0 +1,180 @@
+"""This module contains the scheduler which runs the operations of `djtools`.
+
+Each operation declares the resources it reads and writes:
+
+    * "beatcloud": the Beatcloud
+    * "collection": the collection at "COLLECTION_PATH"
+    * "local": local audio files, e.g. those under "LOCAL_DIRS" or
+        "AUDIO_DESTINATION"
+    * "spotify": Spotify playlists and "spotify_playlists.yaml"
+    * "usb": the audio files under "USB_PATH"
+
+Two operations conflict if either one writes a resource the other reads or
+writes. Conflicting operations run in the order they're given in, while the
+rest run concurrently on threads, e.g. building collection playlists while
+updating Spotify playlists and downloading music. An operation which doesn't
+declare its resources conflicts with every other operation.
+"""
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+import contextvars
+import logging
+import time
+from typing import Callable, Dict, FrozenSet, Optional, Set, Tuple
+
+from djtools.configs.config import BaseConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+def _get_resources(
+    operation: Callable,
+) -> Optional[Tuple[FrozenSet[str], FrozenSet[str]]]:
+    """Gets the resources an operation reads and writes.
+
+    Args:
+        operation: Operation to get the resources of.
+
+    Returns:
+        The resources read and written or None if they're not declared.
+    """
+    reads = getattr(operation, "reads", None)
+    writes = getattr(operation, "writes", None)
+    if reads is None or writes is None:
+        return None
+
+    return reads, writes
+
+
+def conflicts(operation: Callable, other_operation: Callable) -> bool:
+    """Checks whether two operations can't run concurrently.
+
+    Args:
+        operation: An operation.
+        other_operation: Another operation.
+
+    Returns:
+        Whether either operation writes a resource the other one uses.
+    """
+    resources = _get_resources(operation)
+    other_resources = _get_resources(other_operation)
+    if resources is None or other_resources is None:
+        return True
+    reads, writes = resources
+    other_reads, other_writes = other_resources
+
+    return bool(writes & (other_reads | other_writes) or other_writes & reads)
+
+
+def get_dependencies(operations: Dict[str, Callable]) -> Dict[str, Set[str]]:
+    """Builds the dependency graph of operations.
+
+    Args:
+        operations: Operations keyed by name, in the order they'd run
+            sequentially.
+
+    Returns:
+        Names of the earlier operations each operation conflicts with.
+    """
+    dependencies = {}
+    for name, operation in operations.items():
+        dependencies[name] = {
+            other_name
+            for other_name in dependencies
+            if conflicts(operation, operations[other_name])
+        }
+
+    return dependencies
+
+
+def _run_operation(
+    name: str, operation: Callable, config: BaseConfig
+) -> float:
+    """Runs an operation and times it.
+
+    Args:
+        name: Name of the operation.
+        operation: Operation to run.
+        config: Configuration object.
+
+    Returns:
+        Seconds the operation took.
+    """
+    logger.info(f"{name}")
+    start = time.perf_counter()
+    operation(config)
+    seconds = time.perf_counter() - start
+    logger.info(f"{name} finished in {seconds:.2f} seconds")
+
+    return seconds
+
+
+def run_operations(
+    operations: Dict[str, Callable], config: BaseConfig
+) -> Dict[str, float]:
+    """Runs operations, concurrently where they don't conflict.
+
+    An operation starts once all the earlier operations it conflicts with have
+    finished. If an operation fails, no more operations are started and, once
+    those running have finished, its exception is raised.
+
+    Args:
+        operations: Operations keyed by name, in the order they'd run
+            sequentially.
+        config: Configuration object.
+
+    Returns:
+        Seconds each operation took.
+    """
+    dependencies = get_dependencies(operations)
+    finished: Set[str] = set()
+    running: Dict[Future, str] = {}
+    timings = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max(len(operations), 1)) as executor:
+        while dependencies or running:
+            if error is None:
+                for name, names in list(dependencies.items()):
+                    if names <= finished:
+                        del dependencies[name]
+                        # Operations see the run context of the caller.
+                        running[
+                            executor.submit(
+                                contextvars.copy_context().run,
+                                _run_operation,
+                                name,
+                                operations[name],
+                                config,
+                            )
+                        ] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                except Exception as exc:
+                    error = error or exc
+                finished.add(name)
+
+    if error is not None:
+        raise error
+
+    if timings:
+        logger.info(
+            "Operation timings: "
+            + ", ".join(
+                f"{name} {timings[name]:.2f}s"
+                for name in operations
+                if name in timings
+            )
+        )
+
+    return timings
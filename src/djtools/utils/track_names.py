@@ -0,0 +1,82 @@
+"""This module contains functions for parsing and normalizing track names of
+the form "TRACK TITLE - ARTIST NAME" (or "ARTIST NAME - TRACK TITLE" with
+"ARTIST_FIRST").
+
+Names are normalized so that variants of the same track, e.g. differing in
+case, punctuation, the order of the artists, or whether featured artists are
+credited in the title, have the same key. The results are cached since the
+same Beatcloud track names are parsed for every track they're compared with.
+The caches are bounded so that watching or checking many libraries in one
+process doesn't grow them without limit.
+"""
+
+from functools import lru_cache
+import re
+from typing import Tuple
+
+
+# Credits for featured artists, e.g. "(feat. Someone)" or "ft. Someone".
+FEATURING_REGEX = re.compile(
+    r"[(\[]?\s*\b(?:feat|ft|featuring)\b\.?\s*([^)\]]*)[)\]]?",
+    flags=re.IGNORECASE,
+)
+# Separators between the artists of a track.
+ARTIST_SEPARATOR_REGEX = re.compile(r"\s*[,&+]\s*|\s+(?:x|and|vs\.?|with)\s+")
+PUNCTUATION_REGEX = re.compile(r"[^\w\s]")
+# Track names cached by each of the functions below.
+TRACK_NAME_CACHE_SIZE = 2**16
+
+
+@lru_cache(maxsize=TRACK_NAME_CACHE_SIZE)
+def split_track_name(name: str, artist_first: bool = False) -> Tuple[str, str]:
+    """Splits a track name into its title and artists.
+
+    Titles may contain " - " but artists are assumed not to. A name without
+    " - " is taken to be only a title.
+
+    Args:
+        name: Track name.
+        artist_first: Whether the artists precede the title.
+
+    Returns:
+        Tuple of title and artists.
+    """
+    if " - " not in name:
+        return name, ""
+    if artist_first:
+        artists, _, title = name.partition(" - ")
+    else:
+        title, _, artists = name.rpartition(" - ")
+
+    return title, artists
+
+
+@lru_cache(maxsize=TRACK_NAME_CACHE_SIZE)
+def normalize_track_name(name: str, artist_first: bool = False) -> str:
+    """Normalizes a track name so that variants of it have the same key.
+
+    The title and artists are casefolded and stripped of punctuation,
+    featured artists credited in the title are moved to the artists, and the
+    artists are deduplicated and sorted.
+
+    Args:
+        name: Track name.
+        artist_first: Whether the artists precede the title.
+
+    Returns:
+        Normalized "TRACK TITLE - ARTIST NAME".
+    """
+    title, artists = split_track_name(name, artist_first)
+    artists = [artists]
+    for match in FEATURING_REGEX.finditer(title):
+        artists.append(match.group(1))
+    title = FEATURING_REGEX.sub(" ", title)
+    artists = {
+        " ".join(PUNCTUATION_REGEX.sub(" ", artist).split())
+        for artist in ARTIST_SEPARATOR_REGEX.split(
+            FEATURING_REGEX.sub(r",\1", ", ".join(artists)).casefold()
+        )
+    }
+    title = " ".join(PUNCTUATION_REGEX.sub(" ", title.casefold()).split())
+
+    return f"{title} - {', '.join(sorted(artists - {''}))}"
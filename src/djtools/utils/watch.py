@@ -0,0 +1,120 @@
+"""This module contains the watch mode of `djtools`.
+
+With "WATCH", `djtools` doesn't exit after running the configured operations.
+Instead, it polls "COLLECTION_PATH" and the sources of the configuration
+(`config.yaml` and `collection_playlists.yaml` or the templates it's rendered
+from) and re-runs the configured `collection` operations whenever they change,
+e.g. after exporting the collection from Rekordbox.
+
+The parsed collection is kept in the run context between runs, so only what
+changed is loaded again: the collection is only parsed again if
+"COLLECTION_PATH" changed and the configuration is only built again if its
+sources changed. A change is only acted on once the file has stopped changing
+for a poll, so a collection that's still being exported isn't read.
+"""
+
+import logging
+from pathlib import Path
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from djtools.collection import COLLECTION_OPERATIONS
+from djtools.collection.helpers import discard_collection
+from djtools.configs.config import BaseConfig
+from djtools.configs.helpers import build_config, get_config_sources
+from djtools.utils.run_context import flush_run_context
+from djtools.utils.scheduler import run_operations
+
+
+logger = logging.getLogger(__name__)
+# Seconds between polls of the watched files.
+WATCH_INTERVAL = 1.0
+
+Signature = Optional[Tuple[int, int]]
+
+
+def get_signatures(paths: Iterable[Path]) -> Dict[Path, Signature]:
+    """Gets the modified time and size of files.
+
+    Args:
+        paths: Paths of the files.
+
+    Returns:
+        Modified time and size of each file or None if it doesn't exist.
+    """
+    signatures = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+            signatures[path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signatures[path] = None
+
+    return signatures
+
+
+def watch(config: BaseConfig, interval: float = WATCH_INTERVAL):
+    """Re-runs the collection operations whenever their inputs change.
+
+    Failing to build the configuration or to run the operations is logged
+    rather than raised so that watching continues after, for example, an
+    invalid edit to `config.yaml` or a collection is exported which can't be
+    parsed. The previous configuration is kept until one is built
+    successfully. Watching stops on a keyboard interrupt.
+
+    Args:
+        config: Configuration object.
+        interval: Seconds between polls of the watched files.
+    """
+    paths = [config.COLLECTION_PATH, *get_config_sources()]
+    handled = previous = get_signatures(paths)
+    logger.info(
+        f"Watching {len(paths)} files for changes; press Ctrl+C to stop"
+    )
+    try:
+        while True:
+            time.sleep(interval)
+            current = get_signatures(paths)
+            # Wait for the files to stop changing, e.g. for an export to
+            # finish.
+            if current == handled or current != previous:
+                previous = current
+                continue
+            changed = {
+                path for path in paths if current[path] != handled[path]
+            }
+            logger.info(
+                "Changed: " + ", ".join(str(path) for path in sorted(changed))
+            )
+            if changed - {config.COLLECTION_PATH}:
+                try:
+                    config = build_config(cli=True)
+                except Exception as exc:
+                    logger.error(
+                        "Failed to build the configuration; keeping the "
+                        f"previous one: {exc}"
+                    )
+                    if config.COLLECTION_PATH not in changed:
+                        handled = previous = current
+                        continue
+            if config.COLLECTION_PATH in changed:
+                discard_collection(config)
+            try:
+                run_operations(
+                    {
+                        operation: func
+                        for operation, func in COLLECTION_OPERATIONS.items()
+                        if getattr(config, operation)
+                    },
+                    config,
+                )
+                flush_run_context()
+            except Exception as exc:
+                logger.error(f"Failed to run the collection operations: {exc}")
+                discard_collection(config)
+            # The collection operations write to the watched collection, which
+            # mustn't trigger another run.
+            paths = [config.COLLECTION_PATH, *get_config_sources()]
+            handled = previous = get_signatures(paths)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
@@ -1,5 +1,6 @@
 """Testing for the config module."""
 
+import sys
 from unittest import mock
 
 import pytest
@@ -26,6 +27,16 @@ def test_collectionconfig_collection_is_unset_or_missing():
         CollectionConfig(**cfg)
 
 
+@mock.patch.dict(sys.modules, {"mutagen": None})
+def test_collectionconfig_write_tags_requires_mutagen():
+    """Test for the CollectionConfig class."""
+    with pytest.raises(
+        RuntimeError,
+        match="Using the SHUFFLE_PLAYLISTS_WRITE_TAGS feature requires mutagen",
+    ):
+        CollectionConfig(SHUFFLE_PLAYLISTS_WRITE_TAGS=True)
+
+
 @mock.patch(
     "djtools.collection.config.Path.exists",
     lambda path: mock_exists(
@@ -115,7 +126,7 @@ def test_collectionconfig_without_template(
         files=["collection_playlists.yaml"],
     ).open,
 )
-@mock.patch("djtools.collection.config.Environment.get_template")
+@mock.patch("jinja2.Environment.get_template")
 def test_collectionconfig_with_template(mock_get_template, rekordbox_xml):
     """Test for the CollectionConfig class."""
     new_content = ""
@@ -125,7 +136,7 @@ def test_collectionconfig_with_template(mock_get_template, rekordbox_xml):
     assert config.playlist_config == PlaylistConfig()
 
 
-@mock.patch("djtools.collection.config.Environment.get_template")
+@mock.patch("jinja2.Environment.get_template")
 def test_collectionconfig_with_invalid_template(
     mock_get_template, rekordbox_xml
 ):
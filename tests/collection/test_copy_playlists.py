@@ -1,10 +1,15 @@
 """Testing for the copy_playlists module."""
 
 from pathlib import Path
+from unittest import mock
 
 import pytest
 
 from djtools.collection.copy_playlists import copy_playlists
+from djtools.collection.helpers import (
+    load_copy_manifest,
+    write_copy_manifest,
+)
 from djtools.collection.rekordbox_collection import RekordboxCollection
 
 
@@ -114,3 +119,44 @@ def test_copy_playlists_creates_new_collection_with_default_path(
     assert not new_collection.exists()
     copy_playlists(config)
     assert new_collection.exists()
+
+
+@mock.patch("djtools.collection.copy_playlists.MANIFEST_FLUSH_INTERVAL", 1)
+def test_copy_playlists_mirror_only_copies_the_delta(
+    tmpdir, config, rekordbox_collection, rekordbox_xml, caplog
+):
+    """Test for the copy_playlists function."""
+    caplog.set_level("INFO")
+    target_playlist = "Hip Hop"
+    test_output_dir = Path(tmpdir) / "output"
+    config.COLLECTION_PATH = rekordbox_xml
+    config.COPY_PLAYLISTS = [target_playlist]
+    config.COPY_PLAYLISTS_DESTINATION = test_output_dir
+    config.COPY_PLAYLISTS_MIRROR = True
+    new_collection = Path(tmpdir) / "test_collection"
+    tracks = {
+        track.get_location().name
+        for playlist in rekordbox_collection.get_playlists(target_playlist)
+        for track in playlist.get_tracks().values()
+    }
+    copy_playlists(config, path=new_collection)
+    manifest = load_copy_manifest(test_output_dir)
+    assert set(manifest) == tracks
+    assert caplog.records[-2].message.endswith(
+        f"{len(tracks)} added, 0 updated, 0 deleted"
+    )
+
+    # Re-running with the same playlists copies nothing and removes the files
+    # of tracks which are no longer in the playlists.
+    caplog.clear()
+    stale_track = test_output_dir / "stale.mp3"
+    stale_track.write_text("", encoding="utf-8")
+    manifest[stale_track.name] = dict(manifest[next(iter(tracks))])
+    write_copy_manifest(test_output_dir, manifest)
+    copy_playlists(config, path=new_collection)
+    assert caplog.records[-2].message.endswith("0 added, 0 updated, 1 deleted")
+    assert not stale_track.exists()
+    assert set(load_copy_manifest(test_output_dir)) == tracks
+    collection = RekordboxCollection(new_collection)
+    for track in collection.get_tracks().values():
+        assert track.get_location().parent == test_output_dir
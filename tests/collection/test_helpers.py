@@ -1,11 +1,16 @@
 """Testing for the helpers module."""
 
+# pylint: disable=too-many-lines
+
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
 import re
+import threading
+import time
 from unittest import mock
 
+import mutagen
 import pytest
 
 from djtools.collection.base_collection import Collection
@@ -17,23 +22,39 @@ from djtools.collection.helpers import (
     aggregate_playlists,
     BooleanNode,
     build_combiner_playlists,
+    build_copy_plan,
     build_tag_playlists,
     copy_file,
+    COPY_MANIFEST_NAME,
     DATE_SELECTOR_REGEX,
     filter_tag_playlists,
+    find_playlist_track_keys,
+    find_track_locations,
+    flush_collection,
+    hash_file,
     INEQUALITY_MAP,
+    insert_playlist_node,
+    load_collection,
+    load_copy_manifest,
+    mirror_file,
     parse_expression,
     parse_numerical_selectors,
     parse_string_selectors,
     parse_timedelta,
+    patch_track_numbers,
     PLATFORM_REGISTRY,
     print_data,
     print_playlists_tag_statistics,
+    save_collection,
     scale_data,
+    schedule_copies,
+    write_track_number_tag,
+    write_copy_manifest,
 )
 from djtools.collection.rekordbox_collection import RekordboxCollection
 from djtools.collection.rekordbox_playlist import RekordboxPlaylist
-
+from djtools.utils.run_context import run_context
+from djtools.utils.scheduler import run_operations
 
 # pylint: disable=duplicate-code
 
@@ -42,14 +63,264 @@ def test_copy_file(tmpdir, rekordbox_track):
     """Test for the copy_file function."""
     dest_dir = Path(tmpdir) / "output"
     dest_dir.mkdir(parents=True, exist_ok=True)
-    file_name = rekordbox_track.get_location().name
-    copy_file(track=rekordbox_track, destination=dest_dir)
-    new_file_path = dest_dir / file_name
-    # NOTE(a-rich): `Location` attributes in the XML's `TRACK` tags always
-    # have unix-style paths so comparisons made with paths created in Windows
-    # must be interpreted `.as_posix()`.
-    assert rekordbox_track.get_location() == new_file_path
+    source = rekordbox_track.get_location()
+    new_file_path = dest_dir / source.name
+    copy_file(source, new_file_path)
     assert new_file_path.exists()
+    with mock.patch("djtools.collection.helpers.shutil.copyfile") as mock_copy:
+        copy_file(source, new_file_path)
+        mock_copy.assert_not_called()
+
+
+def test_build_copy_plan(tmpdir):
+    """Test for the build_copy_plan function."""
+    source_dir = Path(tmpdir) / "source"
+    other_dir = Path(tmpdir) / "other"
+    dest_dir = Path(tmpdir) / "output"
+    for _dir in [source_dir, other_dir, dest_dir]:
+        _dir.mkdir()
+    for name in ["added", "unchanged", "touched", "modified", "adopted"]:
+        (source_dir / f"{name}.mp3").write_text(name, encoding="utf-8")
+    (other_dir / "added.mp3").write_text("duplicate name", encoding="utf-8")
+    manifest = {}
+    for name in ["unchanged", "touched", "modified", "stale"]:
+        source = source_dir / f"{name}.mp3"
+        content = name if name != "stale" else "removed"
+        (dest_dir / source.name).write_text(content, encoding="utf-8")
+        manifest[source.name] = {
+            "source": source.as_posix(),
+            "size": len(content),
+            "mtime": source.stat().st_mtime if name == "unchanged" else 0,
+            "hash": hash_file(dest_dir / source.name),
+        }
+    (dest_dir / "adopted.mp3").write_text("adopted", encoding="utf-8")
+    (source_dir / "modified.mp3").write_text("modifie!", encoding="utf-8")
+    tracks = {
+        str(index): mock.Mock(get_location=mock.Mock(return_value=path))
+        for index, path in enumerate(
+            [other_dir / "added.mp3"] + sorted(source_dir.iterdir())
+        )
+    }
+
+    copies, deletes, saved_bytes = build_copy_plan(tracks, dest_dir, manifest)
+
+    assert copies == [
+        (other_dir / "added.mp3", dest_dir / "added.mp3", "add"),
+        (source_dir / "modified.mp3", dest_dir / "modified.mp3", "update"),
+    ]
+    assert deletes == ["stale.mp3"]
+    assert saved_bytes == len("unchanged") + len("touched") + len("adopted")
+    assert manifest["adopted.mp3"]["hash"] == hash_file(
+        source_dir / "adopted.mp3"
+    )
+    assert (
+        manifest["touched.mp3"]["mtime"]
+        == (source_dir / "touched.mp3").stat().st_mtime
+    )
+    for track in tracks.values():
+        location = track.get_location.return_value
+        track.set_location.assert_called_once_with(dest_dir / location.name)
+
+
+def test_copy_manifest_round_trip(tmpdir):
+    """Test for the load_copy_manifest and write_copy_manifest functions."""
+    manifest = {
+        "track.mp3": {
+            "source": "/path/to/track.mp3",
+            "size": 1,
+            "mtime": 1.0,
+            "hash": "hash",
+        }
+    }
+    assert load_copy_manifest(tmpdir) == {}
+    write_copy_manifest(tmpdir, manifest)
+    assert load_copy_manifest(tmpdir) == manifest
+    assert [path.name for path in Path(tmpdir).iterdir()] == [
+        COPY_MANIFEST_NAME
+    ]
+
+
+def test_load_copy_manifest_handles_corrupt_manifest(tmpdir, caplog):
+    """Test for the load_copy_manifest function."""
+    caplog.set_level("WARNING")
+    manifest_path = Path(tmpdir) / COPY_MANIFEST_NAME
+    manifest_path.write_text("{", encoding="utf-8")
+    assert load_copy_manifest(tmpdir) == {}
+    assert caplog.records[0].message.startswith(f"{manifest_path} is corrupt")
+
+
+def test_mirror_file(tmpdir):
+    """Test for the mirror_file function."""
+    source = Path(tmpdir) / "source.mp3"
+    dest = Path(tmpdir) / "output" / "source.mp3"
+    dest.parent.mkdir()
+    source.write_bytes(b"audio" * 1000)
+    digest = mirror_file(source, dest, 7)
+    assert digest == hash_file(source)
+    assert dest.read_bytes() == source.read_bytes()
+    assert dest.stat().st_mtime == source.stat().st_mtime
+    assert list(dest.parent.iterdir()) == [dest]
+
+
+def test_mirror_file_removes_partial_file_on_failure(tmpdir):
+    """Test for the mirror_file function."""
+    source = Path(tmpdir) / "source.mp3"
+    dest = Path(tmpdir) / "output" / "source.mp3"
+    dest.parent.mkdir()
+    source.write_bytes(b"audio" * 1000)
+    with (
+        mock.patch(
+            "djtools.collection.helpers.shutil.copystat",
+            side_effect=OSError("failed"),
+        ),
+        pytest.raises(OSError, match="failed"),
+    ):
+        mirror_file(source, dest, 7)
+    assert not list(dest.parent.iterdir())
+
+
+@pytest.mark.parametrize("workers_per_device", [1, 3])
+def test_schedule_copies(workers_per_device, tmpdir, caplog):
+    """Test for the schedule_copies function."""
+    caplog.set_level("INFO")
+    source_dir = Path(tmpdir) / "source"
+    dest_dir = Path(tmpdir) / "output"
+    source_dir.mkdir()
+    dest_dir.mkdir()
+    copies = []
+    for index in range(10):
+        source = source_dir / f"{index}.mp3"
+        source.write_text("audio", encoding="utf-8")
+        copies.append((source, dest_dir / source.name))
+    lock = threading.Lock()
+    running = []
+    concurrency = []
+    started = []
+
+    def func(source, dest):
+        with lock:
+            started.append(source)
+            running.append(source)
+            concurrency.append(len(running))
+        copy_file(source, dest)
+        time.sleep(0.01)
+        with lock:
+            running.remove(source)
+        return dest.name
+
+    results = list(
+        schedule_copies(list(reversed(copies)), func, workers_per_device)
+    )
+    assert sorted(results) == sorted(
+        (source, dest, dest.name) for source, dest in copies
+    )
+    assert max(concurrency) <= workers_per_device
+    assert len(list(dest_dir.iterdir())) == len(copies)
+    if workers_per_device == 1:
+        assert started == sorted(
+            started, key=lambda source: source.stat().st_ino
+        )
+    assert caplog.records[-1].message.startswith(
+        f"Copied {len(copies)} files (50.0B) at "
+    )
+
+
+def test_schedule_copies_handles_no_copies(caplog):
+    """Test for the schedule_copies function."""
+    caplog.set_level("INFO")
+    assert not list(schedule_copies([], copy_file, 1))
+    assert not caplog.records
+
+
+def test_schedule_copies_cancels_pending_copies_on_failure(tmpdir):
+    """Test for the schedule_copies function."""
+    source = Path(tmpdir) / "source.mp3"
+    source.write_text("audio", encoding="utf-8")
+    copies = [(source, Path(tmpdir) / f"{index}.mp3") for index in range(10)]
+
+    def fail(*_):
+        time.sleep(0.05)
+        raise RuntimeError("disk full")
+
+    func = mock.Mock(side_effect=fail)
+    with pytest.raises(RuntimeError, match="disk full"):
+        list(schedule_copies(copies, func, 1))
+    assert func.call_count < len(copies)
+
+
+def test_load_collection(config, rekordbox_xml, tmpdir):
+    """Test for the load_collection function."""
+    config.COLLECTION_PATH = Path(tmpdir) / "rekordbox.xml"
+    config.COLLECTION_PATH.write_bytes(rekordbox_xml.read_bytes())
+    assert load_collection(config) is not load_collection(config)
+    with run_context():
+        collection = load_collection(config)
+        assert isinstance(collection, RekordboxCollection)
+        assert load_collection(config) is collection
+        assert load_collection(config, shared=False) is not collection
+
+
+def test_save_collection(config, rekordbox_xml, tmpdir):
+    """Test for the save_collection function."""
+    config.COLLECTION_PATH = Path(tmpdir) / "rekordbox.xml"
+    config.COLLECTION_PATH.write_bytes(rekordbox_xml.read_bytes())
+    path = Path(tmpdir) / "copy.xml"
+    with run_context():
+        collection = load_collection(config)
+        collection.get_playlists().remove_playlist(
+            collection.get_playlists()[0]
+        )
+        content = config.COLLECTION_PATH.read_text(encoding="utf-8")
+        assert save_collection(config, collection) == config.COLLECTION_PATH
+        assert config.COLLECTION_PATH.read_text(encoding="utf-8") == content
+        assert save_collection(config, collection, path=path) == path
+        own_collection = load_collection(config, shared=False)
+        assert config.COLLECTION_PATH.read_text(encoding="utf-8") != content
+        assert str(own_collection) == str(collection)
+        save_collection(config, collection)
+    assert str(RekordboxCollection(config.COLLECTION_PATH)) == str(collection)
+
+
+def test_save_collection_is_dropped_if_the_run_fails(
+    config, rekordbox_xml, tmpdir
+):
+    """Test for the save_collection function."""
+    config.COLLECTION_PATH = Path(tmpdir) / "rekordbox.xml"
+    config.COLLECTION_PATH.write_bytes(rekordbox_xml.read_bytes())
+    content = config.COLLECTION_PATH.read_text(encoding="utf-8")
+
+    def save(_):
+        save_collection(config, load_collection(config))
+
+    def fail(_):
+        collection = load_collection(config)
+        collection.get_playlists().remove_playlist(
+            collection.get_playlists()[0]
+        )
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError, match="failed"):
+        with run_context():
+            run_operations({"SAVE": save, "FAIL": fail}, config)
+    assert config.COLLECTION_PATH.read_text(encoding="utf-8") == content
+
+
+def test_flush_collection(config, rekordbox_xml, tmpdir):
+    """Test for the flush_collection function."""
+    config.COLLECTION_PATH = Path(tmpdir) / "rekordbox.xml"
+    config.COLLECTION_PATH.write_bytes(rekordbox_xml.read_bytes())
+    flush_collection(config)
+    with run_context():
+        collection = load_collection(config)
+        collection.get_playlists().remove_playlist(
+            collection.get_playlists()[0]
+        )
+        save_collection(config, collection)
+        flush_collection(config, discard=True)
+        assert str(RekordboxCollection(config.COLLECTION_PATH)) == str(
+            collection
+        )
+        assert load_collection(config) is not collection
 
 
 def test_platform_registry_structure():
@@ -869,3 +1140,144 @@ def test_print_data(capsys):
     print_data(data)
     cap = capsys.readouterr()
     assert cap.out == expected
+
+
+def test_find_playlist_track_keys():
+    """Test for the find_playlist_track_keys function."""
+    xml = (
+        '<PLAYLISTS>\n<NODE Type="0" Name="ROOT" Count="3">\n'
+        '<NODE Name="R&amp;B" Type="1" KeyType="0" Entries="2">\n'
+        '<TRACK Key="1"/>\n<TRACK Key="2"/>\n</NODE>\n'
+        '<NODE Name="Folder" Type="0" Count="2">\n'
+        '<NODE Name="R&amp;B" Type="1" Entries="1">\n<TRACK Key="3"/>\n'
+        "</NODE>\n"
+        '<NODE Name="Other" Type="1" KeyType="1" Entries="1">\n'
+        '<TRACK Key="/path/to/track.mp3"/>\n</NODE>\n</NODE>\n'
+        '<NODE Name="Empty" Type="1" Entries="0"/>\n'
+        "</NODE>\n</PLAYLISTS>\n"
+    )
+    playlists, root, root_close = find_playlist_track_keys(
+        xml, ["R&B", "Empty", "Folder"]
+    )
+    assert playlists == {
+        "R&B": [["1", "2"], ["3"]],
+        "Empty": [[]],
+        "Folder": [[]],
+    }
+    assert root.group() == '<NODE Type="0" Name="ROOT" Count="3">'
+    assert root_close.start() == xml.rindex("</NODE>")
+
+
+@pytest.mark.parametrize(
+    "xml,error",
+    [
+        (
+            '<COLLECTION Entries="0">\n<TRACK TrackID="1"/>\n</COLLECTION>\n',
+            "Collection has no PLAYLISTS section",
+        ),
+        (
+            '<PLAYLISTS>\n<NODE Type="0" Name="ROOT" Count="1">\n'
+            '<NODE Name="R&amp;B" Type="1" KeyType="1" Entries="1">\n'
+            '<TRACK Key="/path/to/track.mp3"/>\n</NODE>\n</NODE>\n'
+            "</PLAYLISTS>\n",
+            'Playlist "R&B" has KeyType "1"',
+        ),
+    ],
+)
+def test_find_playlist_track_keys_raises_runtimeerror(xml, error):
+    """Test for the find_playlist_track_keys function."""
+    with pytest.raises(RuntimeError, match=error):
+        find_playlist_track_keys(xml, ["R&B"])
+
+
+@pytest.mark.parametrize(
+    "keys,expected",
+    [
+        (
+            ["2", "1"],
+            '<NODE Name="SHUFFLE" Type="1" KeyType="0" Entries="2">\n'
+            '      <TRACK Key="2"/>\n      <TRACK Key="1"/>\n    </NODE>',
+        ),
+        ([], '<NODE Name="SHUFFLE" Type="1" KeyType="0" Entries="0"/>'),
+    ],
+)
+def test_insert_playlist_node(keys, expected):
+    """Test for the insert_playlist_node function."""
+    xml = (
+        '<PLAYLISTS>\n  <NODE Name="ROOT" Type="0" Count="1">\n'
+        '    <NODE Name="Dark" Type="1" Entries="0"/>\n  </NODE>\n'
+        "</PLAYLISTS>\n"
+    )
+    _, root, root_close = find_playlist_track_keys(xml, [])
+    result = insert_playlist_node(xml, root, root_close, "SHUFFLE", keys)
+    assert result == (
+        '<PLAYLISTS>\n  <NODE Name="ROOT" Type="0" Count="2">\n'
+        '    <NODE Name="Dark" Type="1" Entries="0"/>\n'
+        f"    {expected}\n  </NODE>\n</PLAYLISTS>\n"
+    )
+
+
+def test_patch_track_numbers():
+    """Test for the patch_track_numbers function."""
+    xml = (
+        '<COLLECTION>\n<TRACK TrackID="1" TrackNumber="7">\n<TEMPO/>\n'
+        '</TRACK>\n<TRACK TrackID="2" TrackNumber="8"/>\n'
+        '<TRACK TrackID="3" Name="No number"/>\n'
+        '<TRACK TrackID="4" TrackNumber="9"/>\n</COLLECTION>\n'
+        '<PLAYLISTS>\n<TRACK Key="4"/>\n</PLAYLISTS>\n'
+    )
+    result = patch_track_numbers(
+        xml, {"1": 2, "3": 1, "4": 3}, xml.find("<PLAYLISTS")
+    )
+    assert result == (
+        '<COLLECTION>\n<TRACK TrackID="1" TrackNumber="2">\n<TEMPO/>\n'
+        '</TRACK>\n<TRACK TrackID="2" TrackNumber="8"/>\n'
+        '<TRACK TrackID="3" Name="No number" TrackNumber="1"/>\n'
+        '<TRACK TrackID="4" TrackNumber="3"/>\n</COLLECTION>\n'
+        '<PLAYLISTS>\n<TRACK Key="4"/>\n</PLAYLISTS>\n'
+    )
+    assert patch_track_numbers(xml, {"1": 1}) == xml.replace(
+        'TrackNumber="7"', 'TrackNumber="1"'
+    )
+
+
+def test_find_track_locations():
+    """Test for the find_track_locations function."""
+    xml = (
+        '<COLLECTION>\n<TRACK TrackID="1" '
+        'Location="file://localhost/music/R%26B%20track.mp3"/>\n'
+        '<TRACK TrackID="2" Location="file://localhost/music/2.mp3"/>\n'
+        '<TRACK TrackID="3" Location="file://localhost/music/3.mp3"/>\n'
+        "</COLLECTION>\n"
+    )
+    assert find_track_locations(xml, {"1", "3"}) == {
+        "1": Path("/music/R&B track.mp3"),
+        "3": Path("/music/3.mp3"),
+    }
+    assert not find_track_locations(xml, {"2"}, xml.find('TrackID="2"'))
+
+
+@pytest.mark.parametrize("track_number", [None, "3", "3/12", "5"])
+def test_write_track_number_tag(track_number, tmpdir):
+    """Test for the write_track_number_tag function."""
+    path = Path(tmpdir) / "track.mp3"
+    path.write_bytes((b"\xff\xfb\x90\x64" + b"\x00" * 413) * 10)
+    if track_number:
+        audio_file = mutagen.File(path, easy=True)
+        audio_file.add_tags()
+        audio_file.tags["tracknumber"] = track_number
+        audio_file.save()
+    size = path.stat().st_size
+    written = write_track_number_tag(path, 3)
+    assert written == (track_number not in ["3", "3/12"])
+    assert mutagen.File(path, easy=True).tags["tracknumber"][0].startswith("3")
+    if track_number:
+        assert path.stat().st_size == size
+
+
+def test_write_track_number_tag_handles_unsupported_file(tmpdir):
+    """Test for the write_track_number_tag function."""
+    path = Path(tmpdir) / "track.txt"
+    path.write_text("not audio", encoding="utf-8")
+    with pytest.raises(RuntimeError, match="is not a supported audio file"):
+        write_track_number_tag(path, 1)
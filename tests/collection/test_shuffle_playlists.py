@@ -1,15 +1,27 @@
 """Testing for the shuffle_playlists module."""
 
+from pathlib import Path
+import threading
+import time
+from unittest import mock
+
 import pytest
 
 from djtools.collection.base_playlist import Playlist
 from djtools.collection.rekordbox_collection import RekordboxCollection
-from djtools.collection.shuffle_playlists import shuffle_playlists
+from djtools.collection.shuffle_playlists import (
+    shuffle_playlists,
+    write_track_number_tags,
+)
 
 
-def test_shuffle_playlists_handles_missing_playlist(config, rekordbox_xml):
+@pytest.mark.parametrize("in_place", [False, True])
+def test_shuffle_playlists_handles_missing_playlist(
+    in_place, config, rekordbox_xml
+):
     """Test shuffle_playlists function."""
     playlist = "nonexistent playlist"
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = in_place
     config.COLLECTION_PATH = rekordbox_xml
     config.SHUFFLE_PLAYLISTS = [playlist]
     with pytest.raises(
@@ -19,10 +31,12 @@ def test_shuffle_playlists_handles_missing_playlist(config, rekordbox_xml):
         shuffle_playlists(config)
 
 
+@pytest.mark.parametrize("in_place", [False, True])
 def test_shuffle_playlists_shuffles_track_numbers(
-    config, rekordbox_collection, rekordbox_xml, tmpdir
+    in_place, config, rekordbox_collection, rekordbox_xml, tmpdir
 ):
     """Test shuffle_playlists function."""
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = in_place
     playlist = "Hip Hop"
     config.COLLECTION_PATH = rekordbox_xml
     config.SHUFFLE_PLAYLISTS = [playlist]
@@ -43,10 +57,12 @@ def test_shuffle_playlists_shuffles_track_numbers(
     assert old_track_id_number_map.values() != new_track_id_number_map.values()
 
 
+@pytest.mark.parametrize("in_place", [False, True])
 def test_shuffle_playlists_creates_new_playlist(
-    config, rekordbox_collection, rekordbox_xml, tmpdir
+    in_place, config, rekordbox_collection, rekordbox_xml, tmpdir
 ):
     """Test shuffle_playlists function."""
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = in_place
     target_playlist = "Hip Hop"
     output_playlist = "SHUFFLE"
     config.COLLECTION_PATH = rekordbox_xml
@@ -60,10 +76,12 @@ def test_shuffle_playlists_creates_new_playlist(
     assert isinstance(shuffle_playlist, Playlist)
 
 
+@pytest.mark.parametrize("in_place", [False, True])
 def test_shuffle_playlists_creates_new_collection(
-    config, rekordbox_xml, tmpdir
+    in_place, config, rekordbox_xml, tmpdir
 ):
     """Test shuffle_playlists function."""
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = in_place
     playlist = "Hip Hop"
     config.COLLECTION_PATH = rekordbox_xml
     config.SHUFFLE_PLAYLISTS = [playlist]
@@ -71,3 +89,120 @@ def test_shuffle_playlists_creates_new_collection(
     assert not new_collection.exists()
     shuffle_playlists(config, path=new_collection)
     assert new_collection.exists()
+
+
+def test_shuffle_playlists_in_place_only_patches_shuffled_tracks(
+    config, rekordbox_xml, tmpdir
+):
+    """Test shuffle_playlists function."""
+    config.COLLECTION_PATH = rekordbox_xml
+    config.SHUFFLE_PLAYLISTS = ["Hip Hop"]
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = True
+    new_collection = Path(tmpdir) / "test_collection"
+    shuffle_playlists(config, path=new_collection)
+    old_xml = rekordbox_xml.read_text(encoding="utf-8")
+    new_xml = new_collection.read_text(encoding="utf-8")
+    expected = old_xml.replace(
+        'TrackID="2" TrackNumber="2"', 'TrackID="2" TrackNumber="1"'
+    )
+    expected = expected.replace(
+        '<NODE Type="0" Name="ROOT" Count="3">',
+        '<NODE Type="0" Name="ROOT" Count="4">',
+    )
+    expected = expected.replace(
+        "\n    </NODE>\n  </PLAYLISTS>",
+        '\n      <NODE Name="SHUFFLE" Type="1" KeyType="0" Entries="1">'
+        '\n        <TRACK Key="2"/>\n      </NODE>\n    </NODE>\n  </PLAYLISTS>',
+    )
+    assert new_xml == expected
+
+
+def test_shuffle_playlists_in_place_keeps_crlf_newlines(
+    config, rekordbox_xml, tmpdir
+):
+    """Test shuffle_playlists function."""
+    config.COLLECTION_PATH = Path(tmpdir) / "crlf_collection.xml"
+    config.COLLECTION_PATH.write_bytes(
+        rekordbox_xml.read_bytes().replace(b"\n", b"\r\n")
+    )
+    config.SHUFFLE_PLAYLISTS = ["Hip Hop"]
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = True
+    new_collection = Path(tmpdir) / "test_collection"
+    shuffle_playlists(config, path=new_collection)
+    new_xml = new_collection.read_bytes()
+    assert b"\r\n" in new_xml
+    assert new_xml.count(b"\n") == new_xml.count(b"\r\n")
+
+
+@pytest.mark.parametrize("in_place", [False, True])
+@mock.patch("djtools.collection.shuffle_playlists.write_track_number_tag")
+def test_shuffle_playlists_writes_tags(
+    mock_write_track_number_tag,
+    in_place,
+    config,
+    rekordbox_xml,
+    tmpdir,
+    caplog,
+):
+    """Test shuffle_playlists function."""
+    caplog.set_level("INFO")
+    config.COLLECTION_PATH = rekordbox_xml
+    config.SHUFFLE_PLAYLISTS = ["Hip Hop"]
+    config.SHUFFLE_PLAYLISTS_IN_PLACE = in_place
+    config.SHUFFLE_PLAYLISTS_WRITE_TAGS = True
+    mock_write_track_number_tag.return_value = True
+    shuffle_playlists(config, path=Path(tmpdir) / "test_collection")
+    mock_write_track_number_tag.assert_called_once_with(
+        rekordbox_xml.parent / "track2.mp3", 1
+    )
+    assert caplog.records[-1].message == (
+        "Wrote track numbers to 1 files; 0 already matched and 0 failed"
+    )
+
+
+@mock.patch(
+    "djtools.collection.shuffle_playlists.write_track_number_tag",
+    side_effect=[False, RuntimeError("not an audio file")],
+)
+def test_write_track_number_tags_handles_failures(
+    mock_write_track_number_tag, caplog
+):
+    """Test write_track_number_tags function."""
+    caplog.set_level("INFO")
+    write_track_number_tags({Path("1.mp3"): 1, Path("2.mp3"): 2}, 2)
+    assert mock_write_track_number_tag.call_count == 2
+    assert caplog.records[0].message == (
+        f"Failed to write track number to {Path('2.mp3')}: not an audio file"
+    )
+    assert caplog.records[1].message == (
+        "Wrote track numbers to 0 files; 1 already matched and 1 failed"
+    )
+
+
+def test_write_track_number_tags_caps_writes_per_device(tmpdir):
+    """Test write_track_number_tags function."""
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def write_track_number_tag(*_):
+        with lock:
+            running.append(None)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+        return True
+
+    track_numbers = {}
+    for number in range(8):
+        location = Path(tmpdir) / f"{number}.mp3"
+        location.write_text("", encoding="utf-8")
+        track_numbers[location] = number
+    with mock.patch(
+        "djtools.collection.shuffle_playlists.write_track_number_tag",
+        write_track_number_tag,
+    ):
+        write_track_number_tags(track_numbers, 2)
+    assert len(peak) == 8
+    assert max(peak) <= 2
@@ -8,20 +8,22 @@ from djtools.configs.config import BaseConfig
 from djtools.spotify.config import SpotifyConfig
 
 
-@mock.patch(
-    "inspect.stack",
-    new=mock.Mock(
-        return_value=[
-            "",
-            "",
-            ["", "", "", "build_config"],
-            ["", "bin/djtools"],
-        ],
-    ),
-)
-def test_baseconfig_limits_repr_in_cli_execution():
+def test_baseconfig_logs_own_fields(caplog):
     """Test for the BaseConfig class."""
-    BaseConfig(key="value")
+    caplog.set_level("INFO")
+    base_config = BaseConfig(key="value")
+    assert "key=value" not in caplog.records[0].message
+    assert "key=value" in repr(base_config)
+
+
+def test_baseconfig_builds_repr_only_when_logging_info(caplog):
+    """Test for the BaseConfig class."""
+    caplog.set_level("WARNING")
+    with mock.patch.object(
+        BaseConfig, "_repr", autospec=True, return_value=""
+    ) as mock_repr:
+        BaseConfig()
+    mock_repr.assert_not_called()
 
 
 def test_baseconfig_repr_differentiates_baseconfig_and_subclasses():
@@ -1,6 +1,5 @@
 """Testing for the helpers module."""
 
-import inspect
 import logging
 from pathlib import Path
 import re
@@ -13,7 +12,11 @@ from djtools.configs.helpers import (
     _arg_parse,
     BaseConfig,
     build_config,
+    _build_configs,
     _filter_dict,
+    get_config_sources,
+    get_snapshot_key,
+    PLAYLIST_CONFIG_PATH,
     PKG_CFG,
 )
 from djtools.version import get_version
@@ -117,7 +120,7 @@ def test_build_config_no_config_yaml(
     )
     config_file = config_dir / "config.yaml"
     assert not config_file.exists()
-    build_config()
+    build_config(cli=True)
     assert config_file.exists()
 
 
@@ -142,7 +145,7 @@ def test_build_config_overrides_using_args(mock_parse_args, namespace):
     """Test for the build_config function."""
     namespace.artist_first = True
     mock_parse_args.return_value = namespace
-    config = build_config()
+    config = build_config(cli=True)
     assert config.ARTIST_FIRST is True
 
 
@@ -161,11 +164,11 @@ def test_build_config_reads_generated_config(
 
     # config.yaml won't exist so build_config generates one.
     assert not config_file.exists()
-    first_config = build_config()
+    first_config = build_config(cli=True)
 
     # config.yaml now exists so build_config reads the pre-existing one.
     assert config_file.exists()
-    second_config = build_config()
+    second_config = build_config(cli=True)
 
     # Both configs should be identical.
     assert first_config == second_config
@@ -184,10 +187,66 @@ def test_build_config_version(mock_parse_args, namespace, capsys):
     namespace.version = True
     mock_parse_args.return_value = namespace
     with pytest.raises(SystemExit):
-        build_config()
+        build_config(cli=True)
     assert capsys.readouterr().out == f"{get_version()}\n"
 
 
+def test_build_config_uses_snapshot(tmpdir, caplog):
+    """Test for the build_config function."""
+    caplog.set_level("INFO")
+    config_file = Path(tmpdir) / "config.yaml"
+    config_file.write_text("sync:\n  DRYRUN: true\n", encoding="utf-8")
+    with mock.patch(
+        "djtools.configs.helpers._build_configs", wraps=_build_configs
+    ) as mock_build_configs:
+        first_config = build_config(config_file)
+        caplog.clear()
+        second_config = build_config(config_file)
+        assert mock_build_configs.call_count == 1
+        assert first_config == second_config
+        assert any(
+            record.message.startswith("SyncConfig(")
+            for record in caplog.records
+        )
+        config_file.write_text("sync:\n  DRYRUN: false\n", encoding="utf-8")
+        assert build_config(config_file).DRYRUN is False
+        assert mock_build_configs.call_count == 2
+
+
+def test_build_config_snapshot_sources_include_templates(tmpdir):
+    """Test for the build_config function."""
+    config_file = Path(tmpdir) / "config.yaml"
+    config_file.write_text("", encoding="utf-8")
+    template = Path(tmpdir) / "playlist_templates" / "collection_playlists.j2"
+    included = template.parent / "macros" / "macros.j2"
+    included.parent.mkdir(parents=True)
+    template.write_text("", encoding="utf-8")
+    included.write_text("", encoding="utf-8")
+    with (
+        mock.patch("djtools.configs.helpers.PLAYLIST_TEMPLATE_PATH", template),
+        mock.patch(
+            "djtools.configs.helpers.get_snapshot_key",
+            wraps=get_snapshot_key,
+        ) as mock_get_snapshot_key,
+    ):
+        build_config(config_file)
+    mock_get_snapshot_key.assert_called_once_with(
+        [config_file, template, included], {}
+    )
+
+
+def test_get_config_sources(tmpdir):
+    """Test for the get_config_sources function."""
+    template = Path(tmpdir) / "collection_playlists.j2"
+    with mock.patch(
+        "djtools.configs.helpers.PLAYLIST_TEMPLATE_PATH", template
+    ):
+        assert get_config_sources() == [
+            PLAYLIST_CONFIG_PATH.parent / "config.yaml",
+            PLAYLIST_CONFIG_PATH,
+        ]
+
+
 @pytest.mark.parametrize("config", PKG_CFG.values())
 @mock.patch("djtools.spotify.helpers.get_spotify_client", mock.Mock())
 def test_filter_dict(config):
@@ -204,11 +263,11 @@ def test_filter_dict(config):
     assert sub_keys.difference(super_keys) == result_keys
 
 
-def test_stack_inspection_for_cli_arg_parsing():
-    """Test stack inspection for cli arg parsing."""
-    stack = inspect.stack()
-    entry_frame = stack[-1]
-    test_loc = str(Path("bin") / "pytest")
-    windows_loc = str(Path("lib") / "runpy.py")
-    windows_frozen = "<frozen runpy>"
-    assert entry_frame[1].endswith((test_loc, windows_loc, windows_frozen))
+@mock.patch("argparse.ArgumentParser.parse_args")
+def test_build_config_only_parses_args_for_cli(
+    mock_parse_args, config_file_teardown
+):
+    """Test for the build_config function."""
+    # pylint: disable=unused-argument
+    build_config()
+    mock_parse_args.assert_not_called()
@@ -0,0 +1,143 @@
+"""Testing for the snapshot module."""
+
+import json
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from djtools.collection.config import CollectionConfig, PlaylistConfig
+from djtools.configs import snapshot
+from djtools.configs.snapshot import (
+    get_snapshot_key,
+    load_snapshot,
+    save_snapshot,
+)
+from djtools.spotify.config import SpotifyConfig
+from djtools.sync.config import SyncConfig
+from djtools.utils.config import UtilsConfig
+
+
+CONFIG_CLASSES = {"sync": SyncConfig, "utils": UtilsConfig}
+
+
+@pytest.fixture(name="source")
+def fixture_source(tmpdir):
+    """Fixture for a config.yaml."""
+    source = Path(tmpdir) / "config.yaml"
+    source.write_text("sync:\n  DRYRUN: true\n", encoding="utf-8")
+
+    return source
+
+
+def test_get_snapshot_key(source, tmpdir):
+    """Test for the get_snapshot_key function."""
+    missing = Path(tmpdir) / "collection_playlists.yaml"
+    key = get_snapshot_key([source, missing], {})
+    os.utime(source, (0, 0))
+    assert get_snapshot_key([source, missing], {}) == key
+    assert get_snapshot_key([source, missing], {"DRYRUN": True}) != key
+    missing.write_text("", encoding="utf-8")
+    assert get_snapshot_key([source, missing], {}) != key
+    key = get_snapshot_key([source, missing], {})
+    source.write_text("sync:\n  DRYRUN: false\n", encoding="utf-8")
+    assert get_snapshot_key([source, missing], {}) != key
+
+
+def test_save_and_load_snapshot(tmpdir):
+    """Test for the save_snapshot and load_snapshot functions."""
+    configs = {
+        "sync": SyncConfig(USB_PATH=Path(tmpdir)),
+        "utils": UtilsConfig(LOCAL_DIRS=[Path(tmpdir)]),
+    }
+    save_snapshot("key", configs)
+    assert load_snapshot("key", CONFIG_CLASSES) == configs
+    assert load_snapshot("other key", CONFIG_CLASSES) is None
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX file permissions")
+def test_save_snapshot_is_private(tmpdir):
+    """Test for the save_snapshot function."""
+    with mock.patch(
+        "djtools.configs.snapshot.CONFIG_SNAPSHOT_PATH",
+        Path(tmpdir) / "cache" / "config_snapshot.json",
+    ):
+        save_snapshot("key", {"sync": SyncConfig()})
+        save_snapshot("key", {"sync": SyncConfig()})
+        assert snapshot.CONFIG_SNAPSHOT_PATH.stat().st_mode & 0o777 == 0o600
+        assert (
+            snapshot.CONFIG_SNAPSHOT_PATH.parent.stat().st_mode & 0o777
+            == 0o700
+        )
+
+
+@mock.patch("djtools.spotify.helpers.get_spotify_client")
+def test_load_snapshot_checks_configs(mock_spotify):
+    """Test for the load_snapshot function."""
+    configs = {
+        "spotify": SpotifyConfig(
+            SPOTIFY_CLIENT_ID="id",
+            SPOTIFY_CLIENT_SECRET="secret",
+            SPOTIFY_PLAYLIST_FROM_UPLOAD=True,
+            SPOTIFY_REDIRECT_URI="uri",
+            SPOTIFY_USERNAME="name",
+        )
+    }
+    save_snapshot("key", configs)
+    mock_spotify.return_value.current_user.side_effect = Exception()
+    with pytest.raises(RuntimeError, match="Spotify credentials are invalid!"):
+        load_snapshot("key", {"spotify": SpotifyConfig})
+
+
+def test_load_snapshot_doesnt_render_playlist_config(
+    playlist_config, rekordbox_xml
+):
+    """Test for the load_snapshot function."""
+    with mock.patch(
+        "djtools.collection.config.PLAYLIST_CONFIG_PATH",
+        Path("tests/data/collection_playlists.yaml"),
+    ):
+        configs = {
+            "collection": CollectionConfig(
+                COLLECTION_PATH=rekordbox_xml, COLLECTION_PLAYLISTS=True
+            )
+        }
+    save_snapshot("key", configs)
+    with mock.patch("jinja2.Environment") as mock_environment:
+        loaded = load_snapshot("key", {"collection": CollectionConfig})
+    mock_environment.assert_not_called()
+    assert loaded == configs
+    assert loaded["collection"].playlist_config == PlaylistConfig(
+        **playlist_config
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        json.dumps({"configs": {}, "key": ""})[1:],
+        json.dumps(
+            {
+                "configs": {"missing": {}},
+                "key": "key",
+            }
+        ),
+        json.dumps(
+            {
+                "configs": {"sync": {"DRYRUN": "maybe"}},
+                "key": "key",
+            }
+        ),
+    ],
+)
+def test_load_snapshot_handles_invalid_snapshot(content):
+    """Test for the load_snapshot function."""
+    snapshot.CONFIG_SNAPSHOT_PATH.write_text(content, encoding="utf-8")
+    assert load_snapshot("key", CONFIG_CLASSES) is None
+
+
+def test_load_snapshot_handles_missing_snapshot():
+    """Test for the load_snapshot function."""
+    assert load_snapshot("key", CONFIG_CLASSES) is None
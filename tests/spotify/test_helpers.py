@@ -25,6 +25,7 @@ from djtools.spotify.helpers import (
     _update_existing_playlist,
     write_playlist_ids,
 )
+from djtools.utils.run_context import run_context
 
 from ..test_utils import mock_exists, MockOpen
 
@@ -365,6 +366,18 @@ def test_get_spotify_client(config):
     get_spotify_client(config)
 
 
+@mock.patch("djtools.spotify.helpers.spotipy.Spotify")
+def test_get_spotify_client_is_shared_by_run(mock_spotify, config):
+    """Test for the get_spotify_client function."""
+    config.SPOTIFY_CLIENT_ID = "test_client_id"
+    config.SPOTIFY_CLIENT_SECRET = "test_client_secret"
+    config.SPOTIFY_REDIRECT_URI = "test_redirect_uri"
+    with run_context():
+        spotify = get_spotify_client(config)
+        assert get_spotify_client(config) is spotify
+    mock_spotify.assert_called_once()
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("subreddit_type", ["hot", "top"])
 @pytest.mark.parametrize("num_subs", [5, 0])
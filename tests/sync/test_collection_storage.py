@@ -0,0 +1,201 @@
+"""Testing for the collection_storage module."""
+
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from djtools.sync.collection_storage import (
+    chunk_file,
+    download_collection_file,
+    upload_collection_file,
+)
+from djtools.sync.storage import LocalBackend
+
+
+KEY = "dj/collections/user/rekordbox_collection"
+
+
+@pytest.fixture(name="backend")
+def fixture_backend(tmpdir):
+    """Fixture for a LocalBackend."""
+    return LocalBackend((Path(tmpdir) / "bucket").as_uri())
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(tmpdir):
+    """Fixture for a collection file."""
+    path = Path(tmpdir) / "collection.xml"
+    path.write_bytes(
+        b"".join(f'<TRACK TrackID="{i}"/>\n'.encode() for i in range(5000))
+    )
+
+    return path
+
+
+def test_chunk_file(collection):
+    """Test for the chunk_file function."""
+    chunks = list(chunk_file(collection))
+    assert len(chunks) > 1
+    assert chunks[0].offset == 0
+    for chunk, next_chunk in zip(chunks, chunks[1:]):
+        assert chunk.offset + chunk.size == next_chunk.offset
+    assert chunks[-1].offset + chunks[-1].size == collection.stat().st_size
+    # Inserting a line only changes the chunk it's inserted into.
+    lines = collection.read_bytes().splitlines(keepends=True)
+    collection.write_bytes(
+        b"".join(lines[:2500] + [b'<TRACK TrackID="new"/>\n'] + lines[2500:])
+    )
+    edited = list(chunk_file(collection))
+    assert (
+        len(
+            {chunk.digest for chunk in chunks}.symmetric_difference(
+                chunk.digest for chunk in edited
+            )
+        )
+        == 2
+    )
+
+
+@pytest.mark.parametrize(
+    "fmt,suffix", [("delta", ".index.gz"), ("gzip", ".gz"), ("plain", "")]
+)
+def test_upload_and_download_collection_file(
+    fmt, suffix, backend, collection, tmpdir
+):
+    """Test for the upload_collection_file and download_collection_file
+    functions."""
+    upload_collection_file(backend, collection, KEY, fmt)
+    # Collections are also stored as-is for versions which only read that.
+    assert sorted(
+        obj.key for obj in backend.list_objects(KEY, recursive=False)
+    ) == sorted({KEY, KEY + suffix})
+    assert (Path(tmpdir) / "bucket" / KEY).read_bytes() == (
+        collection.read_bytes()
+    )
+    downloaded = Path(tmpdir) / "downloaded" / "collection.xml"
+    download_collection_file(backend, KEY, downloaded)
+    assert downloaded.read_bytes() == collection.read_bytes()
+
+
+def test_delta_transfers_only_changed_chunks(
+    backend, collection, tmpdir, caplog
+):
+    """Test for the upload_collection_file and download_collection_file
+    functions."""
+    caplog.set_level("INFO")
+    downloaded = Path(tmpdir) / "downloaded.xml"
+    upload_collection_file(backend, collection, KEY, "delta")
+    download_collection_file(backend, KEY, downloaded)
+    chunks = len({chunk.digest for chunk in chunk_file(collection)})
+    content = collection.read_bytes().replace(
+        b'TrackID="2500"', b'TrackID="2500" Rating="255"'
+    )
+    collection.write_bytes(content)
+    # Downloaded collections are rewritten so they can't be the base of the
+    # next download.
+    downloaded.write_bytes(b"rewritten")
+    caplog.clear()
+    upload_collection_file(backend, collection, KEY, "delta")
+    assert f"Uploading 1 of {chunks} chunks of {collection}" in [
+        record.message for record in caplog.records
+    ]
+    caplog.clear()
+    download_collection_file(backend, KEY, downloaded)
+    assert caplog.records[1].message == (
+        f"Downloading 1 of {chunks} chunks of {backend.url(KEY)}"
+    )
+    assert downloaded.read_bytes() == content
+
+
+def test_upload_collection_file_removes_stale_objects(
+    backend, collection, caplog
+):
+    """Test for the upload_collection_file function."""
+    caplog.set_level("INFO")
+
+    def keys(prefix, recursive=True):
+        return sorted(
+            obj.key for obj in backend.list_objects(prefix, recursive)
+        )
+
+    def chunk_keys():
+        return {
+            f"{KEY}.chunks/{chunk.digest}.gz"
+            for chunk in chunk_file(collection)
+        }
+
+    upload_collection_file(backend, collection, KEY, "gzip")
+    upload_collection_file(backend, collection, KEY, "delta")
+    assert keys(KEY, recursive=False) == [KEY, KEY + ".index.gz"]
+    previous_chunks = chunk_keys()
+    collection.write_bytes(
+        collection.read_bytes().replace(
+            b'TrackID="2500"', b'TrackID="2500" Rating="255"'
+        )
+    )
+    upload_collection_file(backend, collection, KEY, "delta")
+    # The chunks of the replaced index are kept for downloads reading it.
+    assert set(keys(f"{KEY}.chunks/")) == chunk_keys() | previous_chunks
+    assert len(previous_chunks - chunk_keys()) == 1
+    caplog.clear()
+    upload_collection_file(backend, collection, KEY, "delta")
+    assert caplog.records[-1].message == (
+        f"Removing 1 stale objects of {backend.url(KEY)}"
+    )
+    assert set(keys(f"{KEY}.chunks/")) == chunk_keys()
+    upload_collection_file(backend, collection, KEY, "plain")
+    assert set(keys(KEY)) == {KEY} | chunk_keys()
+    upload_collection_file(backend, collection, KEY, "plain")
+    # The collection stored as-is is never removed.
+    assert keys(KEY) == [KEY]
+
+
+def test_upload_collection_file_handles_failure_to_remove_stale_objects(
+    backend, collection, caplog
+):
+    """Test for the upload_collection_file function."""
+    caplog.set_level("WARNING")
+    upload_collection_file(backend, collection, KEY, "gzip")
+    with mock.patch.object(
+        backend, "delete_objects", side_effect=OSError("denied")
+    ):
+        upload_collection_file(backend, collection, KEY, "plain")
+    assert caplog.records[0].message == (
+        f"Failed to remove the stale objects of {backend.url(KEY)}: denied"
+    )
+    assert backend.get_etag(KEY) is not None
+
+
+def test_download_collection_file_reads_latest_format(
+    backend, collection, tmpdir
+):
+    """Test for the download_collection_file function."""
+    upload_collection_file(backend, collection, KEY, "gzip")
+    os.utime(Path(tmpdir) / "bucket" / f"{KEY}.gz", (0, 0))
+    collection.write_text("latest", encoding="utf-8")
+    upload_collection_file(backend, collection, KEY, "plain")
+    downloaded = Path(tmpdir) / "downloaded.xml"
+    download_collection_file(backend, KEY, downloaded)
+    assert downloaded.read_text(encoding="utf-8") == "latest"
+
+
+def test_download_collection_file_prefers_compressed_formats(
+    backend, collection, tmpdir
+):
+    """Test for the download_collection_file function."""
+    upload_collection_file(backend, collection, KEY, "gzip")
+    plain = Path(tmpdir) / "bucket" / KEY
+    plain.write_text("stale", encoding="utf-8")
+    os.utime(plain, (0, 0))
+    os.utime(plain.with_name(f"{plain.name}.gz"), (0, 0))
+    downloaded = Path(tmpdir) / "downloaded.xml"
+    download_collection_file(backend, KEY, downloaded)
+    assert downloaded.read_bytes() == collection.read_bytes()
+
+
+def test_download_collection_file_handles_missing_collection(backend, tmpdir):
+    """Test for the download_collection_file function."""
+    with pytest.raises(FileNotFoundError, match="does not exist"):
+        download_collection_file(backend, KEY, Path(tmpdir) / "collection")
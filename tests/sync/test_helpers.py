@@ -3,19 +3,22 @@
 from datetime import datetime, timedelta
 import os
 from pathlib import Path
-import tempfile
+import re
 from unittest import mock
 
 import pytest
 
 from djtools.collection.rekordbox_collection import RekordboxCollection
 from djtools.sync.helpers import (
+    open_storage_backend,
     parse_sync_command,
     rewrite_track_paths,
     run_sync,
     upload_log,
     webhook,
 )
+from djtools.sync.transfer import SyncCommand
+from djtools.utils.run_context import run_context
 
 TEST_BUCKET = "s3://some-bucket.com"
 
@@ -37,43 +40,45 @@ def test_parse_sync_command(
     exclude_dirs,
     use_date_modified,
     dryrun,
+    caplog,
 ):
     """Test for the parse_sync_command function."""
-    tmpdir = str(tmpdir)
+    caplog.set_level("INFO")
     setattr(
         config, f"{'UP' if upload else 'DOWN'}LOAD_INCLUDE_DIRS", include_dirs
     )
     setattr(
         config, f"{'UP' if upload else 'DOWN'}LOAD_EXCLUDE_DIRS", exclude_dirs
     )
-    config.AWS_USE_DATE_MODIFIED = not use_date_modified
+    config.BUCKET_URL = TEST_BUCKET
+    config.AWS_USE_DATE_MODIFIED = use_date_modified
     config.DRYRUN = dryrun
-    partial_cmd = [
-        "aws",
-        "s3",
-        "sync",
-        tmpdir if upload else f"{TEST_BUCKET}/dj/music/",
-        f"{TEST_BUCKET}/dj/music/" if upload else tmpdir,
-    ]
-    cmd = " ".join(parse_sync_command(partial_cmd, config, upload))
-    for dir_ in include_dirs:
-        assert (
-            f"--include {((dir_ / '*').as_posix() if not dir_.suffix else dir_.as_posix())}"
-            in cmd
+    cmd = parse_sync_command(
+        SyncCommand(Path(tmpdir), "dj/music/", upload=upload), config
+    )
+    expected_filters = []
+    if include_dirs:
+        expected_filters.append(("exclude", "*"))
+        expected_filters.extend(
+            [("include", "path/to/stuff/*"), ("include", "path/to/things.mp3")]
         )
-    for dir_ in exclude_dirs:
-        assert (
-            f"--exclude {((dir_ / '*').as_posix() if not dir_.suffix else dir_.as_posix())}"
-            in cmd
+    if exclude_dirs:
+        expected_filters.append(("include", "*"))
+        expected_filters.extend(
+            [("exclude", "path/to/stuff/*"), ("exclude", "path/to/things.mp3")]
         )
-    if include_dirs:
-        assert "--exclude *" in cmd
-    elif exclude_dirs:
-        assert "--include *" in cmd
-    if use_date_modified:
-        assert "--size-only" in cmd
-    if dryrun:
-        assert "--dryrun" in cmd
+    assert cmd.filters == tuple(expected_filters)
+    assert cmd.size_only != use_date_modified
+    assert cmd.dryrun == dryrun
+    local_dir = Path(tmpdir).as_posix()
+    remote = f"{TEST_BUCKET}/dj/music/"
+    assert caplog.records[0].message == " ".join(
+        [
+            "sync",
+            *([local_dir, remote] if upload else [remote, local_dir]),
+            *cmd.flags(),
+        ]
+    )
 
 
 def test_rewrite_track_paths(config, rekordbox_xml):
@@ -106,111 +111,150 @@ def test_rewrite_track_paths(config, rekordbox_xml):
         assert user_b_path.as_posix() not in loc
 
 
-@mock.patch("djtools.sync.helpers.Popen")
-def test_run_sync(mock_popen, tmpdir):
+def test_rewrite_track_paths_only_rewrites_locations(config, tmpdir):
+    """Test for the rewrite_track_paths function."""
+    config.USB_PATH = Path("/Volumes/my usb")
+    collection = Path(tmpdir) / "collection.xml"
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>\r\n',
+        '<TRACK TrackID="1" Name="A &amp; B" Location="file://localhost'
+        '/Volumes/other%20usb/DJ%20Music/Bass/a%20%26%20b.mp3"/>\r\n',
+        '<TRACK TrackID="2" Location="file://localhost/Music/c.mp3"/>\r\n',
+        '<NODE Name="ROOT" Type="0" Count="0"/>\r\n',
+    ]
+    collection.write_bytes("".join(lines).encode())
+    with mock.patch(
+        "djtools.collection.rekordbox_collection.RekordboxCollection"
+    ) as mock_collection:
+        rewrite_track_paths(config, collection)
+    mock_collection.assert_not_called()
+    lines[1] = lines[1].replace("other%20usb", "my%20usb")
+    assert collection.read_bytes() == "".join(lines).encode()
+
+
+@mock.patch("djtools.sync.helpers.get_storage_backend")
+def test_open_storage_backend(mock_get_storage_backend, config):
+    """Test for the open_storage_backend function."""
+    with open_storage_backend(config) as backend:
+        assert backend is mock_get_storage_backend.return_value
+    backend.close.assert_called_once()
+
+
+@mock.patch("djtools.sync.helpers.get_storage_backend")
+def test_open_storage_backend_is_shared_by_run(
+    mock_get_storage_backend, config
+):
+    """Test for the open_storage_backend function."""
+    with run_context():
+        with open_storage_backend(config) as backend:
+            pass
+        with open_storage_backend(config) as shared_backend:
+            assert shared_backend is backend
+        backend.close.assert_not_called()
+    backend.close.assert_called_once()
+    mock_get_storage_backend.assert_called_once()
+
+
+@pytest.mark.parametrize("dryrun", [True, False])
+def test_run_sync(dryrun, tmpdir, config, caplog):
     """Test for the run_sync function."""
-    with open(Path(tmpdir) / "track.mp3", mode="w", encoding="utf-8") as _file:
-        _file.write("")
-    cmd = ["aws", "s3", "sync", str(tmpdir), f"{TEST_BUCKET}/dj/music/"]
-    sync_output = (
-        "upload: ../../Volumes/AWEEEEZY/DJ Music/Bass/2022-12-21/track - "
-        f"artist.mp3 to {TEST_BUCKET}/dj/music/Bass/2022-12-21/"
-        "track - artist.mp3\n"
-        "upload: ../../Volumes/AWEEEEZY/DJ Music/Bass/2O22-12-21/other track "
-        f"- other artist.mp3 to {TEST_BUCKET}/dj/music/Bass/"
-        "2O22-12-21/other track - other artist.mp3\n"
-        "upload: ../../Volumes/AWEEEEZY/DJ Music/Techno/2022-12-22/last track "
-        f"- last artist.mp3 to {TEST_BUCKET}/dj/music/Techno/"
-        "2022-12-22/last track - last artist.mp3"
-        "\nirrelevant line"
-    )
-    # NOTE(a-rich): Windows does not allow opening a temporary file after it's
-    # been created. The WAR is to initialize a `NamedTemporaryFile` with the
-    # `delete` argument set to `False` and explicitly `.close()` the object
-    # before calling `open()` on it.
-    with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmp_file:
-        tmp_file.write(bytes(sync_output.encode("utf-8")))
-        tmp_file.seek(0)
-        tmp_file.close()
-        with open(tmp_file.name, mode="rb") as tmp_file:
-            process = mock_popen.return_value.__enter__.return_value
-            process.stdout = tmp_file
-            process.wait.return_value = 0
-            ret = run_sync(cmd, TEST_BUCKET)
+    caplog.set_level("INFO")
+    local_dir = Path(tmpdir) / "DJ Music"
+    tracks = [
+        Path("Bass/2022-12-21/track - artist.mp3"),
+        Path("Bass/2O22-12-21/other track - other artist.mp3"),
+        Path("Techno/2022-12-22/last track - last artist.mp3"),
+    ]
+    for track in tracks:
+        (local_dir / track).parent.mkdir(parents=True, exist_ok=True)
+        (local_dir / track).write_text("", encoding="utf-8")
+    config.BUCKET_URL = (Path(tmpdir) / "bucket").as_uri()
+    cmd = SyncCommand(local_dir, "dj/music/", upload=True, dryrun=dryrun)
+    ret = run_sync(cmd, config)
     expected = (
         "Bass/2022-12-21: 1\n\ttrack - artist.mp3\nBass/2O22-12-21: 1\n\tother"
         " track - other artist.mp3\nTechno/2022-12-22: 1\n\tlast track - last "
         "artist.mp3\n"
     )
-    assert ret == expected
+    assert ret == ("" if dryrun else expected)
+    if not dryrun:
+        assert caplog.records[-2].message.startswith(
+            "Uploaded 3 files (0.00B)"
+        )
+    assert (Path(tmpdir) / "bucket" / "dj" / "music").exists() != dryrun
+    if not dryrun:
+        assert not run_sync(cmd, config)
 
 
-@mock.patch("djtools.sync.helpers.Popen")
-@pytest.mark.parametrize(
-    "byte_sequence,expected",
-    [
-        (
-            f"upload: track.mp3 to {TEST_BUCKET}/dj/music/track.mp3\n".encode(
-                "utf-8"
-            ),
-            ".: 1\n\ttrack.mp3\n",
-        ),
-        (b"\x80", ""),  # This will raise a UnicodeDecodeError.
-    ],
-)
-def test_run_sync_handles_decode_error(
-    mock_popen, byte_sequence, expected, tmpdir
-):
+def test_run_sync_plans_dryrun_with_manifest(tmpdir, config, caplog):
     """Test for the run_sync function."""
-    with open(Path(tmpdir) / "track.mp3", mode="w", encoding="utf-8") as _file:
-        _file.write("")
-    cmd = ["aws", "s3", "sync", str(tmpdir), f"{TEST_BUCKET}/dj/music/"]
-    with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmp_file:
-        tmp_file.write(byte_sequence)
-        tmp_file.seek(0)
-        tmp_file.close()
-        with open(tmp_file.name, mode="rb") as tmp_file:
-            process = mock_popen.return_value.__enter__.return_value
-            process.stdout = tmp_file
-            process.wait.return_value = 0
-            ret = run_sync(cmd, TEST_BUCKET)
-    assert ret == expected
-
-
-@mock.patch("djtools.sync.helpers.Popen")
-def test_run_sync_handles_return_code(mock_popen, tmpdir, caplog):
+    caplog.set_level("INFO")
+    local_dir = Path(tmpdir) / "DJ Music"
+    (local_dir / "user").mkdir(parents=True)
+    (local_dir / "user" / "track.mp3").write_text("", encoding="utf-8")
+    config.BUCKET_URL = (Path(tmpdir) / "bucket").as_uri()
+    cmd = SyncCommand(local_dir, "dj/music/", upload=True)
+    run_sync(cmd, config)
+    (local_dir / "user" / "new.mp3").write_text("new", encoding="utf-8")
+    run_sync(cmd._replace(dryrun=True), config)
+    caplog.clear()
+    with mock.patch(
+        "djtools.sync.storage.LocalBackend.list_objects"
+    ) as mock_list_objects:
+        run_sync(cmd._replace(dryrun=True), config)
+    mock_list_objects.assert_not_called()
+    assert caplog.records[0].message == (
+        f"(dryrun) upload: {local_dir / 'user' / 'new.mp3'} to "
+        f"{config.BUCKET_URL}/dj/music/user/new.mp3"
+    )
+
+    # Uploading invalidates the listing of the users uploaded to.
+    run_sync(cmd, config)
+    caplog.clear()
+    run_sync(cmd._replace(dryrun=True), config)
+    assert caplog.records[0].message == "Refreshed the listing of 1 users"
+    assert len(caplog.records) == 1
+
+
+def test_run_sync_handles_transfer_failure(tmpdir, config, caplog):
+    """Test for the run_sync function."""
+    caplog.set_level("INFO")
+    local_dir = Path(tmpdir) / "DJ Music"
+    local_dir.mkdir()
+    (local_dir / "track.mp3").write_text("", encoding="utf-8")
+    config.BUCKET_URL = (Path(tmpdir) / "bucket").as_uri()
+    with mock.patch(
+        "djtools.sync.storage.LocalBackend.upload_file",
+        side_effect=OSError("Access Denied"),
+    ):
+        with pytest.raises(RuntimeError, match="Access Denied"):
+            run_sync(SyncCommand(local_dir, "dj/music/", upload=True), config)
+    assert caplog.records[0].message.startswith("upload failed: ")
+    assert caplog.records[1].message.startswith("Uploaded 0 files")
+    assert caplog.records[1].message.endswith("; 1 failed")
+    assert caplog.records[2].message == "Failure while syncing: Access Denied"
+
+
+def test_run_sync_handles_failure(tmpdir, config, caplog):
     """Test for the run_sync function."""
     caplog.set_level("CRITICAL")
-    # NOTE(a-rich): subprocess calls to `awscli` need to have unix-style path
-    # arguments.
-    cmd = [
-        "aws",
-        "s3",
-        "sync",
-        Path(tmpdir).as_posix(),
-        f"{TEST_BUCKET}/dj/music/",
-    ]
-    with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmp_file:
-        tmp_file.write(bytes("".encode("utf-8")))
-        tmp_file.seek(0)
-        tmp_file.close()
-        with open(tmp_file.name, mode="rb") as tmp_file:
-            process = mock_popen.return_value.__enter__.return_value
-            process.stdout = tmp_file
-            process.wait.return_value = 1
-            msg = (
-                f"Failure while syncing: Command '{' '.join(cmd)}' returned "
-                f"non-zero exit status {process.wait.return_value}."
-            )
-            with pytest.raises(Exception, match=msg):
-                run_sync(cmd, TEST_BUCKET)
+    config.BUCKET_URL = TEST_BUCKET.replace("s3", "ftp")
+    msg = (
+        f'Failure while syncing: Unsupported storage URL "{config.BUCKET_URL}"'
+        '; it must start with "s3://" or "file://"'
+    )
+    with pytest.raises(RuntimeError, match=re.escape(msg)):
+        run_sync(SyncCommand(Path(tmpdir), "dj/music/"), config)
     assert caplog.records[0].message == msg
 
 
-@mock.patch("djtools.sync.helpers.Popen")
-def test_upload_log(mock_popen, tmpdir, config):
+def test_upload_log(tmpdir, config):
     """Test for the upload_log function."""
+    log_dir = Path(tmpdir) / "logs"
+    log_dir.mkdir()
     config.AWS_PROFILE = "DJ"
+    config.BUCKET_URL = (Path(tmpdir) / "bucket").as_uri()
+    config.USER = "user"
     now = datetime.now()
     # Windows st_mtime includes fractional seconds which can cause a test
     # failure due to a rounding error.
@@ -223,25 +267,41 @@ def test_upload_log(mock_popen, tmpdir, config):
     ]
     ctime = one_day_ago.timestamp()
     for filename in filenames:
-        file_path = Path(tmpdir) / filename
+        file_path = log_dir / filename
         with open(file_path, mode="w", encoding="utf-8") as _file:
             _file.write("")
         if filename != test_log:
             os.utime(file_path, (ctime, ctime))  # pylint: disable=no-member
-    process = mock_popen.return_value.__enter__.return_value
-    process.wait.return_value = 0
-    upload_log(config, Path(tmpdir) / test_log)
-    assert len(list(Path(tmpdir).iterdir())) == len(filenames) - 1
+    upload_log(config, log_dir / test_log)
+    assert len(list(log_dir.iterdir())) == len(filenames) - 1
+    assert (
+        Path(tmpdir) / "bucket" / "dj" / "logs" / "user" / test_log
+    ).exists()
+
 
+def test_upload_log_handles_failure(tmpdir, config, caplog):
+    """Test for the upload_log function."""
+    caplog.set_level("ERROR")
+    config.AWS_PROFILE = "DJ"
+    config.BUCKET_URL = (Path(tmpdir) / "bucket").as_uri()
+    log_file = Path(tmpdir) / "missing.log"
+    upload_log(config, log_file)
+    assert caplog.records[0].message.startswith(
+        f"Failed to back up {log_file}: "
+    )
 
-def test_upload_log_no_aws_profile(config, caplog):
+
+@pytest.mark.parametrize("option", ["AWS_PROFILE", "BUCKET_URL"])
+def test_upload_log_missing_config_option(option, config, caplog):
     """Test for the upload_log function."""
     caplog.set_level("WARNING")
-    config.AWS_PROFILE = ""
+    config.AWS_PROFILE = "DJ"
+    config.BUCKET_URL = TEST_BUCKET
+    setattr(config, option, "")
     upload_log(config, "some_file.txt")
     assert (
         caplog.records[0].message == "Logs cannot be backed up without "
-        "specifying the config option AWS_PROFILE"
+        f"specifying the config option {option}"
     )
 
 
@@ -0,0 +1,171 @@
+"""Testing for the manifest module."""
+
+from pathlib import Path
+import shutil
+from unittest import mock
+
+import pytest
+
+from djtools.sync.manifest import (
+    invalidate_cached_objects,
+    list_cached_objects,
+    Manifest,
+)
+from djtools.sync.storage import LocalBackend
+
+
+@pytest.fixture(name="bucket")
+def fixture_bucket(tmpdir):
+    """Fixture for a local Beatcloud with two users."""
+    bucket = Path(tmpdir) / "bucket"
+    for track in [
+        "user_a/Bass/track.mp3",
+        "user_a/Techno/track.mp3",
+        "user_b/Bass/track.mp3",
+    ]:
+        (bucket / "dj" / "music" / track).parent.mkdir(
+            parents=True, exist_ok=True
+        )
+        (bucket / "dj" / "music" / track).write_text("", encoding="utf-8")
+
+    return bucket
+
+
+def test_manifest(bucket, tmpdir):
+    """Test for the Manifest class."""
+    backend = LocalBackend(bucket.as_uri())
+    manifest = Manifest(Path(tmpdir) / "manifest.db")
+    assert manifest.refresh(backend, "dj/music/", 60) == 2
+    objects = list(manifest.list_objects(backend, "dj/music/"))
+    assert objects == list(backend.list_objects("dj/music/"))
+    assert [
+        obj.key for obj in manifest.list_objects(backend, "dj/music/user_b/")
+    ] == ["dj/music/user_b/Bass/track.mp3"]
+
+    # Listings within the TTL are reused.
+    (bucket / "dj" / "music" / "user_b" / "new.mp3").write_text(
+        "", encoding="utf-8"
+    )
+    assert not manifest.refresh(backend, "dj/music/", 60)
+    assert list(manifest.list_objects(backend, "dj/music/")) == objects
+    manifest.close()
+
+    # The manifest persists across runs and removed prefixes are forgotten.
+    shutil.rmtree(bucket / "dj" / "music" / "user_a")
+    manifest = Manifest(Path(tmpdir) / "manifest.db")
+    assert list(manifest.list_objects(backend, "dj/music/")) == objects
+    with mock.patch("djtools.sync.manifest.time.time", return_value=1e12):
+        assert manifest.refresh(backend, "dj/music/", 60) == 1
+    assert [
+        obj.key for obj in manifest.list_objects(backend, "dj/music/")
+    ] == [
+        "dj/music/user_b/Bass/track.mp3",
+        "dj/music/user_b/new.mp3",
+    ]
+    manifest.close()
+
+
+def test_manifest_is_keyed_by_url(bucket, tmpdir):
+    """Test for the Manifest class."""
+    other_bucket = Path(tmpdir) / "other_bucket"
+    shutil.copytree(
+        bucket / "dj" / "music" / "user_b",
+        other_bucket / "dj" / "music" / "user_c",
+    )
+    backend = LocalBackend(bucket.as_uri())
+    other_backend = LocalBackend(other_bucket.as_uri())
+    manifest = Manifest(Path(tmpdir) / "manifest.db")
+    manifest.refresh(backend, "dj/music/", 0)
+    manifest.refresh(other_backend, "dj/music/", 0)
+    assert len(list(manifest.list_objects(backend, "dj/music/"))) == 3
+    assert [
+        obj.key for obj in manifest.list_objects(other_backend, "dj/music/")
+    ] == ["dj/music/user_c/Bass/track.mp3"]
+    manifest.close()
+
+
+def test_manifest_refreshes_empty_prefixes(bucket, tmpdir):
+    """Test for the Manifest class."""
+    (bucket / "dj" / "music" / "user_0").mkdir()
+    backend = LocalBackend(bucket.as_uri())
+    manifest = Manifest(Path(tmpdir) / "manifest.db")
+    assert manifest.refresh(backend, "dj/music/", 60, max_concurrency=1) == 3
+    assert not list(manifest.list_objects(backend, "dj/music/user_0/"))
+    assert len(list(manifest.list_objects(backend, "dj/music/"))) == 3
+    assert not manifest.refresh(backend, "dj/music/", 60)
+    manifest.close()
+
+
+def test_manifest_lists_prefixes_outside_of_transactions(bucket, tmpdir):
+    """Test for the Manifest class."""
+    backend = LocalBackend(bucket.as_uri())
+    manifest = Manifest(Path(tmpdir) / "manifest.db")
+    assert manifest._connection.execute(  # pylint: disable=protected-access
+        "PRAGMA journal_mode"
+    ).fetchone() == ("wal",)
+
+    def list_objects_concurrently(backend, prefixes, _):
+        for prefix in prefixes:
+            for obj in backend.list_objects(prefix):
+                # pylint: disable=protected-access
+                assert not manifest._connection.in_transaction
+                yield obj
+
+    with mock.patch(
+        "djtools.sync.manifest.list_objects_concurrently",
+        list_objects_concurrently,
+    ):
+        assert manifest.refresh(backend, "dj/music/", 60) == 2
+    assert len(list(manifest.list_objects(backend, "dj/music/"))) == 3
+    manifest.close()
+
+
+def test_manifest_invalidate(bucket, tmpdir):
+    """Test for the Manifest class."""
+    backend = LocalBackend(bucket.as_uri())
+    manifest = Manifest(Path(tmpdir) / "manifest.db")
+    manifest.refresh(backend, "dj/music/", 60)
+    for track in ["user_a/Bass/new.mp3", "user_c/new.mp3"]:
+        (bucket / "dj" / "music" / track).parent.mkdir(exist_ok=True)
+        (bucket / "dj" / "music" / track).write_text("", encoding="utf-8")
+    manifest.invalidate(
+        backend,
+        "dj/music/",
+        [
+            "dj/music/user_a/Bass/new.mp3",
+            "dj/music/user_c/new.mp3",
+            "dj/music/not_in_a_user.mp3",
+        ],
+    )
+    with mock.patch.object(
+        backend, "list_prefixes", wraps=backend.list_prefixes
+    ) as mock_list_prefixes:
+        assert manifest.refresh(backend, "dj/music/", 60) == 2
+    # Only the stale users are listed, not the users under "dj/music/".
+    assert mock.call("dj/music/") not in mock_list_prefixes.call_args_list
+    assert list(manifest.list_objects(backend, "dj/music/")) == list(
+        backend.list_objects("dj/music/")
+    )
+    manifest.close()
+
+
+def test_list_cached_objects(bucket, caplog):
+    """Test for the list_cached_objects and invalidate_cached_objects
+    functions."""
+    caplog.set_level("INFO")
+    backend = LocalBackend(bucket.as_uri())
+    objects = list_cached_objects(backend, "dj/music/", 60)
+    assert objects == list(backend.list_objects("dj/music/"))
+    assert caplog.records[0].message == "Refreshed the listing of 2 users"
+    new_track = bucket / "dj" / "music" / "user_a" / "new.mp3"
+    new_track.write_text("", encoding="utf-8")
+    caplog.clear()
+    assert list_cached_objects(backend, "dj/music/", 60) == objects
+    assert not caplog.records
+    invalidate_cached_objects(
+        backend, "dj/music/", ["dj/music/user_a/new.mp3"]
+    )
+    assert list_cached_objects(backend, "dj/music/", 60) == list(
+        backend.list_objects("dj/music/")
+    )
+    assert caplog.records[0].message == "Refreshed the listing of 1 users"
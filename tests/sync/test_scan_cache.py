@@ -0,0 +1,135 @@
+"""Testing for the scan_cache module."""
+
+from contextlib import closing
+import os
+from pathlib import Path
+import shutil
+import time
+from unittest import mock
+
+import pytest
+
+from djtools.sync.scan_cache import ScanCache, scan_library
+from djtools.sync.storage import ObjectInfo
+
+
+@pytest.fixture(name="library")
+def fixture_library(tmpdir):
+    """Fixture for a library of tracks modified a minute ago."""
+    library = Path(tmpdir) / "DJ Music"
+    for track in ["Bass/a.mp3", "Bass/2024/b.mp3", "Techno/c.mp3", "d.mp3"]:
+        (library / track).parent.mkdir(parents=True, exist_ok=True)
+        (library / track).write_text(track, encoding="utf-8")
+    set_mtimes(library)
+
+    return library
+
+
+def set_mtimes(path: Path, offset: float = 60.0):
+    """Sets the modified time of every file and directory under a path.
+
+    Args:
+        path: Directory to set the modified times under.
+        offset: Number of seconds ago to set the modified times to.
+    """
+    mtime = time.time() - offset
+    for child in [path, *path.rglob("*")]:
+        os.utime(child, (mtime, mtime))
+
+
+def test_scancache_scan(library, tmpdir):
+    """Test for the ScanCache class."""
+    with closing(ScanCache(Path(tmpdir) / "cache.db")) as scan_cache:
+        files = scan_cache.scan(library)
+        assert list(files) == [
+            "Bass/2024/b.mp3",
+            "Bass/a.mp3",
+            "Techno/c.mp3",
+            "d.mp3",
+        ]
+        stat = (library / "d.mp3").stat()
+        assert files["d.mp3"] == ObjectInfo(
+            "d.mp3", stat.st_size, stat.st_mtime
+        )
+        with mock.patch(
+            "djtools.sync.scan_cache.os.scandir", wraps=os.scandir
+        ) as mock_scandir:
+            assert scan_cache.scan(library) == files
+        mock_scandir.assert_not_called()
+
+
+def test_scancache_scan_relists_modified_directories(library, tmpdir):
+    """Test for the ScanCache class."""
+    with closing(ScanCache(Path(tmpdir) / "cache.db")) as scan_cache:
+        scan_cache.scan(library)
+        (library / "Bass" / "e.mp3").write_text("e", encoding="utf-8")
+        shutil.rmtree(library / "Techno")
+        with mock.patch(
+            "djtools.sync.scan_cache.os.scandir", wraps=os.scandir
+        ) as mock_scandir:
+            files = scan_cache.scan(library)
+        assert list(files) == [
+            "Bass/2024/b.mp3",
+            "Bass/a.mp3",
+            "Bass/e.mp3",
+            "d.mp3",
+        ]
+        assert sorted(
+            call.args[0] for call in mock_scandir.call_args_list
+        ) == [
+            library.as_posix(),
+            (library / "Bass").as_posix(),
+        ]
+        # Files modified in place are only noticed by forced scans.
+        set_mtimes(library)
+        scan_cache.scan(library)
+        (library / "d.mp3").write_text("modified", encoding="utf-8")
+        assert scan_cache.scan(library)["d.mp3"].size == len("d.mp3")
+        assert scan_cache.scan(library, force=True)["d.mp3"].size == len(
+            "modified"
+        )
+
+
+def test_scancache_scan_relists_recently_modified_directories(library, tmpdir):
+    """Test for the ScanCache class."""
+    set_mtimes(library, offset=0.0)
+    with closing(ScanCache(Path(tmpdir) / "cache.db")) as scan_cache:
+        scan_cache.scan(library)
+        with mock.patch(
+            "djtools.sync.scan_cache.os.scandir", wraps=os.scandir
+        ) as mock_scandir:
+            scan_cache.scan(library)
+    assert mock_scandir.call_count == 4
+
+
+def test_scancache_scan_doesnt_follow_symlinked_directories(library, tmpdir):
+    """Test for the ScanCache class."""
+    (library / "Bass" / "loop").symlink_to(library, target_is_directory=True)
+    with closing(ScanCache(Path(tmpdir) / "cache.db")) as scan_cache:
+        assert list(scan_cache.scan(library)) == [
+            "Bass/2024/b.mp3",
+            "Bass/a.mp3",
+            "Techno/c.mp3",
+            "d.mp3",
+        ]
+
+
+def test_scancache_scan_handles_missing_directory(tmpdir):
+    """Test for the ScanCache class."""
+    with closing(ScanCache(Path(tmpdir) / "cache.db")) as scan_cache:
+        assert not scan_cache.scan(Path(tmpdir) / "missing")
+
+
+def test_scan_library(library):
+    """Test for the scan_library function."""
+    (library / ".d.mp3").write_text("hidden", encoding="utf-8")
+    (library / "README").write_text("readme", encoding="utf-8")
+    assert len(scan_library(library)) == 6
+    assert list(scan_library(library, pattern="*.*")) == [
+        ".d.mp3",
+        "Bass/2024/b.mp3",
+        "Bass/a.mp3",
+        "Techno/c.mp3",
+        "d.mp3",
+    ]
+    assert list(scan_library(library, pattern=".*.*")) == [".d.mp3"]
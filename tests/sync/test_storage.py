@@ -0,0 +1,307 @@
+"""Testing for the storage module."""
+
+from datetime import datetime, timezone
+from pathlib import Path
+import time
+from unittest import mock
+
+import boto3
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+import pytest
+
+from djtools.sync.storage import (
+    compute_etag,
+    get_storage_backend,
+    list_objects_concurrently,
+    LocalBackend,
+    ObjectInfo,
+    S3Backend,
+)
+
+
+def test_localbackend(tmpdir):
+    """Test for the LocalBackend class."""
+    tmpdir = Path(tmpdir)
+    root = tmpdir / "bucket"
+    backend = LocalBackend(root.as_uri())
+    source = tmpdir / "track.mp3"
+    source.write_text("content", encoding="utf-8")
+    backend.upload_file(source, "dj/music/b/track.mp3")
+    backend.upload_file(source, "dj/music/a/track.mp3")
+    backend.upload_file(source, "dj/musical/track.mp3")
+    objects = list(backend.list_objects("dj/music/"))
+    assert [obj.key for obj in objects] == [
+        "dj/music/a/track.mp3",
+        "dj/music/b/track.mp3",
+    ]
+    assert objects[0].size == len("content")
+    assert not list(backend.list_objects("dj/music/", recursive=False))
+    assert [
+        obj.key for obj in backend.list_objects("dj/", recursive=False)
+    ] == []
+    assert [
+        obj.key for obj in backend.list_objects("dj/music", recursive=False)
+    ] == []
+    assert [
+        obj.key for obj in backend.list_objects("dj/musical/", recursive=False)
+    ] == ["dj/musical/track.mp3"]
+    assert not list(backend.list_objects("dj/missing/"))
+    assert list(backend.list_prefixes("dj/music/")) == [
+        "dj/music/a/",
+        "dj/music/b/",
+    ]
+    assert not list(backend.list_prefixes("dj/missing/"))
+    dest = tmpdir / "downloaded.mp3"
+    backend.download_file("dj/music/a/track.mp3", dest)
+    assert dest.read_text(encoding="utf-8") == "content"
+    backend.copy_object("dj/music/a/track.mp3", "dj/music/c/track.mp3")
+    assert backend.get_etag("dj/music/c/track.mp3") == compute_etag(source)
+    assert backend.get_etag("dj/music/d/track.mp3") is None
+    backend.delete_objects(["dj/music/c/track.mp3", "dj/music/d/track.mp3"])
+    assert backend.get_etag("dj/music/c/track.mp3") is None
+    assert backend.url("dj/music/a/track.mp3") == (
+        f"{root.as_uri()}/dj/music/a/track.mp3"
+    )
+    backend.close()
+
+
+@pytest.mark.parametrize(
+    "url,key_prefix", [("s3://bucket", ""), ("s3://bucket/root/", "root/")]
+)
+def test_s3backend(url, key_prefix, monkeypatch):
+    """Test for the S3Backend class."""
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    client = boto3.session.Session(
+        aws_access_key_id="id",
+        aws_secret_access_key="secret",
+        region_name="us-east-1",
+    ).client("s3")
+    with mock.patch("djtools.sync.storage.boto3.session.Session") as session:
+        session.return_value.client.return_value = client
+        with mock.patch(
+            "djtools.sync.storage.create_transfer_manager"
+        ) as manager:
+            backend = S3Backend(url, profile="DJ", max_concurrency=3)
+    session.assert_called_once_with(profile_name="DJ")
+    assert (
+        session.return_value.client.call_args.kwargs[
+            "config"
+        ].max_pool_connections
+        == 3
+    )
+    last_modified = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with Stubber(client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {
+                "Contents": [
+                    {
+                        "Key": f"{key_prefix}dj/music/track.mp3",
+                        "Size": 7,
+                        "LastModified": last_modified,
+                        "ETag": '"abc"',
+                    }
+                ],
+            },
+            {"Bucket": "bucket", "Prefix": f"{key_prefix}dj/music/"},
+        )
+        assert list(backend.list_objects("dj/music/")) == [
+            ObjectInfo(
+                "dj/music/track.mp3", 7, last_modified.timestamp(), "abc"
+            )
+        ]
+        stubber.add_response(
+            "list_objects_v2",
+            {"CommonPrefixes": [{"Prefix": f"{key_prefix}dj/music/user/"}]},
+            {
+                "Bucket": "bucket",
+                "Prefix": f"{key_prefix}dj/music/",
+                "Delimiter": "/",
+            },
+        )
+        assert list(backend.list_prefixes("dj/music/")) == ["dj/music/user/"]
+        stubber.add_response(
+            "list_objects_v2",
+            {},
+            {
+                "Bucket": "bucket",
+                "Prefix": f"{key_prefix}dj/music/",
+                "Delimiter": "/",
+            },
+        )
+        assert not list(backend.list_objects("dj/music/", recursive=False))
+        stubber.add_response(
+            "head_object",
+            {"ETag": '"abc"'},
+            {"Bucket": "bucket", "Key": f"{key_prefix}dj/music/track.mp3"},
+        )
+        assert backend.get_etag("dj/music/track.mp3") == "abc"
+        stubber.add_client_error("head_object", "404")
+        assert backend.get_etag("dj/music/missing.mp3") is None
+        stubber.add_client_error("head_object", "403")
+        with pytest.raises(ClientError):
+            backend.get_etag("dj/music/forbidden.mp3")
+        stubber.add_response(
+            "delete_objects",
+            {},
+            {
+                "Bucket": "bucket",
+                "Delete": {
+                    "Objects": [
+                        {"Key": f"{key_prefix}dj/music/{i}.mp3"}
+                        for i in range(2)
+                    ],
+                    "Quiet": True,
+                },
+            },
+        )
+        stubber.add_response(
+            "delete_objects",
+            {
+                "Errors": [
+                    {"Key": f"{key_prefix}dj/music/2.mp3", "Message": "denied"}
+                ]
+            },
+            {
+                "Bucket": "bucket",
+                "Delete": {
+                    "Objects": [{"Key": f"{key_prefix}dj/music/2.mp3"}],
+                    "Quiet": True,
+                },
+            },
+        )
+        backend.delete_objects([])
+        with mock.patch("djtools.sync.storage.DELETE_BATCH_SIZE", 2):
+            with pytest.raises(OSError, match="e.g. .*2.mp3: denied"):
+                backend.delete_objects(f"dj/music/{i}.mp3" for i in range(3))
+    backend.copy_object("dj/music/track.mp3", "dj/music/copy.mp3")
+    manager.return_value.copy.assert_called_once_with(
+        {"Bucket": "bucket", "Key": f"{key_prefix}dj/music/track.mp3"},
+        "bucket",
+        f"{key_prefix}dj/music/copy.mp3",
+    )
+    backend.upload_file(Path("track.mp3"), "dj/music/track.mp3")
+    manager.return_value.upload.assert_called_once_with(
+        "track.mp3", "bucket", f"{key_prefix}dj/music/track.mp3"
+    )
+    backend.download_file("dj/music/track.mp3", Path("track.mp3"))
+    manager.return_value.download.assert_called_once_with(
+        "bucket", f"{key_prefix}dj/music/track.mp3", "track.mp3"
+    )
+    backend.close()
+    manager.return_value.shutdown.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [
+        (0, "d41d8cd98f00b204e9800998ecf8427e"),
+        (3, "acbd18db4cc2f85cedef654fccc4a4d8"),
+        (4, "8256ee19f43b411afa2b34ae42090aae-2"),
+    ],
+)
+def test_compute_etag(size, expected, tmpdir):
+    """Test for the compute_etag function."""
+    path = Path(tmpdir) / "track.mp3"
+    path.write_bytes(b"foob"[:size])
+    with mock.patch("djtools.sync.storage.TransferConfig") as config:
+        config.return_value.multipart_threshold = 4
+        config.return_value.multipart_chunksize = 3
+        assert compute_etag(path) == expected
+
+
+@mock.patch("djtools.sync.storage.S3Backend")
+def test_get_storage_backend(mock_s3_backend, tmpdir):
+    """Test for the get_storage_backend function."""
+    backend = get_storage_backend(
+        "s3://bucket", profile="DJ", max_concurrency=3
+    )
+    assert backend is mock_s3_backend.return_value
+    mock_s3_backend.assert_called_once_with(
+        "s3://bucket", profile="DJ", max_concurrency=3
+    )
+    assert isinstance(get_storage_backend(Path(tmpdir).as_uri()), LocalBackend)
+
+
+def test_get_storage_backend_handles_unsupported_url():
+    """Test for the get_storage_backend function."""
+    with pytest.raises(ValueError, match="Unsupported storage URL"):
+        get_storage_backend("some-bucket.com")
+
+
+@pytest.mark.parametrize("depth", [0, 1, 2, 3])
+def test_list_objects_concurrently(depth, tmpdir):
+    """Test for the list_objects_concurrently function."""
+    tmpdir = Path(tmpdir)
+    backend = LocalBackend((tmpdir / "bucket").as_uri())
+    source = tmpdir / "track.mp3"
+    source.write_text("content", encoding="utf-8")
+    for key in [
+        "dj/music/track.mp3",
+        "dj/music/user_a/track.mp3",
+        "dj/music/user_a/Bass/track.mp3",
+        "dj/music/user_a/Bass/2024-01-01/track.mp3",
+        "dj/music/user_a/Techno/track.mp3",
+        "dj/music/user_b/Bass/track.mp3",
+        "dj/music_other/track.mp3",
+    ] + [f"dj/music/user_c/Bass/{i:04}.mp3" for i in range(1001)]:
+        backend.upload_file(source, key)
+    assert list(
+        list_objects_concurrently(
+            backend, ["dj/music/"], max_concurrency=2, depth=depth
+        )
+    ) == list(backend.list_objects("dj/music/"))
+    assert list(
+        list_objects_concurrently(
+            backend,
+            ["dj/music/user_b/", "dj/music/user_a/"],
+            max_concurrency=2,
+            depth=depth,
+        )
+    ) == list(backend.list_objects("dj/music/user_a/")) + list(
+        backend.list_objects("dj/music/user_b/")
+    )
+
+
+@mock.patch("djtools.sync.storage.LISTING_CHUNK_SIZE", 2)
+@mock.patch("djtools.sync.storage.LISTING_BUFFERED_CHUNKS", 2)
+def test_list_objects_concurrently_buffers_few_objects(tmpdir):
+    """Test for the list_objects_concurrently function."""
+    tmpdir = Path(tmpdir)
+    backend = LocalBackend((tmpdir / "bucket").as_uri())
+    source = tmpdir / "track.mp3"
+    source.write_text("content", encoding="utf-8")
+    for user in ["user_a", "user_b", "user_c"]:
+        for i in range(20):
+            backend.upload_file(source, f"dj/music/{user}/{i:02}.mp3")
+    listed = []
+    list_objects = backend.list_objects
+
+    def counted_list_objects(*args, **kwargs):
+        for obj in list_objects(*args, **kwargs):
+            listed.append(obj)
+            yield obj
+
+    # More partitions than listing threads mustn't deadlock.
+    with mock.patch.object(backend, "list_objects", counted_list_objects):
+        objects = list_objects_concurrently(
+            backend, ["dj/music/"], max_concurrency=1
+        )
+        first = next(objects)
+        time.sleep(0.1)
+        # At most the buffered chunks, a chunk being read, and a chunk being
+        # listed per partition.
+        assert len(listed) <= 3 * 4 * 2
+        assert [first, *objects] == list(list_objects("dj/music/"))
+    assert len(listed) == 60
+
+
+def test_list_objects_concurrently_raises_listing_errors(tmpdir):
+    """Test for the list_objects_concurrently function."""
+    backend = LocalBackend(Path(tmpdir).as_uri())
+    with mock.patch.object(
+        backend, "list_objects", side_effect=OSError("listing failed")
+    ):
+        with pytest.raises(OSError, match="listing failed"):
+            list(list_objects_concurrently(backend, ["dj/music/"]))
@@ -11,10 +11,9 @@ from djtools.sync.sync_operations import (
     upload_collection,
     upload_music,
 )
-
+from djtools.sync.transfer import scan_local_files
 
 # pylint: disable=duplicate-code
-TEST_BUCKET = "s3://some-bucket.com"
 
 
 @pytest.mark.parametrize("playlist_name", ["", "playlist Uploads"])
@@ -30,39 +29,81 @@ TEST_BUCKET = "s3://some-bucket.com"
 def test_download_music(playlist_name, config, tmpdir, caplog):
     """Test for the download_music function."""
     caplog.set_level("INFO")
-    config.BUCKET_URL = TEST_BUCKET
-    config.USB_PATH = tmpdir
+    bucket = Path(tmpdir) / "bucket"
+    for track in ["file.mp3", "playlist/file.mp3"]:
+        (bucket / "dj" / "music" / track).parent.mkdir(
+            parents=True, exist_ok=True
+        )
+        (bucket / "dj" / "music" / track).write_text("", encoding="utf-8")
+    config.BUCKET_URL = bucket.as_uri()
+    config.USB_PATH = Path(tmpdir) / "usb"
     config.DOWNLOAD_SPOTIFY_PLAYLIST = playlist_name
-    write_path = Path(tmpdir) / "DJ Music" / "file.mp3"
+    write_path = config.USB_PATH / "DJ Music"
     cmd = [
-        "aws",
-        "s3",
         "sync",
-        f"{TEST_BUCKET}/dj/music/",
-        write_path.parent.as_posix(),
+        f"{config.BUCKET_URL}/dj/music/",
+        write_path.as_posix(),
+        "--size-only",
     ]
+    download_music(config)
+    new_files = 1 if playlist_name else 2
+    assert caplog.records[0].message == "Downloading track collection..."
+    assert caplog.records[1].message == f"Found 0 files at {config.USB_PATH}"
+    assert caplog.records[2].message == " ".join(cmd)
     if playlist_name:
-        cmd += ["--exclude", "*", "--include", "playlist/file.mp3"]
-    cmd += ["--size-only"]
+        assert caplog.records[3].message == (
+            "Downloading 1 tracks matching the playlist"
+        )
+    assert caplog.records[-new_files - 1].message == (
+        f"Found {new_files} new files"
+    )
+    assert Path(caplog.records[-1].message).name == "file.mp3"
 
-    def dummy_func():
-        with open(write_path, mode="w", encoding="utf-8") as _file:
-            _file.write("")
 
+@mock.patch(
+    "djtools.sync.sync_operations.compare_tracks",
+    mock.Mock(
+        return_value=(
+            [Path("playlist/file.mp3"), Path("playlist/other.mp3")],
+            [Path("playlist/file.mp3"), Path("playlist/other.mp3")],
+        ),
+    ),
+)
+def test_download_music_playlist_skips_existing_tracks(config, tmpdir, caplog):
+    """Test for the download_music function."""
+    caplog.set_level("INFO")
+    bucket = Path(tmpdir) / "bucket"
+    (bucket / "dj" / "music" / "playlist").mkdir(parents=True)
+    for track in ["file.mp3", "other.mp3", "unmatched.mp3"]:
+        (bucket / "dj" / "music" / "playlist" / track).write_text(
+            track, encoding="utf-8"
+        )
+    config.BUCKET_URL = bucket.as_uri()
+    config.USB_PATH = Path(tmpdir) / "usb"
+    config.DOWNLOAD_SPOTIFY_PLAYLIST = "playlist Uploads"
+    config.DOWNLOAD_EXCLUDE_DIRS = [Path("playlist")]
+    write_path = config.USB_PATH / "DJ Music" / "playlist"
+    write_path.mkdir(parents=True)
+    (write_path / "file.mp3").write_text("file.mp3", encoding="utf-8")
     with mock.patch(
-        "djtools.sync.sync_operations.run_sync",
-        side_effect=lambda *args, **kwargs: dummy_func(),
-    ) as mock_run_sync:
+        "djtools.sync.transfer.scan_local_files", wraps=scan_local_files
+    ) as mock_scan_local_files:
         download_music(config)
-        mock_run_sync.assert_called_with(cmd, TEST_BUCKET)
-    assert caplog.records[0].message == "Downloading track collection..."
-    assert caplog.records[1].message == f"Found 0 files at {config.USB_PATH}"
-    assert caplog.records[2].message == " ".join(cmd)
-    assert caplog.records[3].message == "Found 1 new files"
-    assert Path(caplog.records[4].message).name == "file.mp3"
+    # Only the matching tracks are scanned rather than all of "USB_PATH".
+    assert mock_scan_local_files.call_args.args[1] == {
+        "playlist/file.mp3",
+        "playlist/other.mp3",
+    }
+    assert sorted(path.name for path in write_path.iterdir()) == [
+        "file.mp3",
+        "other.mp3",
+    ]
+    assert caplog.records[-1].message == f"\t{write_path / 'other.mp3'}"
+    # The directory filters are ignored without clearing the shared config's.
+    assert config.DOWNLOAD_EXCLUDE_DIRS == [Path("playlist")]
 
 
-@mock.patch("djtools.utils.helpers.get_spotify_client", mock.Mock())
+@mock.patch("djtools.spotify.helpers.get_spotify_client", mock.Mock())
 def test_download_spotify_playlist_handles_no_matches(config, caplog):
     """Test for the download_music function."""
     caplog.set_level("WARNING")
@@ -85,14 +126,12 @@ def test_download_spotify_playlist_handles_no_matches(config, caplog):
 @pytest.mark.parametrize("collection_is_dir", [True, False])
 @pytest.mark.parametrize("user_is_import_user", [True, False])
 @mock.patch("djtools.sync.sync_operations.rewrite_track_paths")
-@mock.patch("djtools.sync.sync_operations.Popen")
 def test_download_collection(
-    mock_popen,
     mock_rewrite_track_paths,
     collection_is_dir,
     user_is_import_user,
     config,
-    rekordbox_xml,
+    tmpdir,
     caplog,
 ):
     """Test for the download_collection function."""
@@ -100,69 +139,60 @@ def test_download_collection(
     test_user = "test_user"
     other_user = "other_user"
     import_user = test_user if user_is_import_user else other_user
-    config.BUCKET_URL = TEST_BUCKET
+    bucket = Path(tmpdir) / "bucket"
+    config.BUCKET_URL = bucket.as_uri()
     config.USER = test_user
     config.IMPORT_USER = import_user
-    config.COLLECTION_PATH = rekordbox_xml
     config.PLATFORM = "rekordbox"
-    new_xml = rekordbox_xml.parent / f"{import_user}_rekordbox.xml"
-    new_xml.write_text(
-        rekordbox_xml.read_text(encoding="utf-8"), encoding="utf-8"
+    config.COLLECTION_PATH = Path(tmpdir) / "collection"
+    remote_collection = (
+        bucket / "dj" / "collections" / import_user / "rekordbox_collection"
     )
-    process = mock_popen.return_value.__enter__.return_value
-    process.wait.return_value = 0
-    cmd = [
-        "aws",
-        "s3",
-        "cp",
-        f"{TEST_BUCKET}/dj/collections/{import_user}/"
-        f"{config.PLATFORM}_collection",
-        # NOTE(a-rich): since we could be passing a `rekordbox_xml` formatted
-        # as a WindowsPath, the comparison needs to be made with `str(new_xml)`
-        # (rather than `new_xml.as_posix()`).
-        new_xml.as_posix(),
-    ]
     if collection_is_dir:
-        cmd.append("--recursive")
-    with mock.patch(
-        "djtools.sync.sync_operations.Path.is_dir",
-        lambda path: collection_is_dir,
-    ):
-        download_collection(config)
-    mock_popen.assert_called_with(cmd)
+        config.COLLECTION_PATH.mkdir()
+        (remote_collection / "sub").mkdir(parents=True)
+        (remote_collection / "sub" / "file").write_text(
+            "collection", encoding="utf-8"
+        )
+    else:
+        config.COLLECTION_PATH.write_text("", encoding="utf-8")
+        remote_collection.parent.mkdir(parents=True)
+        remote_collection.write_text("collection", encoding="utf-8")
+    download_collection(config)
+    new_collection = Path(tmpdir) / f"{import_user}_collection"
+    if collection_is_dir:
+        new_collection = new_collection / "sub" / "file"
+    assert new_collection.read_text(encoding="utf-8") == "collection"
     assert caplog.records[0].message == (
         f"Downloading {config.IMPORT_USER}'s {config.PLATFORM} collection..."
     )
-    assert caplog.records[1].message == " ".join(cmd)
     if not user_is_import_user:
         mock_rewrite_track_paths.assert_called_once()
+    else:
+        mock_rewrite_track_paths.assert_not_called()
 
 
 @pytest.mark.parametrize(
     "discord_url", ["", "https://discord.com/api/webhooks/some-id/"]
 )
-@mock.patch("djtools.sync.sync_operations.run_sync", return_value=None)
 @mock.patch("djtools.sync.sync_operations.webhook", return_value=None)
-def test_upload_music(
-    mock_webhook, mock_run_sync, discord_url, tmpdir, config, caplog
-):
+def test_upload_music(mock_webhook, discord_url, tmpdir, config, caplog):
     """Test for the upload_music function."""
     caplog.set_level("INFO")
-    config.BUCKET_URL = TEST_BUCKET
-    config.USB_PATH = tmpdir
+    bucket = Path(tmpdir) / "bucket"
+    config.BUCKET_URL = bucket.as_uri()
+    config.USB_PATH = Path(tmpdir) / "usb"
     config.DISCORD_URL = discord_url
-    test_dir = Path(tmpdir) / "DJ Music"
+    test_dir = config.USB_PATH / "DJ Music"
     test_dir.mkdir(parents=True, exist_ok=True)
     for file_name in [".test_file.mp3", "test_file.mp3"]:
         with open(test_dir / file_name, mode="w", encoding="utf-8") as file_:
             file_.write("")
     upload_music(config)
     cmd = [
-        "aws",
-        "s3",
         "sync",
         test_dir.as_posix(),
-        f"{TEST_BUCKET}/dj/music/",
+        f"{config.BUCKET_URL}/dj/music/",
         "--size-only",
     ]
     assert caplog.records[0].message == "Removed 1 files..."
@@ -170,43 +200,66 @@ def test_upload_music(
     assert caplog.records[2].message == "Uploading track collection..."
     assert caplog.records[3].message == " ".join(cmd)
     assert len(list(test_dir.iterdir())) == 1
-    mock_run_sync.assert_called_with(cmd, TEST_BUCKET)
+    assert (bucket / "dj" / "music" / "test_file.mp3").exists()
     if discord_url:
         mock_webhook.assert_called_with(
-            "https://discord.com/api/webhooks/some-id/", content=None
+            "https://discord.com/api/webhooks/some-id/",
+            content=".: 1\n\ttest_file.mp3\n",
         )
 
 
 @pytest.mark.parametrize("collection_is_dir", [True, False])
-@mock.patch("djtools.sync.sync_operations.Popen")
-def test_upload_collection(
-    mock_popen, collection_is_dir, config, rekordbox_xml, caplog
-):
+def test_upload_collection(collection_is_dir, config, tmpdir, caplog):
     """Test for the upload_collection function."""
     caplog.set_level("INFO")
     user = "user"
-    config.BUCKET_URL = TEST_BUCKET
+    bucket = Path(tmpdir) / "bucket"
+    config.BUCKET_URL = bucket.as_uri()
     config.USER = user
-    config.COLLECTION_PATH = rekordbox_xml
     config.PLATFORM = "rekordbox"
-    cmd = [
-        "aws",
-        "s3",
-        "cp",
-        config.COLLECTION_PATH.as_posix(),
-        f"{TEST_BUCKET}/dj/collections/{user}/{config.PLATFORM}_collection",
-    ]
+    config.COLLECTION_PATH = Path(tmpdir) / "collection"
+    remote_collection = (
+        bucket / "dj" / "collections" / user / "rekordbox_collection"
+    )
     if collection_is_dir:
-        cmd.append("--recursive")
-    process = mock_popen.return_value.__enter__.return_value
-    process.wait.return_value = 0
-    with mock.patch(
-        "djtools.sync.sync_operations.Path.is_dir",
-        lambda path: collection_is_dir,
-    ):
-        upload_collection(config)
+        (config.COLLECTION_PATH / "sub").mkdir(parents=True)
+        (config.COLLECTION_PATH / "sub" / "file").write_text(
+            "collection", encoding="utf-8"
+        )
+        remote_collection = remote_collection / "sub" / "file"
+    else:
+        config.COLLECTION_PATH.write_text("collection", encoding="utf-8")
+    upload_collection(config)
     assert caplog.records[0].message == (
         f"Uploading {user}'s {config.PLATFORM} collection..."
     )
-    assert caplog.records[1].message == " ".join(cmd)
-    mock_popen.assert_called_with(cmd)
+    assert remote_collection.read_text(encoding="utf-8") == "collection"
+
+
+@mock.patch("djtools.sync.sync_operations.rewrite_track_paths")
+def test_upload_and_download_compressed_collection(
+    mock_rewrite_track_paths, config, tmpdir
+):
+    """Test for the upload_collection and download_collection functions."""
+    config.BUCKET_URL = (Path(tmpdir) / "bucket").as_uri()
+    config.USER = "user"
+    config.IMPORT_USER = "other_user"
+    config.PLATFORM = "rekordbox"
+    config.UPLOAD_COLLECTION_FORMAT = "gzip"
+    config.COLLECTION_PATH = Path(tmpdir) / "collection"
+    config.COLLECTION_PATH.write_text("collection", encoding="utf-8")
+    upload_collection(config)
+    assert (
+        Path(tmpdir)
+        / "bucket"
+        / "dj"
+        / "collections"
+        / "user"
+        / "rekordbox_collection.gz"
+    ).exists()
+    config.IMPORT_USER, config.USER = config.USER, config.IMPORT_USER
+    download_collection(config)
+    assert (Path(tmpdir) / "user_collection").read_text(
+        encoding="utf-8"
+    ) == "collection"
+    mock_rewrite_track_paths.assert_called_once()
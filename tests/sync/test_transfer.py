@@ -0,0 +1,353 @@
+"""Testing for the transfer module."""
+
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from djtools.sync.storage import LocalBackend, ObjectInfo
+from djtools.sync.transfer import (
+    copy_objects,
+    download_path,
+    is_included,
+    plan_sync,
+    sync,
+    SyncCommand,
+    transfer_files,
+    TransferEvent,
+    TransferStats,
+    upload_path,
+)
+
+
+@pytest.fixture(name="backend")
+def fixture_backend(tmpdir):
+    """Fixture for a LocalBackend."""
+    return LocalBackend((Path(tmpdir) / "bucket").as_uri())
+
+
+def write_file(path: Path, content: str = "content", mtime: float = None):
+    """Writes a file, creating its parent directories.
+
+    Args:
+        path: Path of the file to write.
+        content: Content of the file.
+        mtime: Modified time to set for the file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize(
+    "filters,expected",
+    [
+        ((), True),
+        ((("exclude", "*"),), False),
+        ((("exclude", "*"), ("include", "Bass/*")), True),
+        ((("exclude", "*"), ("include", "Techno/*")), False),
+        ((("include", "*"), ("exclude", "Bass/*")), False),
+        ((("exclude", "Bass/*"), ("include", "*.mp3")), True),
+    ],
+)
+def test_is_included(filters, expected):
+    """Test for the is_included function."""
+    assert is_included("Bass/2024-01-01/track.mp3", filters) == expected
+
+
+@pytest.mark.parametrize("upload", [True, False])
+@pytest.mark.parametrize("size_only", [True, False])
+def test_plan_sync(upload, size_only):
+    """Test for the plan_sync function."""
+    local_files = {
+        "missing.mp3": ObjectInfo("missing.mp3", 1, 1.0),
+        "resized.mp3": ObjectInfo("resized.mp3", 1, 1.0),
+        "newer.mp3": ObjectInfo("newer.mp3", 1, 2.0),
+        "older.mp3": ObjectInfo("older.mp3", 1, 1.0),
+        "excluded.wav": ObjectInfo("excluded.wav", 1, 1.0),
+    }
+    remote_objects = {
+        "missing_locally.mp3": ObjectInfo("missing_locally.mp3", 1, 1.0),
+        "resized.mp3": ObjectInfo("resized.mp3", 2, 1.0),
+        "newer.mp3": ObjectInfo("newer.mp3", 1, 1.0),
+        "older.mp3": ObjectInfo("older.mp3", 1, 2.0),
+        "excluded.wav": ObjectInfo("excluded.wav", 3, 1.0),
+    }
+    command = SyncCommand(
+        Path("local"),
+        "dj/music/",
+        upload=upload,
+        filters=(("exclude", "*.wav"),),
+        size_only=size_only,
+    )
+    expected = ["missing.mp3" if upload else "missing_locally.mp3"]
+    if not size_only:
+        expected.append("newer.mp3")
+    expected.append("resized.mp3")
+    assert [
+        obj.key for obj in plan_sync(command, local_files, remote_objects)
+    ] == sorted(expected)
+
+
+def test_sync_command_flags():
+    """Test for the SyncCommand class."""
+    command = SyncCommand(
+        Path("local"),
+        "dj/music/",
+        filters=(("exclude", "*"), ("include", "Bass/*")),
+        size_only=True,
+        dryrun=True,
+    )
+    assert command.flags() == [
+        "--exclude",
+        "*",
+        "--include",
+        "Bass/*",
+        "--size-only",
+        "--dryrun",
+    ]
+
+
+def test_sync(backend, tmpdir):
+    """Test for the sync function."""
+    local_dir = Path(tmpdir) / "DJ Music"
+    write_file(local_dir / "Bass" / "track.mp3")
+    write_file(local_dir / "Techno" / "track.mp3")
+    upload = SyncCommand(local_dir, "dj/music/", upload=True, size_only=True)
+    assert sync(backend, upload) == ["Bass/track.mp3", "Techno/track.mp3"]
+    assert not sync(backend, upload)
+
+    other_dir = Path(tmpdir) / "Other DJ Music"
+    download = SyncCommand(
+        other_dir,
+        "dj/music/",
+        filters=(("exclude", "*"), ("include", "Bass/*")),
+        size_only=True,
+    )
+    assert sync(backend, download) == ["Bass/track.mp3"]
+    assert (other_dir / "Bass" / "track.mp3").read_text(
+        encoding="utf-8"
+    ) == "content"
+    assert not (other_dir / "Techno").exists()
+    assert not sync(backend, download._replace(size_only=False))
+
+
+def test_sync_dryrun(backend, tmpdir, caplog):
+    """Test for the sync function."""
+    caplog.set_level("INFO")
+    local_dir = Path(tmpdir) / "DJ Music"
+    write_file(local_dir / "track.mp3")
+    command = SyncCommand(local_dir, "dj/music/", upload=True, dryrun=True)
+    assert sync(backend, command) == ["track.mp3"]
+    assert not list(backend.list_objects("dj/music/"))
+    assert caplog.records[0].message == (
+        f"(dryrun) upload: {local_dir / 'track.mp3'} to "
+        f"{backend.url('dj/music/track.mp3')}"
+    )
+    caplog.clear()
+    assert not sync(backend, command._replace(upload=False))
+    upload_path(backend, local_dir / "track.mp3", "dj/music/track.mp3")
+    caplog.clear()
+    assert sync(
+        backend,
+        command._replace(upload=False, local_dir=Path(tmpdir) / "other"),
+    ) == ["track.mp3"]
+    assert caplog.records[0].message == (
+        f"(dryrun) download: {backend.url('dj/music/track.mp3')} to "
+        f"{Path(tmpdir) / 'other' / 'track.mp3'}"
+    )
+
+
+def test_upload_and_download_path(backend, tmpdir):
+    """Test for the upload_path and download_path functions."""
+    tmpdir = Path(tmpdir)
+    write_file(tmpdir / "collection.xml", "xml", mtime=1000.0)
+    write_file(tmpdir / "collection" / "a.db", "a")
+    write_file(tmpdir / "collection" / "sub" / "b.db", "b")
+    upload_path(backend, tmpdir / "collection.xml", "dj/collections/xml")
+    upload_path(backend, tmpdir / "collection", "dj/collections/dir")
+    download_path(backend, "dj/collections/xml", tmpdir / "downloaded.xml")
+    download_path(
+        backend,
+        "dj/collections/dir",
+        tmpdir / "downloaded",
+        recursive=True,
+    )
+    assert (tmpdir / "downloaded.xml").read_text(encoding="utf-8") == "xml"
+    assert (tmpdir / "downloaded" / "a.db").read_text(encoding="utf-8") == "a"
+    assert (tmpdir / "downloaded" / "sub" / "b.db").read_text(
+        encoding="utf-8"
+    ) == "b"
+    # Downloads take on the last modified time of the object.
+    assert (tmpdir / "downloaded.xml").stat().st_mtime == next(
+        backend.list_objects("dj/collections/xml")
+    ).last_modified
+
+
+def test_download_path_handles_missing_object(backend, tmpdir):
+    """Test for the download_path function."""
+    with pytest.raises(FileNotFoundError, match="does not exist"):
+        download_path(backend, "dj/collections/xml", Path(tmpdir) / "xml")
+
+
+def test_transfer_files_cleans_up_failed_downloads(backend, tmpdir):
+    """Test for the transfer_files function."""
+    path = Path(tmpdir) / "track.mp3"
+
+    def fail_download(_, part_path):
+        part_path.write_text("partial", encoding="utf-8")
+        raise OSError("connection reset")
+
+    events = []
+    with mock.patch.object(
+        backend, "download_file", side_effect=fail_download
+    ):
+        with pytest.raises(OSError, match="connection reset"):
+            transfer_files(
+                backend,
+                [(path, "track.mp3", 7, 1.0)],
+                False,
+                on_event=events.append,
+            )
+    assert not list(Path(tmpdir).iterdir())
+    assert events == [
+        TransferEvent(
+            "download",
+            backend.url("track.mp3"),
+            str(path),
+            7,
+            error="connection reset",
+        )
+    ]
+
+
+def test_sync_with_remote_objects(backend, tmpdir):
+    """Test for the sync function."""
+    local_dir = Path(tmpdir) / "DJ Music"
+    write_file(local_dir / "Bass" / "track.mp3")
+    write_file(local_dir / "Techno" / "track.mp3")
+    command = SyncCommand(local_dir, "dj/music/", upload=True, size_only=True)
+    remote_objects = [ObjectInfo("dj/music/Bass/track.mp3", 7, 1.0)]
+    with mock.patch.object(backend, "list_objects") as mock_list_objects:
+        assert sync(backend, command, remote_objects=remote_objects) == [
+            "Techno/track.mp3"
+        ]
+    mock_list_objects.assert_not_called()
+
+
+@pytest.mark.parametrize("dryrun", [True, False])
+def test_transfer_files_emits_events(dryrun, backend, tmpdir, caplog):
+    """Test for the transfer_files function."""
+    caplog.set_level("INFO")
+    path = Path(tmpdir) / "track.mp3"
+    write_file(path)
+    events = []
+    transfer_files(
+        backend,
+        [(path, "dj/music/track.mp3", 7, 1.0)],
+        True,
+        dryrun=dryrun,
+        on_event=events.append,
+    )
+    assert len(events) == 1
+    assert events[0]._replace(seconds=0.0) == TransferEvent(
+        "upload",
+        str(path),
+        backend.url("dj/music/track.mp3"),
+        7,
+        dryrun=dryrun,
+    )
+    assert caplog.records[0].message == str(events[0])
+
+
+def test_transfer_event():
+    """Test for the TransferEvent class."""
+    event = TransferEvent("upload", "track.mp3", "s3://bucket/track.mp3", 7)
+    assert str(event) == "upload: track.mp3 to s3://bucket/track.mp3"
+    assert str(event._replace(dryrun=True)) == (
+        "(dryrun) upload: track.mp3 to s3://bucket/track.mp3"
+    )
+    assert str(event._replace(error="Access Denied")) == (
+        "upload failed: track.mp3 to s3://bucket/track.mp3 Access Denied"
+    )
+
+
+def test_transfer_stats():
+    """Test for the TransferStats class."""
+    with mock.patch(
+        "djtools.sync.transfer.time.perf_counter", side_effect=[0.0, 2.0]
+    ):
+        stats = TransferStats()
+        event = TransferEvent("download", "s3://bucket/a.mp3", "a.mp3", 1024)
+        stats.add(event)
+        stats.add(event._replace(size=3072))
+        stats.add(event._replace(dryrun=True))
+        stats.add(event._replace(error="Access Denied"))
+        stats.add(event._replace(operation="copy"))
+        assert (stats.files, stats.bytes, stats.failed) == (2, 4096, 1)
+        assert stats.copied == 1
+        assert stats.summary() == (
+            "Downloaded 2 files (4.00kB) in 2.0s at 2.00kB/s; copied 1 "
+            "files; 1 failed"
+        )
+
+
+@pytest.mark.parametrize("dryrun", [True, False])
+def test_sync_copies_duplicate_uploads(dryrun, backend, tmpdir, caplog):
+    """Test for the sync function."""
+    caplog.set_level("INFO")
+    local_dir = Path(tmpdir) / "DJ Music"
+    write_file(local_dir / "Bass" / "track.mp3")
+    command = SyncCommand(local_dir, "dj/music/", upload=True)
+    sync(backend, command)
+    (local_dir / "Bass" / "track.mp3").rename(local_dir / "renamed.mp3")
+    write_file(local_dir / "different.mp3", "differs")
+    write_file(local_dir / "smaller.mp3", "small")
+    caplog.clear()
+    with mock.patch.object(
+        backend, "upload_file", wraps=backend.upload_file
+    ) as mock_upload_file:
+        assert sync(backend, command._replace(dryrun=dryrun)) == [
+            "different.mp3",
+            "renamed.mp3",
+            "smaller.mp3",
+        ]
+    assert caplog.records[0].message == (
+        "1 files already exist under other keys; copying the existing "
+        "objects instead of uploading them"
+    )
+    assert caplog.records[1].message == (
+        f"{'(dryrun) ' if dryrun else ''}copy: "
+        f"{backend.url('dj/music/Bass/track.mp3')} to "
+        f"{backend.url('dj/music/renamed.mp3')}"
+    )
+    if not dryrun:
+        assert sorted(
+            call.args[1] for call in mock_upload_file.call_args_list
+        ) == ["dj/music/different.mp3", "dj/music/smaller.mp3"]
+        assert backend.get_etag("dj/music/renamed.mp3") == backend.get_etag(
+            "dj/music/Bass/track.mp3"
+        )
+
+
+def test_copy_objects_handles_failure(backend):
+    """Test for the copy_objects function."""
+    events = []
+    with mock.patch.object(
+        backend, "copy_object", side_effect=OSError("Access Denied")
+    ):
+        with pytest.raises(OSError, match="Access Denied"):
+            copy_objects(
+                backend, [("a.mp3", "b.mp3", 7)], on_event=events.append
+            )
+    assert events == [
+        TransferEvent(
+            "copy",
+            backend.url("a.mp3"),
+            backend.url("b.mp3"),
+            7,
+            error="Access Denied",
+        )
+    ]
@@ -1,8 +1,13 @@
 """Testing the main entrypoint for the djtools library."""
 
+import subprocess
+import sys
 from unittest import mock
 
+import pytest
+
 from djtools import main
+from djtools.utils.run_context import get_run_context, shared
 from .test_utils import MockOpen
 
 
@@ -13,13 +18,13 @@ from .test_utils import MockOpen
         write_only=True,
     ).open,
 )
-@mock.patch("djtools.upload_log", mock.Mock())
+@mock.patch("djtools.sync.helpers.upload_log", mock.Mock())
 @mock.patch("djtools.UTILS_OPERATIONS")
 @mock.patch("argparse.ArgumentParser.parse_args")
 def test_main(mock_parse_args, mock_utils_operations, namespace):
     """Test for the main function."""
     mock_ops = {
-        "CHECK_TRACKS": lambda x, beatcloud_tracks=[]: None,
+        "CHECK_TRACKS": lambda x: None,
         "URL_DOWNLOAD": lambda x: None,
     }
     mock_utils_operations.items.side_effect = mock_ops.items
@@ -27,3 +32,102 @@ def test_main(mock_parse_args, mock_utils_operations, namespace):
     namespace.url_download = "some-url"
     mock_parse_args.return_value = namespace
     main()
+
+
+@mock.patch(
+    "builtins.open",
+    MockOpen(
+        files=["config.yaml"],
+        write_only=True,
+    ).open,
+)
+@mock.patch("djtools.sync.helpers.upload_log")
+@mock.patch("djtools.UTILS_OPERATIONS")
+@mock.patch("argparse.ArgumentParser.parse_args")
+def test_main_shares_resources_between_operations(
+    mock_parse_args, mock_utils_operations, mock_upload_log, namespace
+):
+    """Test for the main function."""
+    resources = []
+    deferred = mock.Mock()
+
+    def operation(_):
+        resources.append(shared("resource", object))
+        get_run_context().defer("resource", deferred)
+
+    mock_utils_operations.items.side_effect = {
+        "CHECK_TRACKS": operation,
+        "URL_DOWNLOAD": operation,
+    }.items
+    mock_upload_log.side_effect = lambda *_: deferred.assert_called_once()
+    namespace.check_tracks = True
+    namespace.url_download = "some-url"
+    mock_parse_args.return_value = namespace
+    main()
+    assert len(resources) == 2
+    assert resources[0] is resources[1]
+    mock_upload_log.assert_called_once()
+    assert get_run_context() is None
+
+
+@mock.patch(
+    "builtins.open",
+    MockOpen(
+        files=["config.yaml"],
+        write_only=True,
+    ).open,
+)
+@mock.patch("djtools.sync.helpers.upload_log", mock.Mock())
+@mock.patch("djtools.utils.watch.watch")
+@mock.patch("argparse.ArgumentParser.parse_args")
+def test_main_watches(mock_parse_args, mock_watch, namespace):
+    """Test for the main function."""
+    namespace.watch = True
+    mock_parse_args.return_value = namespace
+    main()
+    mock_watch.assert_called_once()
+    assert mock_watch.call_args.args[0].WATCH
+
+
+def test_import_defers_operation_dependencies():
+    """Test that importing djtools doesn't import the libraries that only its
+    operations depend on."""
+    modules = [
+        "asyncpraw",
+        "bs4",
+        "fuzzywuzzy",
+        "jinja2",
+        "Levenshtein",
+        "pydub",
+        "pyperclip",
+        "spotipy",
+        "youtube_dl",
+    ]
+    code = (
+        "import sys\n"
+        "from djtools.configs.helpers import build_config\n"
+        "import djtools.sync.sync_operations\n"
+        f"print([module for module in {modules} if module in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "djtools.collection.config",
+        "djtools.configs.helpers",
+        "djtools.spotify.config",
+        "djtools.sync.config",
+        "djtools.utils.config",
+    ],
+)
+def test_import_modules_first(module):
+    """Test that each module can be the first one of djtools imported."""
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
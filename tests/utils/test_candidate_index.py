@@ -0,0 +1,58 @@
+"""Testing for the candidate_index module."""
+
+import random
+import string
+
+from fuzzywuzzy import fuzz
+import pytest
+
+from djtools.utils.candidate_index import CandidateIndex, get_tokens
+
+
+def test_get_tokens():
+    """Test for the get_tokens function."""
+    assert list(get_tokens("abab")) == [("ab", 0), ("ba", 0), ("ab", 1)]
+    assert not list(get_tokens("a"))
+
+
+@pytest.mark.parametrize("threshold", [0, 50, 70, 80, 90, 100])
+def test_candidateindex_finds_every_match(threshold):
+    """Test for the CandidateIndex class."""
+    rng = random.Random(0)
+    names = [
+        "".join(rng.choice("abcde -") for _ in range(rng.randint(0, 30)))
+        for _ in range(200)
+    ]
+    # Add near duplicates so there are matches at every threshold.
+    names += [f"{name[1:]}x" for name in names[:50]]
+    index = CandidateIndex(names)
+    for query in names[:20] + names[-20:]:
+        candidates = index.get_candidates(query, threshold)
+        assert {
+            name for name in names if fuzz.ratio(query, name) >= threshold
+        } <= set(candidates)
+
+
+def test_candidateindex_proposes_few_candidates():
+    """Test for the CandidateIndex class."""
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(6))
+        for _ in range(500)
+    ]
+    names = [
+        f"{' '.join(rng.sample(words, 3))} - {rng.choice(words)}"
+        for _ in range(1000)
+    ]
+    index = CandidateIndex(names)
+    query = f"{names[500][:-1]}x"
+    candidates = index.get_candidates(query, 80)
+    assert len(candidates) < len(names) / 100
+    assert names[500] in candidates
+    assert index.get_candidates(names[500], 100) == [names[500]]
+
+
+def test_candidateindex_proposes_every_track_for_zero_threshold():
+    """Test for the CandidateIndex class."""
+    names = ["a", "bb", "ccc"]
+    assert CandidateIndex(names).get_candidates("zzzz", 0) == names
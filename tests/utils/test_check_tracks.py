@@ -18,7 +18,7 @@ from djtools.utils.check_tracks import compare_tracks
     new=mock.Mock(return_value=[]),
 )
 @mock.patch("djtools.utils.check_tracks.get_local_tracks")
-@mock.patch("djtools.utils.helpers.get_spotify_client", new=mock.Mock())
+@mock.patch("djtools.spotify.helpers.get_spotify_client", new=mock.Mock())
 def test_compare_tracks_ignores_local_dirs_with_download_spotify_playlist(
     mock_get_local_tracks, download_from_spotify, config
 ):
@@ -147,34 +147,35 @@ def test_compare_tracks_get_local_tracks_no_tracks(config, caplog):
 
 
 @pytest.mark.parametrize("artist_first", [False, True])
-@mock.patch("djtools.utils.check_tracks.find_matches")
 @mock.patch("djtools.utils.check_tracks.get_beatcloud_tracks")
 @mock.patch("djtools.utils.check_tracks.get_local_tracks")
-@mock.patch("djtools.utils.check_tracks.reverse_title_and_artist")
 def test_compare_tracks_get_local_tracks_yields_tracks(
-    mock_reverse_title_and_artist,
     mock_get_local_tracks,
     mock_get_beatcloud_tracks,
-    mock_find_matches,
     artist_first,
     config,
+    caplog,
 ):
     """Test the compare_tracks function."""
+    caplog.set_level("INFO")
     local_dir = Path("some/dir")
     config.LOCAL_DIRS = [local_dir]
     config.ARTIST_FIRST = artist_first
-    file_stem = "artist - title" if artist_first else "title - artist"
+    # Local files are named "TITLE - ARTIST NAME" even with ARTIST_FIRST.
     mock_get_local_tracks.return_value = {
-        local_dir: [Path(f"{file_stem}.mp3")]
+        local_dir: [Path("Title (feat. Other) - Artist.mp3")]
     }
-    mock_get_beatcloud_tracks.return_value = [Path(f"{file_stem}.mp3")]
-    find_matches_result = [(local_dir, file_stem, file_stem, 100)]
-    mock_find_matches.return_value = find_matches_result
-    compare_tracks(config)
-    if artist_first:
-        mock_reverse_title_and_artist.assert_called_once()
-    else:
-        mock_reverse_title_and_artist.assert_not_called()
+    beatcloud_track = Path(
+        "genre/Artist, Other - Title.mp3"
+        if artist_first
+        else "genre/Title - Artist, Other.mp3"
+    )
+    mock_get_beatcloud_tracks.return_value = [beatcloud_track]
+    _, beatcloud_matches = compare_tracks(config)
+    assert beatcloud_matches == [beatcloud_track]
+    assert caplog.records[-1].message == (
+        f"\t100: Title (feat. Other) - Artist | {beatcloud_track.stem}"
+    )
 
 
 @pytest.mark.parametrize(
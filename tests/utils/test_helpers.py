@@ -3,13 +3,18 @@
 from datetime import datetime
 from pathlib import Path
 import logging
+import typing
 from typing import Optional
 from unittest import mock
 
 import pytest
 from pydub import AudioSegment, generators
 
+from djtools.utils.candidate_index import CandidateIndex
 from djtools.utils.helpers import (
+    _init_match_worker,
+    _match_tracks,
+    _score_chunk,
     compute_distance,
     find_matches,
     get_beatcloud_tracks,
@@ -22,6 +27,8 @@ from djtools.utils.helpers import (
     reverse_title_and_artist,
     trim_initial_silence,
 )
+from djtools.utils.match_cache import QUERY_TTL
+from djtools.utils.run_context import run_context
 
 
 @pytest.mark.parametrize("track_a", ["some track", "another track"])
@@ -72,8 +79,232 @@ def test_find_matches(config):
     assert {x[1] for x in matches} == set(expected_matches)
 
 
+@pytest.mark.parametrize("artist_first", [False, True])
+@mock.patch("djtools.utils.helpers.CandidateIndex")
+def test_find_matches_normalized_names(mock_index, artist_first, config):
+    """Test for the find_matches function."""
+    config.ARTIST_FIRST = artist_first
+    config.CHECK_TRACKS_FUZZ_RATIO = 100
+    tracks = [
+        ("Track (feat. Other) - Someone", "track - other, someone"),
+        ("Another Track - A & B", "another track - b, a"),
+    ]
+    if artist_first:
+        tracks = [
+            tuple(" - ".join(name.split(" - ")[::-1]) for name in pair)
+            for pair in tracks
+        ]
+    compare_tracks, beatcloud_tracks = zip(*tracks)
+    matches = find_matches(
+        compare_tracks={"playlist": compare_tracks},
+        beatcloud_tracks=beatcloud_tracks,
+        config=config,
+    )
+    assert matches == [("playlist", *pair, 100) for pair in tracks]
+    mock_index.assert_not_called()
+
+
+def test_find_matches_caches_matches(config):
+    """Test for the find_matches function."""
+    config.CHECK_TRACKS_FUZZ_RATIO = 90
+    beatcloud_tracks = [
+        "track 1 - someone unique",
+        "track 2 - seen them befor",
+        "track 5 - who's that?",
+    ]
+    with mock.patch(
+        "djtools.utils.helpers._match_tracks", wraps=_match_tracks
+    ) as mock_match_tracks:
+        matches = find_matches(
+            {"playlist": ["Track 1 - Someone Unique", "track 3 - nobody"]},
+            beatcloud_tracks,
+            config,
+            cache_key="key",
+        )
+        assert matches == [
+            (
+                "playlist",
+                "Track 1 - Someone Unique",
+                "track 1 - someone unique",
+                100,
+            )
+        ]
+        assert mock_match_tracks.call_count == 1
+
+        # Only the new track is scored against the Beatcloud and only the new
+        # Beatcloud track against the cached tracks.
+        beatcloud_tracks.append("track 3 - nobody!")
+        mock_match_tracks.reset_mock()
+        matches = find_matches(
+            {
+                "playlist": ["track 3 - nobody"],
+                "other": ["track 2 - seen them before"],
+            },
+            beatcloud_tracks,
+            config,
+            cache_key="key",
+        )
+        assert matches == [
+            ("playlist", "track 3 - nobody", "track 3 - nobody!", 100),
+            (
+                "other",
+                "track 2 - seen them before",
+                "track 2 - seen them befor",
+                98,
+            ),
+        ]
+        assert [
+            (
+                [track for _, track in call.args[0]],
+                list(call.args[1]),
+            )
+            for call in mock_match_tracks.call_args_list
+        ] == [
+            (
+                ["Track 1 - Someone Unique", "track 3 - nobody"],
+                ["track 3 - nobody!"],
+            ),
+            (["track 2 - seen them before"], sorted(beatcloud_tracks)),
+        ]
+
+        # Removing the exact match of a track checks it again.
+        beatcloud_tracks.remove("track 1 - someone unique")
+        mock_match_tracks.reset_mock()
+        matches = find_matches(
+            {"playlist": ["Track 1 - Someone Unique"]},
+            beatcloud_tracks,
+            config,
+            cache_key="key",
+        )
+        assert not matches
+        mock_match_tracks.assert_called_once()
+        assert mock_match_tracks.call_args.args[0] == [
+            ("track 1 - someone unique", "Track 1 - Someone Unique")
+        ]
+
+
+def test_find_matches_caches_normalized_names_per_bucket(config):
+    """Test for the find_matches function."""
+    config.CHECK_TRACKS_FUZZ_RATIO = 90
+    beatcloud_tracks = ["track 2 - seen them befor"]
+    with mock.patch(
+        "djtools.utils.helpers._match_tracks", wraps=_match_tracks
+    ) as mock_match_tracks:
+        find_matches(
+            {"playlist": ["track 2 - seen them before"]},
+            beatcloud_tracks,
+            config,
+            cache_key="key",
+        )
+        # A variant of a cached name isn't scored again.
+        matches = find_matches(
+            {"playlist": ["Track 2 - Seen Them Before!"]},
+            beatcloud_tracks,
+            config,
+            cache_key="key",
+        )
+        assert matches == [
+            (
+                "playlist",
+                "Track 2 - Seen Them Before!",
+                "track 2 - seen them befor",
+                98,
+            )
+        ]
+        assert mock_match_tracks.call_count == 1
+        # Other buckets don't share the cache.
+        config.BUCKET_URL = "s3://other-bucket"
+        find_matches(
+            {"playlist": ["track 2 - seen them before"]},
+            beatcloud_tracks,
+            config,
+            cache_key="key",
+        )
+        assert mock_match_tracks.call_count == 2
+
+
+def test_find_matches_forgets_tracks_not_checked_recently(config):
+    """Test for the find_matches function."""
+    with mock.patch("djtools.utils.helpers.time.time", return_value=0.0):
+        find_matches(
+            {"playlist": ["track 1 - someone"]},
+            ["track 2 - other"],
+            config,
+            "key",
+        )
+    with (
+        mock.patch(
+            "djtools.utils.helpers.time.time", return_value=QUERY_TTL + 1.0
+        ),
+        mock.patch(
+            "djtools.utils.helpers._match_tracks", wraps=_match_tracks
+        ) as mock_match_tracks,
+    ):
+        find_matches(
+            {"playlist": ["track 3 - someone else"]},
+            ["track 2 - other", "track 4 - new"],
+            config,
+            "key",
+        )
+    # The forgotten track isn't scored against the new Beatcloud track.
+    assert mock_match_tracks.call_args_list == [
+        mock.call(
+            [("track 3 - someone else", "track 3 - someone else")],
+            ["track 2 - other", "track 4 - new"],
+            config,
+        )
+    ]
+
+
+@pytest.mark.parametrize("cpu_count", [None, 2])
+@mock.patch("djtools.utils.helpers.MATCH_CHUNK_SIZE", 1)
+def test_find_matches_in_worker_processes(cpu_count, config):
+    """Test for the find_matches function."""
+    config.CHECK_TRACKS_FUZZ_RATIO = 90
+    with mock.patch(
+        "djtools.utils.helpers.os.cpu_count", return_value=cpu_count
+    ):
+        matches = find_matches(
+            compare_tracks={
+                "playlist_a": ["track 1 - someone unique"],
+                "playlist_b": [
+                    "track 2 - seen them before",
+                    "track 3 - nobody",
+                ],
+            },
+            beatcloud_tracks=[
+                "track 1 - someone unique",
+                "track 2 - seen them befor",
+            ],
+            config=config,
+        )
+    assert sorted(matches) == [
+        (
+            "playlist_a",
+            "track 1 - someone unique",
+            "track 1 - someone unique",
+            100,
+        ),
+        (
+            "playlist_b",
+            "track 2 - seen them before",
+            "track 2 - seen them befor",
+            98,
+        ),
+    ]
+
+
+def test_score_chunk():
+    """Test for the _score_chunk function."""
+    _init_match_worker(CandidateIndex(["some track", "another track"]))
+    assert _score_chunk(
+        [("playlist", "some track"), ("playlist", "other track")], 100
+    ) == [("playlist", "some track", "some track", 100)]
+    _init_match_worker(None)
+
+
 @pytest.mark.parametrize(
-    "proc_dump",
+    "tracks",
     [
         [],
         [
@@ -82,19 +313,36 @@ def test_find_matches(config):
         ],
     ],
 )
-@mock.patch("djtools.utils.helpers.check_output")
-def test_get_beatcloud_tracks(mock_os_popen, proc_dump):
+def test_get_beatcloud_tracks(tracks, config, tmpdir, caplog):
     """Test for the get_beatcloud_tracks function."""
-    bucket_url = "s3://some-bucket.com"
-    proc_dump = list(map(Path, proc_dump))
-    mock_os_popen.return_value = b"\n".join(
-        map(lambda x: x.as_posix().encode(), proc_dump)
+    caplog.set_level("INFO")
+    bucket = Path(tmpdir) / "bucket"
+    for track in tracks:
+        (bucket / "dj" / "music" / track).parent.mkdir(
+            parents=True, exist_ok=True
+        )
+        (bucket / "dj" / "music" / track).write_text("", encoding="utf-8")
+    config.BUCKET_URL = bucket.as_uri()
+    beatcloud_tracks = get_beatcloud_tracks(config)
+    assert beatcloud_tracks == list(map(Path, tracks))
+    if tracks:
+        assert caplog.records[0].message == (
+            "Refreshed the listing of 1 users"
+        )
+    assert caplog.records[-1].message == (
+        f"Got {len(tracks)} tracks from the beatcloud"
     )
-    tracks = get_beatcloud_tracks(bucket_url)
-    mock_os_popen.assert_called_once()
-    assert len(tracks) == len(proc_dump)
-    for track, line in zip(tracks, proc_dump):
-        assert track == line
+
+
+@mock.patch("djtools.utils.helpers._list_beatcloud_tracks")
+def test_get_beatcloud_tracks_is_shared_by_run(
+    mock_list_beatcloud_tracks, config
+):
+    """Test for the get_beatcloud_tracks function."""
+    with run_context():
+        tracks = get_beatcloud_tracks(config)
+        assert get_beatcloud_tracks(config) is tracks
+    mock_list_beatcloud_tracks.assert_called_once_with(config)
 
 
 def test_get_local_tracks_dir_does_not_exist(config, caplog):
@@ -209,9 +457,9 @@ def test_get_playlist_tracks_handles_spotipy_exception(
         get_playlist_tracks(mock_spotipy, test_playlist_id)
 
 
-@mock.patch("djtools.utils.helpers.get_spotify_client", new=mock.Mock())
+@mock.patch("djtools.spotify.helpers.get_spotify_client", new=mock.Mock())
 @mock.patch(
-    "djtools.utils.helpers.get_playlist_ids",
+    "djtools.spotify.helpers.get_playlist_ids",
     new=mock.Mock(
         return_value={"r/techno | Top weekly Posts": "5gex4eBgWH9nieoVuV8hDC"}
     ),
@@ -228,9 +476,9 @@ def test_get_spotify_tracks_no_matching_playlist_id(config, caplog):
 
 
 @pytest.mark.parametrize("verbosity", [0, 1])
-@mock.patch("djtools.utils.helpers.get_spotify_client", new=mock.Mock())
+@mock.patch("djtools.spotify.helpers.get_spotify_client", new=mock.Mock())
 @mock.patch(
-    "djtools.utils.helpers.get_playlist_ids",
+    "djtools.spotify.helpers.get_playlist_ids",
     new=mock.Mock(
         return_value={"r/techno | Top weekly Posts": "5gex4eBgWH9nieoVuV8hDC"}
     ),
@@ -268,6 +516,7 @@ def test_initialize_logger():
     [
         ({"str_kwarg": "string kwarg", "path_kwarg": "path kwarg"}, str, Path),
         ({}, type(None), type(None)),
+        ({"path_kwarg": None}, type(None), type(None)),
     ],
 )
 def test_make_path_decorator(kwargs, expected_str_kwarg, expected_path_kwarg):
@@ -293,6 +542,8 @@ def test_make_path_decorator(kwargs, expected_str_kwarg, expected_path_kwarg):
     [
         (1, "", 'Error creating Path in function "foo" from positional'),
         ("", 1, 'Error creating Path in function "foo" from keyword'),
+        (None, "", 'Error creating Path in function "foo" from positional'),
+        ("", None, 'Error creating Path in function "foo" from keyword'),
     ],
 )
 def test_make_path_decorator_raises_error(arg, kwarg, expected):
@@ -312,8 +563,42 @@ def test_make_path_decorator_raises_error(arg, kwarg, expected):
         foo(arg, path_kwarg=kwarg)
 
 
-@mock.patch("djtools.utils.helpers.AudioSegment.export", new=mock.Mock())
-@mock.patch("djtools.utils.helpers.effects.normalize")
+def test_make_path_decorator_resolves_annotations_once():
+    """Test for the make_path decorator function."""
+
+    class Foo:  # pylint: disable=disallowed-name,too-few-public-methods
+        """Class with a decorated method."""
+
+        @make_path
+        def bar(  # pylint: disable=disallowed-name
+            self, str_arg: str, path_arg: Path, *, path_kwarg: Optional[Path]
+        ):
+            """Method with Path parameters."""
+            return self, str_arg, path_arg, path_kwarg
+
+    foo = Foo()  # pylint: disable=disallowed-name
+    with mock.patch(
+        "djtools.utils.helpers.typing.get_type_hints",
+        wraps=typing.get_type_hints,
+    ) as mock_get_type_hints:
+        assert foo.bar("a", "b", path_kwarg="c") == (
+            foo,
+            "a",
+            Path("b"),
+            Path("c"),
+        )
+        assert foo.bar("a", path_arg=Path("b"), path_kwarg=None) == (
+            foo,
+            "a",
+            Path("b"),
+            None,
+        )
+    mock_get_type_hints.assert_called_once()
+    assert Foo.bar.__name__ == "bar"
+
+
+@mock.patch("pydub.AudioSegment.export", new=mock.Mock())
+@mock.patch("pydub.effects.normalize")
 def test_process_parallel(mock_normalize, config, audio_file, tmpdir):
     """Test for the process_parallel function."""
     audio, _ = audio_file
@@ -327,10 +612,12 @@ def test_reverse_title_and_artist():
     path_lookup = {
         "title - artist": "path/to/title - artist.mp3",
         "multiple - hyphens - artist": "path/to/multiple - hyphens - artist.mp3",
+        "no artist": "path/to/no artist.mp3",
     }
     expected = {
         "artist - title": "path/to/title - artist.mp3",
         "artist - multiple - hyphens": "path/to/multiple - hyphens - artist.mp3",
+        "no artist - ": "path/to/no artist.mp3",
     }
     new_path_lookup = reverse_title_and_artist(path_lookup)
     assert new_path_lookup == expected
@@ -0,0 +1,37 @@
+"""Testing for the lazy module."""
+
+import os
+
+import pytest
+
+import djtools.utils
+from djtools.utils.lazy import lazy_exports, LazyOperation
+
+
+def test_lazyoperation():
+    """Test for the LazyOperation class."""
+    operation = LazyOperation("os.path", "join")
+    assert repr(operation) == "LazyOperation(os.path.join)"
+    assert operation("a", "b") == os.path.join("a", "b")
+    func = operation.resolve()
+    assert operation.resolve() is func
+    assert operation.reads == operation.writes == frozenset()
+    operation = LazyOperation("os.path", "join", reads=["a"], writes=["b"])
+    assert operation.reads == {"a"}
+    assert operation.writes == {"b"}
+
+
+def test_lazy_exports(monkeypatch):
+    """Test for the lazy_exports function."""
+    monkeypatch.delattr(djtools.utils, "normalize", raising=False)
+    __getattr__ = lazy_exports(
+        "djtools.utils", {"normalize": "djtools.utils.normalize_audio"}
+    )
+    normalize = __getattr__("normalize")
+    assert normalize.__module__ == "djtools.utils.normalize_audio"
+    assert djtools.utils.normalize is normalize
+    with pytest.raises(
+        AttributeError,
+        match="module 'djtools.utils' has no attribute 'missing'",
+    ):
+        __getattr__("missing")
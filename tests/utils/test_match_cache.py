@@ -0,0 +1,106 @@
+"""Testing for the match_cache module."""
+
+from contextlib import closing
+import sqlite3
+
+import pytest
+
+from djtools.utils.match_cache import MatchCache
+
+
+@pytest.fixture(name="match_cache")
+def fixture_match_cache(tmp_path):
+    """Fixture for a match cache."""
+    with closing(MatchCache(tmp_path / "match_cache.db")) as match_cache:
+        yield match_cache
+
+
+def test_matchcache_add(match_cache):
+    """Test for the MatchCache class."""
+    match_cache.add(
+        "context",
+        ["a - x", "b - y"],
+        {"a - x": "A - X!"},
+        [("a - x", "a - x", 100, True), ("a - x", "b - y", 80, False)],
+        0.0,
+    )
+    match_cache.add("other", ["c - z"], {"c - z": "c - z"}, [], 0.0)
+    # Cached queries keep the variant which was scored.
+    match_cache.add("context", [], {"a - x": "a - x"}, [], 1.0)
+    assert match_cache.get_tracks("context") == {"a - x", "b - y"}
+    assert match_cache.get_queries("context") == {"a - x": "A - X!"}
+    assert match_cache.get_matches("context", ["a - x", "missing"]) == {
+        "a - x": [("a - x", 100)],
+        "missing": [],
+    }
+    assert match_cache.get_tracks("other") == {"c - z"}
+
+
+def test_matchcache_get_matches_without_exact_matches(match_cache):
+    """Test for the MatchCache class."""
+    match_cache.add(
+        "context",
+        ["a - x", "b - y"],
+        {"query": "query"},
+        [("query", "b - y", 80, False), ("query", "a - x", 90, False)],
+        0.0,
+    )
+    assert match_cache.get_matches("context", ["query"]) == {
+        "query": [("a - x", 90), ("b - y", 80)]
+    }
+
+
+def test_matchcache_remove_queries(match_cache):
+    """Test for the MatchCache class."""
+    match_cache.add(
+        "context",
+        ["a - x"],
+        {"old": "old", "recent": "recent"},
+        [("old", "a - x", 90, False), ("recent", "a - x", 90, False)],
+        0.0,
+    )
+    match_cache.add("context", [], {"recent": "recent"}, [], 2.0)
+    match_cache.remove_queries("context", 1.0)
+    assert match_cache.get_queries("context") == {"recent": "recent"}
+    assert match_cache.get_matches("context", ["old", "recent"]) == {
+        "old": [],
+        "recent": [("a - x", 90)],
+    }
+
+
+def test_matchcache_remove_tracks(match_cache):
+    """Test for the MatchCache class."""
+    match_cache.add(
+        "context",
+        ["a - x", "b - y", "c - z"],
+        {"exact": "exact", "fuzzy": "fuzzy"},
+        [
+            ("exact", "a - x", 100, True),
+            ("fuzzy", "a - x", 90, False),
+            ("fuzzy", "b - y", 80, False),
+        ],
+        0.0,
+    )
+    match_cache.remove_tracks("context", ["a - x"])
+    assert match_cache.get_tracks("context") == {"b - y", "c - z"}
+    # The exact match wasn't scored against the other tracks.
+    assert match_cache.get_queries("context") == {"fuzzy": "fuzzy"}
+    assert match_cache.get_matches("context", ["exact", "fuzzy"]) == {
+        "exact": [],
+        "fuzzy": [("b - y", 80)],
+    }
+
+
+def test_matchcache_rebuilds_other_schema_versions(tmp_path):
+    """Test for the MatchCache class."""
+    path = tmp_path / "match_cache.db"
+    with closing(sqlite3.connect(path)) as connection:
+        connection.executescript(
+            "CREATE TABLE queries (context TEXT, query TEXT);"
+            "INSERT INTO queries VALUES ('context', 'query');"
+        )
+    with closing(MatchCache(path)) as match_cache:
+        assert not match_cache.get_queries("context")
+        match_cache.add("context", [], {"query": "query"}, [], 0.0)
+    with closing(MatchCache(path)) as match_cache:
+        assert match_cache.get_queries("context") == {"query": "query"}
@@ -13,7 +13,7 @@ from djtools.utils.process_recording import process
     "djtools.utils.process_recording.get_spotify_tracks",
     mock.Mock(return_value={}),
 )
-@mock.patch("djtools.utils.helpers.AudioSegment.export", mock.Mock())
+@mock.patch("pydub.AudioSegment.export", mock.Mock())
 def test_process_handles_missing_or_empty_playlist(config):
     """Test for the process function."""
     config.RECORDING_PLAYLIST = "playlist"
@@ -29,7 +29,7 @@ def test_process_handles_missing_or_empty_playlist(config):
 
 
 @mock.patch("djtools.utils.helpers.os.utime", mock.Mock())
-@mock.patch("djtools.utils.helpers.AudioSegment.export", mock.Mock())
+@mock.patch("pydub.AudioSegment.export", mock.Mock())
 @mock.patch(
     "djtools.utils.process_recording.get_spotify_tracks",
     mock.Mock(
@@ -71,7 +71,7 @@ def test_process_skips_trimming_initial_silence(
     assert mock_trim_initial_silence.call_count == expected
 
 
-@mock.patch("djtools.utils.helpers.AudioSegment.export", mock.Mock())
+@mock.patch("pydub.AudioSegment.export", mock.Mock())
 @mock.patch("djtools.utils.process_recording.get_spotify_tracks")
 @mock.patch("djtools.utils.process_recording.AudioSegment.from_file")
 @mock.patch("djtools.utils.helpers.os.utime", mock.Mock())
@@ -118,8 +118,8 @@ def test_process_warns_when_recording_is_too_short(
     )
 
 
-@mock.patch("djtools.utils.helpers.AudioSegment.export", mock.Mock())
-@mock.patch("djtools.utils.helpers.effects.normalize", mock.Mock())
+@mock.patch("pydub.AudioSegment.export", mock.Mock())
+@mock.patch("pydub.effects.normalize", mock.Mock())
 @mock.patch(
     "djtools.utils.process_recording.get_spotify_tracks",
     mock.Mock(
@@ -162,8 +162,8 @@ def test_process_warns_when_filename_is_malformed(config, tmpdir, caplog):
     )
 
 
-@mock.patch("djtools.utils.helpers.AudioSegment.export")
-@mock.patch("djtools.utils.helpers.effects.normalize")
+@mock.patch("pydub.AudioSegment.export")
+@mock.patch("pydub.effects.normalize")
 @mock.patch("djtools.utils.process_recording.AudioSegment.from_file")
 @mock.patch("djtools.utils.process_recording.get_spotify_tracks")
 def test_process(
@@ -0,0 +1,133 @@
+"""Testing for the run_context module."""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from djtools.utils.run_context import (
+    flush_run_context,
+    get_run_context,
+    run_context,
+    RunContext,
+    shared,
+)
+
+
+def test_runcontext_get():
+    """Test for the RunContext class."""
+    context = RunContext()
+    factory = mock.Mock(side_effect=object)
+    close = mock.Mock()
+    resource = context.get("key", factory, close=close)
+    assert context.get("key", factory, close=close) is resource
+    assert context.lookup("key") is resource
+    assert context.lookup("missing") is None
+    factory.assert_called_once()
+    context.close()
+    close.assert_called_once_with(resource)
+    assert context.lookup("key") is None
+
+
+def test_runcontext_get_creates_resource_once_across_threads():
+    """Test for the RunContext class."""
+    context = RunContext()
+    barrier = threading.Barrier(4, timeout=5)
+    factory = mock.Mock(side_effect=lambda: time.sleep(0.01) or object())
+
+    def get(_):
+        barrier.wait()
+        return context.get("key", factory)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        resources = list(executor.map(get, range(4)))
+    assert all(resource is resources[0] for resource in resources)
+    factory.assert_called_once()
+
+
+def test_runcontext_defer():
+    """Test for the RunContext class."""
+    context = RunContext()
+    replaced, first, second = mock.Mock(), mock.Mock(), mock.Mock()
+    context.defer("first", replaced)
+    context.defer("first", first)
+    context.defer("second", second)
+    context.flush("first")
+    replaced.assert_not_called()
+    first.assert_called_once()
+    second.assert_not_called()
+    context.flush("first")
+    first.assert_called_once()
+    context.flush()
+    second.assert_called_once()
+
+
+def test_runcontext_discard():
+    """Test for the RunContext class."""
+    context = RunContext()
+    deferred = mock.Mock()
+    context.get("key", object)
+    context.defer("key", deferred)
+    context.discard("key")
+    context.flush()
+    assert context.lookup("key") is None
+    deferred.assert_not_called()
+
+
+def test_runcontext_close_closes_resources_if_flush_fails():
+    """Test for the RunContext class."""
+    context = RunContext()
+    close = mock.Mock()
+    context.get("key", object, close=close)
+    context.defer("key", mock.Mock(side_effect=RuntimeError("failed")))
+    with pytest.raises(RuntimeError, match="failed"):
+        context.close()
+    close.assert_called_once()
+
+
+def test_runcontext_close_without_flush():
+    """Test for the RunContext class."""
+    context = RunContext()
+    close, deferred = mock.Mock(), mock.Mock()
+    context.get("key", object, close=close)
+    context.defer("key", deferred)
+    context.close(flush=False)
+    context.flush()
+    deferred.assert_not_called()
+    close.assert_called_once()
+
+
+def test_run_context():
+    """Test for the run_context function."""
+    deferred = mock.Mock()
+    assert get_run_context() is None
+    with run_context() as context:
+        assert get_run_context() is context
+        context.defer("key", deferred)
+        with run_context() as nested_context:
+            assert get_run_context() is nested_context
+        assert get_run_context() is context
+        flush_run_context()
+        deferred.assert_called_once()
+    assert get_run_context() is None
+    flush_run_context()
+
+
+def test_run_context_drops_deferred_work_if_the_run_fails():
+    """Test for the run_context function."""
+    deferred = mock.Mock()
+    with pytest.raises(RuntimeError, match="failed"):
+        with run_context() as context:
+            context.defer("key", deferred)
+            raise RuntimeError("failed")
+    assert get_run_context() is None
+    deferred.assert_not_called()
+
+
+def test_shared():
+    """Test for the shared function."""
+    assert shared("key", object) is not shared("key", object)
+    with run_context():
+        assert shared("key", object) is shared("key", object)
@@ -0,0 +1,158 @@
+"""Testing for the scheduler module."""
+
+import threading
+from unittest import mock
+
+import pytest
+
+from djtools import (
+    COLLECTION_OPERATIONS,
+    SPOTIFY_OPERATIONS,
+    SYNC_OPERATIONS,
+    UTILS_OPERATIONS,
+)
+from djtools.utils.run_context import get_run_context, run_context
+from djtools.utils.scheduler import (
+    conflicts,
+    get_dependencies,
+    run_operations,
+)
+
+
+RESOURCES = {"beatcloud", "collection", "local", "spotify", "usb"}
+
+
+def operation(func=None, reads=(), writes=()):
+    """Makes a mock operation which declares its resources."""
+    mock_operation = mock.Mock(side_effect=func)
+    mock_operation.reads = frozenset(reads)
+    mock_operation.writes = frozenset(writes)
+
+    return mock_operation
+
+
+@pytest.mark.parametrize(
+    "operations",
+    [
+        COLLECTION_OPERATIONS,
+        SPOTIFY_OPERATIONS,
+        SYNC_OPERATIONS,
+        UTILS_OPERATIONS,
+    ],
+)
+def test_operations_declare_resources(operations):
+    """Test that every operation declares the resources it uses."""
+    for func in operations.values():
+        assert func.reads | func.writes
+        assert func.reads | func.writes <= RESOURCES
+
+
+@pytest.mark.parametrize(
+    "reads,writes,other_reads,other_writes,expected",
+    [
+        (("usb",), (), ("usb",), (), False),
+        (("usb",), (), (), ("usb",), True),
+        ((), ("usb",), ("usb",), (), True),
+        ((), ("usb",), (), ("usb",), True),
+        (("usb",), ("usb",), ("spotify",), ("spotify",), False),
+    ],
+)
+def test_conflicts(reads, writes, other_reads, other_writes, expected):
+    """Test for the conflicts function."""
+    assert (
+        conflicts(
+            operation(reads=reads, writes=writes),
+            operation(reads=other_reads, writes=other_writes),
+        )
+        is expected
+    )
+
+
+def test_conflicts_undeclared_resources():
+    """Test for the conflicts function."""
+    assert conflicts(lambda x: None, operation())
+    assert conflicts(operation(), lambda x: None)
+
+
+def test_get_dependencies():
+    """Test for the get_dependencies function."""
+    assert get_dependencies(
+        {
+            "COLLECTION_PLAYLISTS": COLLECTION_OPERATIONS[
+                "COLLECTION_PLAYLISTS"
+            ],
+            "SHUFFLE_PLAYLISTS": COLLECTION_OPERATIONS["SHUFFLE_PLAYLISTS"],
+            "COPY_PLAYLISTS": COLLECTION_OPERATIONS["COPY_PLAYLISTS"],
+            "SPOTIFY_PLAYLISTS": SPOTIFY_OPERATIONS["SPOTIFY_PLAYLISTS"],
+            "DOWNLOAD_MUSIC": SYNC_OPERATIONS["DOWNLOAD_MUSIC"],
+            "UPLOAD_COLLECTION": SYNC_OPERATIONS["UPLOAD_COLLECTION"],
+            "UPLOAD_MUSIC": SYNC_OPERATIONS["UPLOAD_MUSIC"],
+        }
+    ) == {
+        "COLLECTION_PLAYLISTS": set(),
+        "SHUFFLE_PLAYLISTS": {"COLLECTION_PLAYLISTS"},
+        "COPY_PLAYLISTS": {"COLLECTION_PLAYLISTS", "SHUFFLE_PLAYLISTS"},
+        "SPOTIFY_PLAYLISTS": set(),
+        "DOWNLOAD_MUSIC": {"SHUFFLE_PLAYLISTS", "COPY_PLAYLISTS"},
+        "UPLOAD_COLLECTION": {
+            "COLLECTION_PLAYLISTS",
+            "SHUFFLE_PLAYLISTS",
+            "DOWNLOAD_MUSIC",
+        },
+        "UPLOAD_MUSIC": {
+            "SHUFFLE_PLAYLISTS",
+            "COPY_PLAYLISTS",
+            "DOWNLOAD_MUSIC",
+            "UPLOAD_COLLECTION",
+        },
+    }
+
+
+def test_run_operations(config, caplog):
+    """Test for the run_operations function."""
+    caplog.set_level("INFO")
+    # Independent operations wait for each other so they must run
+    # concurrently to finish.
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def record(name, wait=False):
+        def func(_):
+            if wait:
+                barrier.wait()
+            order.append(name)
+
+        return func
+
+    operations = {
+        "first": operation(record("first", wait=True), writes=["usb"]),
+        "second": operation(record("second", wait=True), writes=["spotify"]),
+        "third": operation(record("third"), reads=["usb"]),
+    }
+    with run_context() as context:
+        operations["fourth"] = lambda _: order.append(
+            get_run_context() is context
+        )
+        timings = run_operations(operations, config)
+    assert set(timings) == set(operations)
+    assert order.index("third") > order.index("first")
+    assert order[-1] is True
+    for func in list(operations.values())[:3]:
+        func.assert_called_once_with(config)
+    assert caplog.records[-1].message.startswith("Operation timings: first ")
+
+
+def test_run_operations_handles_failure(config):
+    """Test for the run_operations function."""
+    operations = {
+        "first": operation(RuntimeError("failed"), writes=["usb"]),
+        "second": operation(reads=["usb"]),
+    }
+    with pytest.raises(RuntimeError, match="failed"):
+        run_operations(operations, config)
+    operations["second"].assert_not_called()
+
+
+def test_run_operations_no_operations(config):
+    """Test for the run_operations function."""
+    assert not run_operations({}, config)
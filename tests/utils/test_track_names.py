@@ -0,0 +1,66 @@
+"""Testing for the track_names module."""
+
+import pytest
+
+from djtools.utils.track_names import (
+    normalize_track_name,
+    split_track_name,
+    TRACK_NAME_CACHE_SIZE,
+)
+
+
+@pytest.mark.parametrize(
+    "name,artist_first,expected",
+    [
+        ("title - artist", False, ("title", "artist")),
+        (
+            "multiple - hyphens - artist",
+            False,
+            ("multiple - hyphens", "artist"),
+        ),
+        (
+            "artist - multiple - hyphens",
+            True,
+            ("multiple - hyphens", "artist"),
+        ),
+        ("title", False, ("title", "")),
+        ("title", True, ("title", "")),
+    ],
+)
+def test_split_track_name(name, artist_first, expected):
+    """Test for the split_track_name function."""
+    assert split_track_name(name, artist_first) == expected
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("Title - Artist", "title - artist"),
+        ("Title! - B, A", "title - a, b"),
+        ("Title (feat. B) - A", "title - a, b"),
+        ("Title ft. B - A feat. C", "title - a, b, c"),
+        (
+            "Title [Extended Mix] - A & B x C and D vs. E with F + G",
+            ("title extended mix - a, b, c, d, e, f, g"),
+        ),
+        ("Title - DJ X, Andy", "title - andy, dj x"),
+        ("Title - A, A", "title - a"),
+        ("Title", "title - "),
+    ],
+)
+def test_normalize_track_name(name, expected):
+    """Test for the normalize_track_name function."""
+    assert normalize_track_name(name) == expected
+
+
+def test_normalize_track_name_artist_first():
+    """Test for the normalize_track_name function."""
+    assert normalize_track_name(
+        "B, A - Title (feat. C)", artist_first=True
+    ) == normalize_track_name("Title - A, B, C")
+
+
+@pytest.mark.parametrize("func", [normalize_track_name, split_track_name])
+def test_track_name_caches_are_bounded(func):
+    """Test for the split_track_name and normalize_track_name functions."""
+    assert func.cache_info().maxsize == TRACK_NAME_CACHE_SIZE
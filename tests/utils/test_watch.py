@@ -0,0 +1,143 @@
+"""Testing for the watch module."""
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from djtools.collection.helpers import load_collection
+from djtools.utils.run_context import run_context
+from djtools.utils.watch import get_signatures, watch
+
+
+def test_get_signatures(tmpdir):
+    """Test for the get_signatures function."""
+    path = Path(tmpdir) / "file"
+    missing = Path(tmpdir) / "missing"
+    path.write_text("content", encoding="utf-8")
+    signatures = get_signatures([path, missing])
+    assert signatures[path][1] == len("content")
+    assert signatures[missing] is None
+
+
+@pytest.fixture(name="watched")
+def fixture_watched(config, rekordbox_xml, tmpdir):
+    """Fixture for a collection and config file to watch."""
+    config.COLLECTION_PATH = Path(tmpdir) / "rekordbox.xml"
+    config.COLLECTION_PATH.write_bytes(rekordbox_xml.read_bytes())
+    config_file = Path(tmpdir) / "config.yaml"
+    config_file.write_text("", encoding="utf-8")
+    with mock.patch(
+        "djtools.utils.watch.get_config_sources",
+        return_value=[config_file],
+    ):
+        yield config.COLLECTION_PATH, config_file
+
+
+def make_sleep(*events):
+    """Makes a sleep which handles an event on each call and raises a
+    KeyboardInterrupt once they're exhausted."""
+    events = list(events)
+
+    def sleep(_):
+        if not events:
+            raise KeyboardInterrupt
+        event = events.pop(0)
+        if event:
+            event()
+
+    return sleep
+
+
+@mock.patch("djtools.utils.watch.build_config")
+@mock.patch("djtools.utils.watch.run_operations")
+def test_watch(
+    mock_run_operations, mock_build_config, config, watched, caplog
+):
+    """Test for the watch function."""
+    caplog.set_level("INFO")
+    collection_path, config_file = watched
+    config.COLLECTION_PLAYLISTS = True
+    mock_build_config.return_value = config
+
+    def append(path, content):
+        with open(path, mode="a", encoding="utf-8") as _file:
+            _file.write(content)
+
+    sleep = make_sleep(
+        # The collection is still being written on the first poll.
+        lambda: append(collection_path, "\n"),
+        lambda: append(collection_path, "\n"),
+        None,
+        lambda: append(config_file, "configs: {}\n"),
+        None,
+        None,
+    )
+    with run_context(), mock.patch("djtools.utils.watch.time.sleep", sleep):
+        collection = load_collection(config)
+        watch(config)
+        assert load_collection(config) is not collection
+    assert mock_run_operations.call_count == 2
+    operations = mock_run_operations.call_args.args[0]
+    assert list(operations) == ["COLLECTION_PLAYLISTS"]
+    mock_build_config.assert_called_once_with(cli=True)
+    messages = [record.message for record in caplog.records]
+    assert messages[0] == "Watching 2 files for changes; press Ctrl+C to stop"
+    assert f"Changed: {collection_path}" in messages
+    assert f"Changed: {config_file}" in messages
+    assert messages[-1] == "Stopped watching"
+
+
+@mock.patch(
+    "djtools.utils.watch.run_operations",
+    mock.Mock(side_effect=RuntimeError("failed")),
+)
+def test_watch_handles_failure(config, watched, caplog):
+    """Test for the watch function."""
+    caplog.set_level("ERROR")
+    collection_path, _ = watched
+    sleep = make_sleep(
+        lambda: collection_path.write_text("", encoding="utf-8"), None
+    )
+    with mock.patch("djtools.utils.watch.time.sleep", sleep):
+        watch(config)
+    assert caplog.records[0].message == (
+        "Failed to run the collection operations: failed"
+    )
+
+
+@mock.patch(
+    "djtools.utils.watch.build_config",
+    mock.Mock(side_effect=RuntimeError("invalid")),
+)
+@mock.patch("djtools.utils.watch.run_operations")
+def test_watch_keeps_config_on_failure_to_build_it(
+    mock_run_operations, config, watched, caplog
+):
+    """Test for the watch function."""
+    caplog.set_level("INFO")
+    collection_path, config_file = watched
+    config.COLLECTION_PLAYLISTS = True
+    sleep = make_sleep(
+        lambda: config_file.write_text("configs: [\n", encoding="utf-8"),
+        None,
+        None,
+        lambda: (
+            config_file.write_text("configs: {}\n", encoding="utf-8"),
+            collection_path.write_text("", encoding="utf-8"),
+        ),
+        None,
+    )
+    with mock.patch("djtools.utils.watch.time.sleep", sleep):
+        watch(config)
+    messages = [record.message for record in caplog.records]
+    assert (
+        messages.count(
+            "Failed to build the configuration; keeping the previous one: invalid"
+        )
+        == 2
+    )
+    # Only the change to the collection is run, with the previous config.
+    mock_run_operations.assert_called_once()
+    assert mock_run_operations.call_args.args[1] is config
+    assert messages[-1] == "Stopped watching"